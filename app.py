@@ -1,21 +1,27 @@
-import json
 import os
+import hashlib
 from datetime import datetime, date
 import base64
-from PIL import Image, ExifTags
 import random
-import io
-import cloudinary
-import cloudinary.uploader
 import streamlit as st
-
-# Configure Cloudinary (using secrets)
-cloudinary.config(
-    cloud_name=st.secrets["CLOUDINARY_CLOUD_NAME"],
-    api_key=st.secrets["CLOUDINARY_API_KEY"],
-    api_secret=st.secrets["CLOUDINARY_API_SECRET"],
-    secure=True
+from repository import (
+    load_collection, save_collection, query_collection, count_collection, collection_exists,
+    add_record, add_records, delete_records, update_records, assign_missing_ids, cache_stats
+)
+from blob_store import get_blob, delete_blob, migrate_base64_photos
+from image_pipeline import (
+    VARIANT_SIZES, OUTPUT_FORMAT, BYTE_BUDGET, pick_variant, backfill_variants, process_uploads,
+    available_formats
 )
+from search_index import search as search_memories, highlight
+from duplicates import match as match_duplicate, compare as compare_hashes
+from date_index import in_range, month_buckets, year_buckets, on_this_day
+from memory_index import random_entry, all_entries, fetch as fetch_memory, contains as index_contains
+from perf import span, timed, stats as perf_stats, reset as reset_perf_stats
+import memprof
+from video_uploads import start_upload, resume_upload, get_job, forget_job
+import media_store
+from media_store import poster_url, delete_media
 
 # Configure page
 st.set_page_config(
@@ -25,327 +31,291 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
+# Theme stylesheet, served by Streamlit's static file server (see .streamlit/config.toml)
+THEME_CSS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "theme.css")
+GOOGLE_FONTS_IMPORT = ("@import url('https://fonts.googleapis.com/css2?family=Dancing+Script:wght@400;700"
+                       "&family=Poppins:wght@300;400;600&display=swap');")
+
+@st.cache_resource
+def theme_css():
+    """Read the stylesheet once per process; returns (css text, short content hash)"""
+    with open(THEME_CSS_PATH, encoding="utf-8") as f:
+        css = f.read()
+    return css, hashlib.sha256(css.encode("utf-8")).hexdigest()[:12]
+
 # Custom CSS for romantic theme (strengthened rules for text boxes)
 def load_css():
-    st.markdown("""
-    <style>
-    @import url('https://fonts.googleapis.com/css2?family=Dancing+Script:wght@400;700&family=Poppins:wght@300;400;600&display=swap');
-    
-    /* Main background and theme */
-    .stApp {
-        background: #ffc0d4 !important;
-        background-attachment: fixed;
-    }
-    
-    /* Floating hearts animation */
-    .hearts {
-        position: fixed;
-        top: 0;
-        left: 0;
-        width: 100%;
-        height: 100%;
-        pointer-events: none;
-        z-index: -1;
-    }
-    
-    .heart {
-        position: absolute;
-        color: #d63384;
-        font-size: 20px;
-        animation: float 8s infinite ease-in-out;
-    }
-    
-    @keyframes float {
-        0%, 100% { transform: translateY(100vh) rotate(0deg); opacity: 0; }
-        10%, 90% { opacity: 1; }
-        50% { transform: translateY(-10vh) rotate(180deg); }
-    }
-    
-    /* Title styling */
-    .main-title {
-        font-family: 'Dancing Script', cursive;
-        font-size: 3.5em;
-        color: #000000 !important;
-        text-align: center;
-        margin-bottom: 30px;
-        text-shadow: 2px 2px 4px rgba(0, 0, 0, 0.1);
-        font-weight: 700;
-    }
-    
-    .section-title {
-        font-family: 'Dancing Script', cursive;
-        font-size: 2.5em;
-        color: #000000 !important;
-        text-align: center;
-        margin: 30px 0 20px 0;
-        font-weight: 700;
-    }
-    
-    /* Card styling */
-    .memory-card {
-        background: rgba(255, 255, 255, 0.95) !important;
-        border-radius: 20px;
-        padding: 25px;
-        margin: 20px 0;
-        box-shadow: 0 8px 32px rgba(0, 0, 0, 0.1);
-        border: 2px solid rgba(214, 51, 132, 0.3);
-        backdrop-filter: blur(10px);
-    }
-    
-    .photo-card {
-        background: rgba(255, 255, 255, 0.98) !important;
-        border-radius: 15px;
-        padding: 15px;
-        margin: 15px;
-        box-shadow: 0 6px 20px rgba(0, 0, 0, 0.1);
-        border: 1px solid rgba(214, 51, 132, 0.2);
-        transition: transform 0.3s ease;
-    }
-    
-    /* Photo grid styling */
-    .photo-container {
-        width: 100%;
-        height: 300px;
-        object-fit: cover;
-        border-radius: 15px;
-        box-shadow: 0 4px 15px rgba(0, 0, 0, 0.1);
-    }
-    
-    .photo-grid {
-        display: grid;
-        grid-template-columns: repeat(auto-fit, minmax(300px, 1fr));
-        gap: 20px;
-        padding: 20px 0;
-    }
-    
-    .photo-item {
-        background: rgba(255, 255, 255, 0.98);
-        border-radius: 15px;
-        padding: 15px;
-        box-shadow: 0 6px 20px rgba(0, 0, 0, 0.1);
-        border: 1px solid rgba(214, 51, 132, 0.2);
-        transition: transform 0.3s ease;
-    }
-    
-    .photo-item:hover {
-        transform: translateY(-5px);
-        box-shadow: 0 10px 30px rgba(214, 51, 132, 0.2);
-    }
-    
-    /* Button styling */
-    .stButton > button {
-        background: linear-gradient(45deg, #ff6b9d, #ffa8cc);
-        color: white;
-        border: none;
-        border-radius: 25px;
-        padding: 10px 30px;
-        font-weight: 600;
-        transition: all 0.3s ease;
-        box-shadow: 0 4px 15px rgba(255, 107, 157, 0.3);
-    }
-    
-    .stButton > button:hover {
-        transform: translateY(-2px);
-        box-shadow: 0 6px 20px rgba(255, 107, 157, 0.4);
-    }
-    
-    /* Input styling (strengthened for white bg, black text) */
-    .stTextInput > div > div > input {
-        border-radius: 15px !important;
-        border: 2px solid #ffb3d1 !important;
-        background-color: #ffffff !important;
-        color: #000000 !important;
-    }
-    
-    .stTextArea > div > div > textarea {
-        border-radius: 15px !important;
-        border: 2px solid #ffb3d1 !important;
-        background-color: #ffffff !important;
-        color: #000000 !important;
-    }
-    
-    /* Date input styling */
-    .stDateInput > div > div > input {
-        background-color: #ffffff !important;
-        color: #000000 !important;
-        border: 2px solid #ffb3d1 !important;
-        border-radius: 15px !important;
-    }
-    
-    /* Selectbox styling (strengthened) */
-    .stSelectbox > div > div > select {
-        background-color: #ffffff !important;
-        color: #000000 !important;
-        border: 2px solid #ffb3d1 !important;
-        border-radius: 15px !important;
-    }
-    
-    /* Date styling */
-    .memory-date {
-        color: #d63384 !important;
-        font-style: italic;
-        font-size: 0.9em;
-        margin-bottom: 10px;
-        font-weight: 600;
-    }
-    
-    /* Success messages */
-    .success-message {
-        background: linear-gradient(45deg, #4ecdc4, #44a08d);
-        color: white !important;
-        padding: 15px;
-        border-radius: 15px;
-        text-align: center;
-        margin: 20px 0;
-        font-weight: 600;
-    }
-    
-    /* General text styling (force black text) */
-    .stApp, .stApp * {
-        color: #000000 !important;
-    }
-    
-    /* Make sure all text is black */
-    p, h1, h2, h3, h4, h5, h6, span, div, label {
-        color: #000000 !important;
-    }
-    
-    /* Tab text styling */
-    .stTabs [data-baseweb="tab"] {
-        color: #000000 !important;
-        font-weight: 600;
-    }
-    
-    /* Selected tab */
-    .stTabs [aria-selected="true"] {
-        color: #d63384 !important;
-    }
-    
-    /* Sidebar styling */
-    .css-1d391kg {
-        background: linear-gradient(180deg, #ffeef7, #f8e8ff);
-    }
-    
-    /* Hide Streamlit branding */
-    #MainMenu {visibility: hidden;}
-    footer {visibility: hidden;}
-    header {visibility: hidden;}
-    
-    /* Upload progress styling */
-    .upload-progress {
-        background: rgba(255, 255, 255, 0.9);
-        border-radius: 10px;
-        padding: 15px;
-        margin: 10px 0;
-        border: 1px solid #ffb3d1;
-    }
-    </style>
-    """, unsafe_allow_html=True)
+    """Link the static theme stylesheet.
 
-def add_floating_hearts():
-    hearts_html = """
-    <div class="hearts">
-        <div class="heart" style="left: 10%; animation-delay: 0s;">💖</div>
-        <div class="heart" style="left: 20%; animation-delay: 1s;">💕</div>
-        <div class="heart" style="left: 30%; animation-delay: 2s;">💗</div>
-        <div class="heart" style="left: 40%; animation-delay: 3s;">💝</div>
-        <div class="heart" style="left: 50%; animation-delay: 4s;">💖</div>
-        <div class="heart" style="left: 60%; animation-delay: 5s;">💕</div>
-        <div class="heart" style="left: 70%; animation-delay: 6s;">💗</div>
-        <div class="heart" style="left: 80%; animation-delay: 7s;">💝</div>
-        <div class="heart" style="left: 90%; animation-delay: 0.5s;">💖</div>
-    </div>
+    Streamlit drops any element a rerun doesn't emit, so a tag goes out every
+    rerun. It is a short <link> whose content-hashed URL the browser fetches
+    once and then keeps cached, instead of the whole stylesheet. Without static
+    serving, fall back to inlining the CSS with Google-hosted fonts.
     """
-    st.markdown(hearts_html, unsafe_allow_html=True)
+    css, version = theme_css()
+    if st.get_option("server.enableStaticServing"):
+        st.markdown(f'<link rel="stylesheet" href="app/static/theme.css?v={version}">',
+                    unsafe_allow_html=True)
+    else:
+        st.markdown(f"<style>\n{GOOGLE_FONTS_IMPORT}\n{css}</style>", unsafe_allow_html=True)
+
+def add_floating_hearts():
+    # Positions and delays live in theme.css (.heart:nth-child)
+    hearts = "".join(f'<div class="heart">{heart}</div>' for heart in "💖💕💗💝💖💕💗💝💖")
+    st.markdown(f'<div class="hearts">{hearts}</div>', unsafe_allow_html=True)
 
 # Initialize data directories
 def init_directories():
     os.makedirs("data", exist_ok=True)
 
-# Base64 image encoding/decoding functions (for photos only)
-def encode_image_to_base64(image_file):
-    """Convert uploaded image to base64 string"""
-    try:
-        # Read the image
-        image = Image.open(image_file)
-        
-        # Handle EXIF orientation
-        try:
-            exif = image._getexif()
-            if exif is not None:
-                orientation = exif.get(ExifTags.TAGS.get('Orientation', None))
-                if orientation == 3:
-                    image = image.rotate(180, expand=True)
-                elif orientation == 6:
-                    image = image.rotate(270, expand=True)
-                elif orientation == 8:
-                    image = image.rotate(90, expand=True)
-        except:
-            pass
-        
-        # Convert to RGB if necessary
-        if image.mode in ('RGBA', 'LA', 'P'):
-            image = image.convert('RGB')
-        
-        # Resize image for storage efficiency (max 800px on longest side)
-        max_size = 800
-        if max(image.size) > max_size:
-            ratio = max_size / max(image.size)
-            new_size = tuple([int(x * ratio) for x in image.size])
-            image = image.resize(new_size, Image.Resampling.LANCZOS)
-        
-        # Save to bytes
-        img_buffer = io.BytesIO()
-        image.save(img_buffer, format='JPEG', quality=85, optimize=True)
-        img_bytes = img_buffer.getvalue()
-        
-        # Encode to base64
-        base64_string = base64.b64encode(img_bytes).decode('utf-8')
-        return base64_string, image.size
-        
-    except Exception as e:
-        st.error(f"Error processing image: {str(e)}")
-        return None, None
+FORMAT_LABELS = {
+    "jpeg": "JPEG",
+    "progressive-jpeg": "Progressive JPEG",
+    "webp": "WebP",
+    "avif": "AVIF",
+}
 
-def decode_base64_to_image(base64_string):
-    """Convert base64 string back to PIL Image"""
-    try:
-        img_bytes = base64.b64decode(base64_string)
-        image = Image.open(io.BytesIO(img_bytes))
-        return image
-    except Exception as e:
-        st.error(f"Error decoding image: {str(e)}")
+# Upload option -> duplicate kinds that are skipped rather than saved
+DUPLICATE_POLICIES = {
+    "Skip exact and near duplicates": ("exact", "near"),
+    "Skip exact duplicates only": ("exact",),
+    "Save everything (just warn)": (),
+}
+
+def find_duplicate(hashes, batch):
+    """(kind, description) of the closest stored or earlier-in-batch match, or None.
+
+    `batch` holds (name, hashes) for files already accepted from this upload.
+    """
+    for name, other in batch:
+        found = compare_hashes(hashes, other)
+        if found:
+            return found[0], f"'{name}' in this upload"
+    found = match_duplicate(hashes)
+    if found is None:
         return None
+    kind, photo_id, bits = found
+    photo = fetch_memory(("photo", photo_id)) or {}
+    return kind, f"'{photo.get('original_name', photo_id)}' ({photo.get('date', 'no date')})"
+
+@memprof.profiled("upload:photos")
+def save_uploaded_photos(uploaded_files, photo_date, caption, skip_kinds=("exact", "near"),
+                         output_format=None, budget=None):
+    """Encode a batch of uploads in parallel and commit them in one write.
+
+    Byte-identical re-uploads are checked before decoding, and the encoded
+    renditions' hashes afterwards; duplicates of a kind in `skip_kinds` are
+    not saved. `output_format` and `budget` (bytes for the full rendition)
+    override the server defaults. Shows per-file progress; returns (saved
+    count, [(name, error), ...], [(name, kind, matched memory, skipped), ...]).
+    """
+    progress = st.progress(0.0, text=f"📤 Processing {len(uploaded_files)} photo(s)... Please wait! ✨")
+    status = st.empty()
+    duplicates = []
+    batch = []
+    items = []
+    for uploaded_file in uploaded_files:
+        hashes = {"source_sha256": hashlib.sha256(uploaded_file.getvalue()).hexdigest()}
+        found = find_duplicate(hashes, batch) if "exact" in skip_kinds else None
+        if found:
+            duplicates.append((uploaded_file.name, found[0], found[1], True))
+            continue
+        batch.append((uploaded_file.name, hashes))
+        items.append((uploaded_file, hashes))
+    results = [None] * len(items)
+    finished = []
+    for position, result in process_uploads([(uploaded_file.name, uploaded_file) for uploaded_file, _ in items],
+                                            output_format, budget):
+        results[position] = result
+        if "memory" in result:
+            memprof.record(f"decode:{result['name']}", result["memory"]["peak_bytes"])
+        finished.append(("❌ " if "error" in result else "✅ ") + result["name"])
+        progress.progress(len(finished) / len(items),
+                          text=f"📤 Processed {len(finished)} of {len(items)} photo(s)")
+        status.caption(" · ".join(finished[-5:]))
+    
+    records = []
+    failed = []
+    batch = []
+    for (uploaded_file, hashes), result in zip(items, results):
+        if "error" in result:
+            failed.append((result["name"], result["error"]))
+            continue
+        hashes.update(result["hashes"])
+        found = find_duplicate(hashes, batch)
+        if found:
+            skipped = found[0] in skip_kinds
+            duplicates.append((uploaded_file.name, found[0], found[1], skipped))
+            if skipped:
+                # Its renditions are already stored, but another session may
+                # be about to add a photo with the same content, so they are
+                # left for `python manage.py gc-blobs` to remove
+                continue
+        batch.append((uploaded_file.name, hashes))
+        records.append({
+            "original_name": uploaded_file.name,
+            "date": photo_date.strftime("%Y-%m-%d"),
+            "caption": caption,
+            "upload_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "file_size": uploaded_file.size,
+            "processed_size": result["size"],
+            "blob": result["variants"]['full']['blob'],
+            "blob_size": result["variants"]['full']['bytes'],
+            "variants": result["variants"],
+            "storage_type": "blob",
+            **hashes,
+        })
+    if records:
+        add_records("photos.json", records)
+    memory = [result["memory"] for result in results if "memory" in result]
+    if memory:
+        st.session_state.last_upload_memory = {
+            "files": len(memory),
+            "peak_bytes": max((report["peak_bytes"] or 0) for report in memory),
+            "largest_decode": max(memory, key=lambda report: report["decoded_size"][0] * report["decoded_size"][1])["decoded_size"],
+            "waited_seconds": sum(report["waited_seconds"] for report in memory),
+        }
+    progress.empty()
+    status.empty()
+    return len(records), failed, duplicates
+
+# Formats st.image forwards byte-for-byte (it only reads the header to check
+# the size); anything else is embedded directly as a data URI
+PASSTHROUGH_FORMATS = {"image/jpeg": "JPEG", "image/png": "PNG"}
+
+def stored_photo_variant(photo, width):
+    """Return (encoded bytes, variant metadata) for the smallest variant that fits `width`"""
+    if photo.get('blob'):
+        variant = pick_variant(photo, width)
+        return get_blob(variant['blob']), variant
+    # Legacy inline photo that hasn't been migrated yet
+    return base64.b64decode(photo['base64_data']), {"size": photo.get('processed_size')}
+
+@timed("photo:deliver")
+def show_stored_photo(photo, width, caption=None, fill=False):
+    """Send a stored photo's already-encoded bytes straight to the browser.
+
+    No PIL decode or re-encode happens here: the MIME type and dimensions come
+    from the variant metadata written at upload time. Returns False if the
+    photo's bytes are missing.
+    """
+    img_bytes, variant = stored_photo_variant(photo, width)
+    if img_bytes is None:
+        return False
+    mime = variant.get('mime', 'image/jpeg')
+    display_width = (variant.get('size') or [width])[0]
+    if mime in PASSTHROUGH_FORMATS:
+        if fill:
+            st.image(img_bytes, caption=caption, output_format=PASSTHROUGH_FORMATS[mime], use_container_width=True)
+        else:
+            st.image(img_bytes, caption=caption, output_format=PASSTHROUGH_FORMATS[mime], width=display_width)
+    else:
+        data_uri = f"data:{mime};base64,{base64.b64encode(img_bytes).decode('ascii')}"
+        style = "width: 100%;" if fill else f"max-width: 100%; width: {display_width}px;"
+        st.markdown(f'<img src="{data_uri}" style="{style} border-radius: 10px;">', unsafe_allow_html=True)
+        if caption:
+            st.caption(caption)
+    return True
 
-# Cloudinary video upload function
-def upload_video_to_cloudinary(video_file):
+def has_stored_image(photo):
+    return bool(photo.get('blob') or photo.get('base64_data'))
+
+def photo_blob_refs(photo):
+    refs = {v['blob'] for v in photo.get('variants', {}).values()}
+    if photo.get('blob'):
+        refs.add(photo['blob'])
+    return refs
+
+# Move inline base64 photos into the blob store and generate missing
+# renditions (runs once per server process)
+@st.cache_resource
+def migrate_legacy_photos():
+    # Copy the records: cached ones are shared and must not be mutated
+    photos = [dict(photo) for photo in load_json("photos.json")]
+    changed = migrate_base64_photos(photos) + backfill_variants(photos)
+    if changed:
+        save_json("photos.json", photos)
+    return changed
+
+# Give records saved before ids were allocated centrally (which could share
+# an id after a delete) ids of their own, so they can be edited and deleted
+# by id (runs once per server process)
+@st.cache_resource
+def migrate_record_ids():
+    return sum(assign_missing_ids(filename) for filename in ("photos.json", "videos.json", "letters.json"))
+
+# Set up the video storage backend from the secrets (runs once per server
+# process; the local backend starts its media server here)
+@st.cache_resource
+def configure_media():
     try:
-        # Upload to Cloudinary as video
-        response = cloudinary.uploader.upload(
-            video_file,
-            resource_type="video",
-            folder="memory_locker_videos"  # Optional folder
-        )
-        return response['secure_url']
+        settings = st.secrets.to_dict()
+    except FileNotFoundError:
+        settings = {}  # no secrets.toml: fine for the local backend
+    media_store.configure(settings)
+    return media_store.BACKEND_NAME
+
+# Video upload function (chunked, runs on a background worker)
+def upload_video(video_file, record):
+    """Queue a video upload; the videos.json entry is written when it finishes"""
+    try:
+        job_id = start_upload(video_file, record)
+        st.session_state.video_jobs.append(job_id)
+        return job_id
     except Exception as e:
-        st.error(f"Error uploading video to Cloudinary: {str(e)}")
+        st.error(f"Error uploading video to {media_store.backend.LABEL}: {str(e)}")
         return None
 
-# Load or create JSON files
+def dismiss_video_job(job_id):
+    forget_job(job_id)
+    st.session_state.video_jobs.remove(job_id)
+
+def show_video_upload_jobs():
+    """Live progress for this session's background video uploads"""
+    def uploading(jobs):
+        return any(job['status'] in ('queued', 'uploading') for job in jobs)
+    
+    jobs = [job for job in map(get_job, st.session_state.video_jobs) if job]
+    if not jobs:
+        return
+    active = uploading(jobs)
+    
+    # Poll once a second while something is uploading, without rerunning the whole page
+    @st.fragment(run_every=1 if active else None)
+    def upload_panel():
+        st.markdown("### Uploads")
+        jobs = [job for job in map(get_job, st.session_state.video_jobs) if job]
+        for job in jobs:
+            percent = job['sent'] / job['total'] if job['total'] else 0.0
+            size_mb = f"{job['sent'] / 1e6:.1f} / {job['total'] / 1e6:.1f} MB"
+            col1, col2 = st.columns([4, 1])
+            with col1:
+                if job['status'] == 'done':
+                    st.progress(1.0, text=f"✅ {job['name']} saved to {media_store.backend.LABEL}! 💕")
+                elif job['status'] == 'failed':
+                    st.progress(percent, text=f"❌ {job['name']} failed at {size_mb}: {job['error']}")
+                else:
+                    st.progress(percent, text=f"📤 {job['name']} — {size_mb}")
+            with col2:
+                if job['status'] == 'failed':
+                    if st.button("🔁 Resume", key=f"resume_{job['id']}"):
+                        resume_upload(job['id'])
+                        st.rerun()  # full rerun restarts the progress polling
+                if job['status'] in ('done', 'failed'):
+                    st.button("Dismiss", key=f"dismiss_{job['id']}", on_click=dismiss_video_job, args=(job['id'],))
+        if active and not uploading(jobs):
+            # Refresh the whole page so Manage Content shows the new video and polling stops
+            st.rerun()
+    
+    upload_panel()
+
+# Load or create JSON files (parsed collections are cached process-wide,
+# see repository.py; returned records must not be mutated in place)
 def load_json(filename):
-    filepath = f"data/{filename}"
-    if os.path.exists(filepath):
-        try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except (json.JSONDecodeError, FileNotFoundError):
-            return []
-    return []
+    return load_collection(filename)
 
 def save_json(filename, data):
-    filepath = f"data/{filename}"
-    with open(filepath, 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=2, ensure_ascii=False, default=str)
+    save_collection(filename, data)
 
 # Initialize session state
 def init_session_state():
@@ -355,18 +325,29 @@ def init_session_state():
         st.session_state.user_type = None
     if 'show_surprise' not in st.session_state:
         st.session_state.show_surprise = False
+    if 'video_jobs' not in st.session_state:
+        st.session_state.video_jobs = []
+    # Photo gallery cursor: current page, or how many photos "Load more" has revealed
+    if 'photo_page' not in st.session_state:
+        st.session_state.photo_page = 0
+    if 'photo_page_size' not in st.session_state:
+        st.session_state.photo_page_size = PHOTO_PAGE_SIZES[1]
+    if 'photos_loaded' not in st.session_state:
+        st.session_state.photos_loaded = st.session_state.photo_page_size
 
 # Create sample data
 def create_sample_data():
     # Sample letters (photos and videos will be empty initially)
     sample_letters = [
         {
+            "id": 1,
             "date": "2023-01-01",
             "title": "New Year, New Us",
             "content": "As we step into this new year together, I can't help but feel overwhelmed with gratitude for having you in my life. Every moment with you feels like a beautiful dream that I never want to wake up from. Your smile lights up my entire world, and your laughter is the sweetest melody I've ever heard. Here's to creating countless more memories together! 💕",
             "created_date": "2024-01-02"
         },
         {
+            "id": 2,
             "date": "2023-06-15",
             "title": "Six Months of Magic",
             "content": "It's been six incredible months since you walked into my life and changed everything. You've shown me what true love feels like, and every day with you is an adventure I treasure. From our silly inside jokes to our deep midnight conversations, every moment has been perfect because it's been with you. I love you more than words can express! 🌟💖",
@@ -374,19 +355,19 @@ def create_sample_data():
         }
     ]
     
-    # Save sample data if files don't exist
-    if not os.path.exists("data/photos.json"):
+    # Save sample data if collections don't exist
+    if not collection_exists("photos.json"):
         save_json("photos.json", [])  # Start with empty photos
-    if not os.path.exists("data/videos.json"):
+    if not collection_exists("videos.json"):
         save_json("videos.json", [])  # Start with empty videos
-    if not os.path.exists("data/letters.json"):
+    if not collection_exists("letters.json"):
         save_json("letters.json", sample_letters)
 
 # Login functions
 def login_page():
     st.markdown('<h1 class="main-title">Our Memory Locker 💝</h1>', unsafe_allow_html=True)
     
-    st.markdown("""
+    st.markdown(f"""
     <div class="memory-card">
         <h3 style="text-align: center; color: #d63384; font-family: 'Dancing Script', cursive; font-size: 1.8em;">
             Welcome to Our Special Place 💕
@@ -395,7 +376,7 @@ def login_page():
             A treasure trove of our beautiful memories together
         </p>
         <p style="text-align: center; color: #888; font-size: 0.9em;">
-            ✨ Now with permanent photo storage and Cloudinary for videos! ✨
+            ✨ Now with permanent photo storage and {media_store.backend.LABEL} for videos! ✨
         </p>
     </div>
     """, unsafe_allow_html=True)
@@ -442,73 +423,60 @@ def admin_mode():
     st.markdown("---")
     
     # Navigation (added Videos tab)
-    tab1, tab2, tab3, tab4 = st.tabs(["📷 Add Photos", "🎥 Add Videos", "💌 Write Letters", "🗑️ Manage Content"])
+    tab1, tab2, tab3, tab4, tab5 = st.tabs(["📷 Add Photos", "🎥 Add Videos", "💌 Write Letters", "🗑️ Manage Content", "📈 Performance"])
     
     with tab1:
-        st.markdown('<h2 class="section-title">Add New Photo</h2>', unsafe_allow_html=True)
+        st.markdown('<h2 class="section-title">Add New Photos</h2>', unsafe_allow_html=True)
         
         # Info about storage
-        st.info("📸 Photos are stored permanently using Base64 encoding! 🎉")
+        st.info("📸 Photos are stored permanently in the blob store! Pick one photo or a whole album. 🎉")
         
-        uploaded_file = st.file_uploader("Choose a photo", type=['png', 'jpg', 'jpeg'])
+        uploaded_files = st.file_uploader("Choose photos", type=['png', 'jpg', 'jpeg'], accept_multiple_files=True)
         photo_date = st.date_input("Photo Date", value=date.today())
-        caption = st.text_area("Caption for this photo", placeholder="Describe this beautiful memory...")
+        caption = st.text_area("Caption for these photos", placeholder="Describe this beautiful memory...")
+        policy = st.radio("Photos already in the locker", list(DUPLICATE_POLICIES), key="duplicate_policy")
+        with st.expander("⚙️ Encoding"):
+            formats = available_formats()
+            output_format = st.selectbox("Output format", formats, key="photo_format",
+                                         index=formats.index(OUTPUT_FORMAT) if OUTPUT_FORMAT in formats else 0,
+                                         format_func=lambda name: FORMAT_LABELS.get(name, name))
+            budget_kb = st.number_input("Target size per photo (KB, 0 = fixed quality)", min_value=0, step=10,
+                                        value=BYTE_BUDGET // 1024, key="photo_budget_kb")
         
-        if st.button("Save Photo", key="save_photo"):
-            if uploaded_file and caption:
+        if st.button("Save Photos", key="save_photo"):
+            if uploaded_files and caption:
                 try:
-                    # Show progress
-                    progress_placeholder = st.empty()
-                    progress_placeholder.markdown("""
-                    <div class="upload-progress">
-                        <p>📤 Processing photo... Please wait! ✨</p>
-                        <p style="font-size: 0.9em; color: #666;">Converting to permanent storage format...</p>
-                    </div>
-                    """, unsafe_allow_html=True)
-                    
-                    # Encode image to base64
-                    base64_data, image_size = encode_image_to_base64(uploaded_file)
-                    
-                    if base64_data:
-                        # Save metadata with base64 data
-                        photos = load_json("photos.json")
-                        photos.append({
-                            "id": len(photos) + 1,
-                            "original_name": uploaded_file.name,
-                            "date": photo_date.strftime("%Y-%m-%d"),
-                            "caption": caption,
-                            "upload_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                            "file_size": uploaded_file.size,
-                            "processed_size": image_size,
-                            "base64_data": base64_data,
-                            "storage_type": "base64"
-                        })
-                        save_json("photos.json", photos)
-                        
-                        progress_placeholder.empty()
-                        st.success(f"📸 Photo '{uploaded_file.name}' saved permanently! 💕")
-                        
-                        # Show preview
-                        st.markdown("### Preview:")
-                        preview_image = decode_base64_to_image(base64_data)
-                        if preview_image:
-                            st.image(preview_image, caption=caption, width=300)
-                        
+                    saved, failed, duplicates = save_uploaded_photos(
+                        uploaded_files, photo_date, caption, DUPLICATE_POLICIES[policy],
+                        output_format, budget_kb * 1024)
+                    for name, error in failed:
+                        st.error(f"❌ Failed to process '{name}': {error}")
+                    for name, kind, existing, skipped in duplicates:
+                        what = "an exact copy" if kind == "exact" else "a near-duplicate"
+                        st.warning(f"⚠️ '{name}' is {what} of {existing} — "
+                                   + ("skipped." if skipped else "saved anyway."))
+                    if saved:
+                        st.success(f"📸 {saved} photo(s) saved permanently! 💕")
+                    if not failed and not duplicates:
                         st.rerun()
-                    else:
-                        progress_placeholder.empty()
-                        st.error("❌ Failed to process photo!")
                         
                 except Exception as e:
-                    st.error(f"❌ Error saving photo: {str(e)}")
+                    st.error(f"❌ Error saving photos: {str(e)}")
             else:
-                st.error("Please select a photo and add a caption!")
+                st.error("Please select at least one photo and add a caption!")
+        
+        last = st.session_state.get("last_upload_memory")
+        if last:
+            width, height = last["largest_decode"]
+            st.caption(f"🧠 Last upload: {last['files']} photo(s), peak decode memory "
+                       f"{format_mb(last['peak_bytes'])} MB per photo, largest decode {width}×{height}"
+                       + (f", waited {last['waited_seconds']:.1f}s for memory" if last['waited_seconds'] >= 0.1 else ""))
     
     with tab2:
         st.markdown('<h2 class="section-title">Add New Video</h2>', unsafe_allow_html=True)
         
         # Info about storage
-        st.info("🎥 Videos are stored on Cloudinary for reliable streaming! (Hybrid storage) 🚀")
+        st.info(f"🎥 Videos are stored on {media_store.backend.LABEL} for reliable streaming! (Hybrid storage) 🚀")
         
         uploaded_file = st.file_uploader("Choose a video", type=['mp4', 'mov', 'avi'])
         video_date = st.date_input("Video Date", value=date.today(), key="video_date")
@@ -516,51 +484,21 @@ def admin_mode():
         
         if st.button("Save Video", key="save_video"):
             if uploaded_file and caption:
-                try:
-                    # Show progress
-                    progress_placeholder = st.empty()
-                    progress_placeholder.markdown("""
-                    <div class="upload-progress">
-                        <p>📤 Uploading video to Cloudinary... Please wait! ✨</p>
-                        <p style="font-size: 0.9em; color: #666;">This may take a moment for larger files...</p>
-                    </div>
-                    """, unsafe_allow_html=True)
-                    
-                    # Upload to Cloudinary
-                    video_url = upload_video_to_cloudinary(uploaded_file)
-                    
-                    if video_url:
-                        # Save metadata with URL
-                        videos = load_json("videos.json")
-                        videos.append({
-                            "id": len(videos) + 1,
-                            "original_name": uploaded_file.name,
-                            "date": video_date.strftime("%Y-%m-%d"),
-                            "caption": caption,
-                            "upload_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                            "file_size": uploaded_file.size,
-                            "url": video_url,
-                            "storage_type": "cloudinary"
-                        })
-                        save_json("videos.json", videos)
-                        
-                        progress_placeholder.empty()
-                        st.success(f"🎥 Video '{uploaded_file.name}' saved to Cloudinary! 💕")
-                        
-                        # Show preview
-                        st.markdown("### Preview:")
-                        st.video(video_url)
-                        st.write(caption)
-                        
-                        st.rerun()
-                    else:
-                        progress_placeholder.empty()
-                        st.error("❌ Failed to upload video!")
-                        
-                except Exception as e:
-                    st.error(f"❌ Error saving video: {str(e)}")
+                # Upload to the media backend in the background; metadata is saved when it completes
+                job_id = upload_video(uploaded_file, {
+                    "original_name": uploaded_file.name,
+                    "date": video_date.strftime("%Y-%m-%d"),
+                    "caption": caption,
+                    "upload_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                    "file_size": uploaded_file.size,
+                    "storage_type": media_store.BACKEND_NAME
+                })
+                if job_id:
+                    st.success(f"🎥 Uploading '{uploaded_file.name}' in the background — you can keep working! 💕")
             else:
                 st.error("Please select a video and add a caption!")
+        
+        show_video_upload_jobs()
     
     with tab3:
         st.markdown('<h2 class="section-title">Write a Love Letter</h2>', unsafe_allow_html=True)
@@ -571,15 +509,12 @@ def admin_mode():
         
         if st.button("Save Letter", key="save_letter"):
             if title and content:
-                letters = load_json("letters.json")
-                letters.append({
-                    "id": len(letters) + 1,
+                add_record("letters.json", {
                     "date": letter_date.strftime("%Y-%m-%d"),
                     "title": title,
                     "content": content,
                     "created_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
                 })
-                save_json("letters.json", letters)
                 
                 st.success("💌 Letter saved successfully! 💕")
                 st.rerun()
@@ -587,90 +522,217 @@ def admin_mode():
                 st.error("Please add both title and content!")
     
     with tab4:
-        st.markdown('<h2 class="section-title">Manage Content</h2>', unsafe_allow_html=True)
-        
-        # Manage Photos
-        st.subheader("📷 Manage Photos")
-        photos = load_json("photos.json")
-        
-        if photos:
-            st.info(f"📊 Total photos: {len(photos)} | Storage: Base64 (Permanent)")
-            
-            for i, photo in enumerate(photos):
-                col1, col2, col3 = st.columns([3, 1, 1])
-                with col1:
-                    st.write(f"**{photo['original_name']}** - {photo['date']}")
-                    st.write(f"*{photo['caption'][:50]}...*" if len(photo['caption']) > 50 else f"*{photo['caption']}*")
-                    
-                    # Show storage info
-                    storage_type = photo.get('storage_type', 'legacy')
-                    if storage_type == 'base64':
-                        st.write("🔒 **Permanent Storage** ✅")
-                    else:
-                        st.write("⚠️ Legacy storage (may disappear)")
-                        
-                with col2:
-                    if 'base64_data' in photo and photo['base64_data']:
-                        st.success("✅ Stored")
-                    else:
-                        st.warning("⚠️ Legacy")
-                with col3:
-                    if st.button("🗑️ Delete", key=f"del_photo_{i}"):
-                        photos.pop(i)
-                        save_json("photos.json", photos)
-                        st.success("Photo deleted!")
-                        st.rerun()
-                st.divider()
-        else:
-            st.info("No photos to manage yet!")
-        
-        # Manage Videos
-        st.subheader("🎥 Manage Videos")
-        videos = load_json("videos.json")
-        
-        if videos:
-            st.info(f"📊 Total videos: {len(videos)} | Storage: Cloudinary")
-            
-            for i, video in enumerate(videos):
-                col1, col2, col3 = st.columns([3, 1, 1])
-                with col1:
-                    st.write(f"**{video['original_name']}** - {video['date']}")
-                    st.write(f"*{video['caption'][:50]}...*" if len(video['caption']) > 50 else f"*{video['caption']}*")
-                    st.write(f"URL: {video['url'][:30]}...")
-                with col2:
-                    st.success("✅ Stored on Cloudinary")
-                with col3:
-                    if st.button("🗑️ Delete", key=f"del_video_{i}"):
-                        # Optional: Delete from Cloudinary if needed (requires public_id from upload response)
-                        videos.pop(i)
-                        save_json("videos.json", videos)
-                        st.success("Video deleted!")
-                        st.rerun()
-                st.divider()
-        else:
-            st.info("No videos to manage yet!")
-        
-        st.markdown("---")
-        
-        # Manage Letters
-        st.subheader("💌 Manage Letters")
-        letters = load_json("letters.json")
-        
-        if letters:
-            for i, letter in enumerate(letters):
-                col1, col2 = st.columns([4, 1])
-                with col1:
-                    st.write(f"**{letter['title']}** - {letter['date']}")
-                    st.write(f"*{letter['content'][:100]}...*" if len(letter['content']) > 100 else f"*{letter['content']}*")
-                with col2:
-                    if st.button("🗑️ Delete", key=f"del_letter_{i}"):
-                        letters.pop(i)
-                        save_json("letters.json", letters)
-                        st.success("Letter deleted!")
-                        st.rerun()
-                st.divider()
-        else:
-            st.info("No letters to manage yet!")
+        manage_content()
+    
+    with tab5:
+        show_performance_panel()
+
+# Manage Content: one paginated table per collection, with bulk edits
+MANAGE_PAGE_SIZES = [25, 50, 100]
+# label -> (collection, {editable field: column title}, read-only columns)
+MANAGE_COLLECTIONS = {
+    "📷 Photos": ("photos.json", {"date": "Date", "caption": "Caption"}, ["Name", "Size", "Storage"]),
+    "🎥 Videos": ("videos.json", {"date": "Date", "caption": "Caption"}, ["Name", "Size", "URL"]),
+    "💌 Letters": ("letters.json", {"date": "Date", "title": "Title"}, ["Preview", "Size"]),
+}
+
+def format_size(num_bytes):
+    if num_bytes is None:
+        return "?"
+    for unit in ("B", "KB", "MB"):
+        if num_bytes < 1024:
+            return f"{num_bytes:.0f} {unit}"
+        num_bytes /= 1024
+    return f"{num_bytes:.1f} GB"
+
+def record_size(filename, record):
+    """Stored bytes from the record's metadata; no photo payload is read"""
+    if filename == "photos.json":
+        variants = record.get('variants')
+        if variants:
+            return sum(v.get('bytes') or 0 for v in variants.values())
+        if record.get('blob_size'):
+            return record['blob_size']
+        return len(record.get('base64_data') or "") * 3 // 4 or None
+    if filename == "videos.json":
+        return record.get('file_size')
+    return len(record.get('content', "").encode('utf-8'))
+
+def manage_row(filename, record, fields):
+    row = {"Select": False}
+    row.update({title: str(record.get(field) or "") for field, title in fields.items()})
+    if filename == "photos.json":
+        row["Name"] = record.get('original_name', "")
+        row["Storage"] = "✅ Stored" if has_stored_image(record) else "⚠️ Legacy"
+    elif filename == "videos.json":
+        row["Name"] = record.get('original_name', "")
+        row["URL"] = record.get('url', "")
+    else:
+        content = record.get('content', "")
+        row["Preview"] = content[:80] + ("..." if len(content) > 80 else "")
+    row["Size"] = format_size(record_size(filename, record))
+    return row
+
+def delete_photos(photo_ids):
+    """Delete photo records in one write, then any blobs no remaining photo uses"""
+    photos = delete_records("photos.json", photo_ids)
+    # Blobs are content-addressed, so keep ones still shared by a duplicate
+    still_used = set()
+    for photo in load_json("photos.json"):
+        still_used |= photo_blob_refs(photo)
+    for photo in photos:
+        for blob_ref in photo_blob_refs(photo) - still_used:
+            delete_blob(blob_ref)
+
+def delete_videos_media(videos):
+    """Remove deleted videos' files from the media backend that stored them"""
+    for video in videos:
+        try:
+            delete_media(video)
+        except Exception as e:
+            st.warning(f"Couldn't remove '{video.get('original_name', 'video')}' from storage: {str(e)}")
+
+def bump_manage_version():
+    """Give the table a fresh widget key so it drops stale edits"""
+    st.session_state.manage_version = st.session_state.get("manage_version", 0) + 1
+
+def reset_manage_page():
+    st.session_state.manage_page = 1
+    bump_manage_version()
+
+@timed("render:manage_content")
+def manage_content():
+    st.markdown('<h2 class="section-title">Manage Content</h2>', unsafe_allow_html=True)
+    
+    label = st.radio("Collection", list(MANAGE_COLLECTIONS), horizontal=True, key="manage_kind",
+                     on_change=reset_manage_page)
+    filename, fields, read_only = MANAGE_COLLECTIONS[label]
+    total = count_collection(filename)
+    if not total:
+        st.info(f"No {label.split()[-1].lower()} to manage yet!")
+        return
+    
+    col1, col2 = st.columns([1, 1])
+    with col1:
+        page_size = st.selectbox("Rows per page", MANAGE_PAGE_SIZES, key="manage_page_size",
+                                 on_change=reset_manage_page)
+    page_count = (total + page_size - 1) // page_size
+    if st.session_state.get("manage_page", 1) > page_count:
+        st.session_state.manage_page = page_count  # the last page was emptied
+    with col2:
+        page = st.number_input(f"Page (of {page_count})", min_value=1, max_value=page_count, step=1,
+                               key="manage_page", on_change=bump_manage_version) - 1
+    records = query_collection(filename, order_by="date", descending=True,
+                               limit=page_size, offset=page * page_size)
+    st.caption(f"📊 {total} in total · showing {page * page_size + 1}–{page * page_size + len(records)}, newest first")
+    
+    columns = {"Select": st.column_config.CheckboxColumn("Select", width="small")}
+    if "Date" in fields.values():
+        columns["Date"] = st.column_config.TextColumn("Date", validate=r"^\d{4}-\d{2}-\d{2}$")
+    if "URL" in read_only:
+        columns["URL"] = st.column_config.LinkColumn("URL")
+    edited = st.data_editor(
+        [manage_row(filename, record, fields) for record in records],
+        column_config=columns,
+        disabled=read_only,
+        hide_index=True,
+        use_container_width=True,
+        key=f"manage_table_{st.session_state.get('manage_version', 0)}",
+    )
+    
+    selected = [record.get('id') for record, row in zip(records, edited) if row["Select"]]
+    changes = []
+    for record, row in zip(records, edited):
+        updates = {field: row[title] or "" for field, title in fields.items()
+                   if (row[title] or "") != str(record.get(field) or "")}
+        if updates:
+            changes.append({**record, **updates})
+    
+    col1, col2 = st.columns([1, 1])
+    with col1:
+        if st.button(f"🗑️ Delete selected ({len(selected)})", key="manage_delete", disabled=not selected):
+            if filename == "photos.json":
+                delete_photos(selected)
+            else:
+                removed = delete_records(filename, selected)
+                if filename == "videos.json":
+                    delete_videos_media(removed)
+            bump_manage_version()
+            st.success(f"Deleted {len(selected)} item(s)!")
+            st.rerun()
+    with col2:
+        if st.button(f"💾 Save edits ({len(changes)})", key="manage_save", disabled=not changes):
+            update_records(filename, changes)
+            bump_manage_version()
+            st.success(f"Saved {len(changes)} change(s)!")
+            st.rerun()
+
+def show_performance_panel():
+    """Rolling per-span timings for this server process"""
+    st.markdown('<h2 class="section-title">Performance</h2>', unsafe_allow_html=True)
+    st.caption("Timings cover every session served by this process (last 500 samples per span). "
+               "Set MEMORY_LOCKER_PERF_LOG to also append them to a JSON-lines file.")
+    
+    rows = perf_stats()
+    if rows:
+        st.dataframe(rows, use_container_width=True, hide_index=True)
+    else:
+        st.info("No timings recorded yet!")
+    
+    st.subheader("Storage cache")
+    storage_stats = cache_stats()
+    for filename in storage_stats.get("corrupt_snapshots", []):
+        st.error(f"⚠️ {filename} is not valid JSON and is being treated as empty. "
+                 "Restore it from a backup before saving to it again.")
+    st.json(storage_stats)
+    
+    if st.button("Reset timings", key="reset_perf"):
+        reset_perf_stats()
+        st.rerun()
+    
+    show_memory_panel()
+
+def format_mb(num_bytes):
+    return None if num_bytes is None else round(num_bytes / (1024 * 1024), 2)
+
+def show_memory_panel():
+    """tracemalloc reports for the profiled views and RSS over time"""
+    st.subheader("Memory")
+    enabled = st.toggle("Profile memory (slows every profiled call)", value=memprof.is_enabled(),
+                        key="memprof_enabled")
+    if enabled and not memprof.is_enabled():
+        memprof.enable()
+    elif not enabled and memprof.is_enabled():
+        memprof.disable()
+    
+    st.metric("Process RSS", f"{format_mb(memprof.current_rss())} MB")
+    history = memprof.rss_history()
+    if len(history) > 1:
+        start = history[0][0]
+        st.line_chart({"RSS (MB)": [format_mb(rss) for _, rss in history]},
+                      x_label=f"samples every {memprof.RSS_INTERVAL:g}s since "
+                              f"{datetime.fromtimestamp(start).strftime('%H:%M:%S')}")
+    
+    reports = memprof.reports()
+    if not reports:
+        st.info("No memory reports yet! Turn profiling on and open the Photos or Surprise views.")
+        return
+    st.dataframe([{
+        "call": report["name"],
+        "at": datetime.fromtimestamp(report["ts"]).strftime("%H:%M:%S"),
+        "peak_mb": format_mb(report["peak_bytes"]),
+        "retained_mb": format_mb(report["retained_bytes"]),
+        "rss_mb": format_mb(report["rss_bytes"]),
+        "overlapping": report["overlapping_calls"],
+        "over_budget": report["over_budget"],
+    } for report in reports], use_container_width=True, hide_index=True)
+    for report in reports[:5]:
+        with st.expander(f"Top allocation sites: {report['name']} at "
+                         f"{datetime.fromtimestamp(report['ts']).strftime('%H:%M:%S')}"):
+            st.dataframe(report.get("top_sites", []), use_container_width=True, hide_index=True)
+    if st.button("Clear memory reports", key="reset_memprof"):
+        memprof.reset()
+        st.rerun()
 
 # Viewer Mode Functions
 def viewer_mode():
@@ -683,10 +745,15 @@ def viewer_mode():
         if st.button("Logout", key="viewer_logout"):
             logout()
     
+    query = st.text_input("🔍 Search our memories", key="search_query",
+                          placeholder="Search letters and captions...")
+    if query.strip():
+        show_search_results(query)
+    
     st.markdown("---")
     
     # Navigation (added Videos tab)
-    tab1, tab2, tab3, tab4 = st.tabs(["📷 Our Photos", "🎥 Our Videos", "💌 Love Letters", "🎁 Surprise Me!"])
+    tab1, tab2, tab3, tab4, tab5 = st.tabs(["📷 Our Photos", "🎥 Our Videos", "💌 Love Letters", "🗓️ Timeline", "🎁 Surprise Me!"])
     
     with tab1:
         display_photos()
@@ -698,15 +765,149 @@ def viewer_mode():
         display_letters()
     
     with tab4:
+        display_timeline()
+    
+    with tab5:
         surprise_section()
 
+SEARCH_RESULT_LIMIT = 20
+TYPE_ICONS = {"photo": "📷", "video": "🎥", "letter": "💌"}
+
+def show_memory_row(memory_type, record, query=""):
+    """Compact card for one memory; words matching `query` are highlighted"""
+    if memory_type == "letter":
+        st.markdown(f"""
+        <div class="memory-card">
+            <div class="memory-date">💌 {record['date']}</div>
+            <h3 style="color: #d63384; font-family: 'Dancing Script', cursive; font-size: 1.6em; margin-bottom: 10px;">{highlight(record['title'], query)}</h3>
+            <p style="line-height: 1.6; color: #555;">{highlight(record['content'], query)}</p>
+        </div>
+        """, unsafe_allow_html=True)
+        return
+    col1, col2 = st.columns([1, 2])
+    with col1:
+        if memory_type == "photo":
+            show_stored_photo(record, VARIANT_SIZES['grid'][0], fill=True)
+        elif 'url' in record:
+            st.markdown(video_poster_html(record, link=True), unsafe_allow_html=True)
+    with col2:
+        st.markdown(f"""
+        <div class="memory-card">
+            <div class="memory-date">{TYPE_ICONS[memory_type]} {record['date']}</div>
+            <p style="color: #333;">{highlight(record.get('caption'), query)}</p>
+        </div>
+        """, unsafe_allow_html=True)
+
+@timed("render:search_results")
+def show_search_results(query):
+    """Ranked matches from the search index; only the hits are loaded"""
+    results = search_memories(query, limit=SEARCH_RESULT_LIMIT)
+    if not results:
+        st.info(f"No memories match “{query}” yet 💭")
+        return
+    st.caption(f"Top {len(results)} match(es) for “{query}”")
+    for score, memory_type, record_id in results:
+        record = fetch_memory((memory_type, record_id))
+        if record is not None:
+            show_memory_row(memory_type, record, query)
+
+# Timeline
+TIMELINE_MONTH_LIMIT = 60
+
+def bucket_summary(counts):
+    return " · ".join(f"{TYPE_ICONS[t]} {counts[t]}" for t in TYPE_ICONS if counts.get(t))
+
+def reset_timeline_month():
+    st.session_state.pop("timeline_month", None)
+
+@timed("render:display_timeline")
+def display_timeline():
+    st.markdown('<h2 class="section-title">Our Timeline 🗓️</h2>', unsafe_allow_html=True)
+    
+    today = date.today()
+    memories = on_this_day(today)
+    if memories:
+        st.subheader(f"✨ On this day, {today.strftime('%B %d')}")
+        for day, memory_type, record_id in memories:
+            record = fetch_memory((memory_type, record_id))
+            if record is not None:
+                st.caption(f"{today.year - int(day[:4])} year(s) ago")
+                show_memory_row(memory_type, record)
+        st.markdown("---")
+    
+    years = dict(year_buckets())
+    if not years:
+        st.info("No dated memories yet! 🗓️")
+        return
+    year = st.selectbox("Year", list(years), key="timeline_year", on_change=reset_timeline_month,
+                        format_func=lambda y: f"{y} ({bucket_summary(years[y])})")
+    months = {month: counts for month, counts in month_buckets() if month.startswith(year)}
+    month = st.radio("Month", list(months), key="timeline_month", horizontal=True,
+                     format_func=lambda m: f"{datetime.strptime(m, '%Y-%m').strftime('%b')} ({sum(months[m].values())})")
+    
+    entries = in_range(month, month)
+    st.caption(f"{datetime.strptime(month, '%Y-%m').strftime('%B %Y')}: {bucket_summary(months[month])}")
+    for day, memory_type, record_id in entries[:TIMELINE_MONTH_LIMIT]:
+        record = fetch_memory((memory_type, record_id))
+        if record is not None:
+            show_memory_row(memory_type, record)
+    if len(entries) > TIMELINE_MONTH_LIMIT:
+        st.caption(f"Showing the latest {TIMELINE_MONTH_LIMIT} of {len(entries)} memories this month")
+
+# Photo gallery paging
+PHOTO_PAGE_SIZES = [6, 12, 24, 48]
+VIDEO_PAGE_SIZE = 8
+
+def set_photo_page(page):
+    st.session_state.photo_page = page
+
+def load_more_photos():
+    st.session_state.photos_loaded += st.session_state.photo_page_size
+
+def reset_photo_cursor():
+    st.session_state.photo_page = 0
+    st.session_state.photos_loaded = st.session_state.photo_page_size
+
+def photo_gallery_slice(total_photos):
+    """Render the gallery controls and return only the photos to show"""
+    col1, col2 = st.columns([2, 1])
+    with col1:
+        mode = st.radio("Gallery mode", ["Pages", "Load more"], horizontal=True,
+                        key="photo_gallery_mode", on_change=reset_photo_cursor)
+    with col2:
+        page_size = st.selectbox("Photos per page", PHOTO_PAGE_SIZES, key="photo_page_size",
+                                 on_change=reset_photo_cursor)
+    
+    if mode == "Pages":
+        page_count = (total_photos + page_size - 1) // page_size
+        page = min(st.session_state.photo_page, page_count - 1)
+        photos = query_collection("photos.json", order_by="date", descending=True,
+                                  limit=page_size, offset=page * page_size)
+        
+        col1, col2, col3 = st.columns([1, 2, 1])
+        with col1:
+            st.button("⬅️ Newer", key="photo_prev", disabled=page == 0,
+                      on_click=set_photo_page, args=(page - 1,))
+        with col2:
+            st.markdown(f"<p style='text-align: center;'>Page {page + 1} of {page_count}</p>",
+                        unsafe_allow_html=True)
+        with col3:
+            st.button("Older ➡️", key="photo_next", disabled=page >= page_count - 1,
+                      on_click=set_photo_page, args=(page + 1,))
+        return photos
+    
+    # "Load more": the slice grows by one page per click
+    shown = min(st.session_state.photos_loaded, total_photos)
+    return query_collection("photos.json", order_by="date", descending=True, limit=shown)
+
+@timed("render:display_photos")
+@memprof.profiled("render:display_photos")
 def display_photos():
     st.markdown('<h2 class="section-title">Our Photo Memories 📷</h2>', unsafe_allow_html=True)
     
-    photos = load_json("photos.json")
-    photos.sort(key=lambda x: x['date'], reverse=True)
+    total_photos = count_collection("photos.json")
     
-    if not photos:
+    if not total_photos:
         st.markdown("""
         <div class="memory-card">
             <h3 style="text-align: center; color: #666;">No photos yet! 📸</h3>
@@ -717,7 +918,10 @@ def display_photos():
         return
     
     # Display stats
-    st.info(f"📊 **{len(photos)} beautiful memories** stored permanently! 💕")
+    st.info(f"📊 **{total_photos} beautiful memories** stored permanently! 💕")
+    
+    # Only the visible slice is queried, decoded and sent to the browser
+    photos = photo_gallery_slice(total_photos)
     
     # Display photos in organized grid - 3 columns
     cols_per_row = 3
@@ -727,16 +931,11 @@ def display_photos():
             if i + j < len(photos):
                 photo = photos[i + j]
                 with cols[j]:
-                    # Check if it's base64 stored photo
-                    if 'base64_data' in photo and photo['base64_data']:
+                    # Check if it's a stored photo
+                    if has_stored_image(photo):
                         try:
-                            # Decode and display base64 image
-                            image = decode_base64_to_image(photo['base64_data'])
-                            if image:
-                                # Resize for consistent display
-                                image.thumbnail((300, 200), Image.Resampling.LANCZOS)
-                                
-                                st.image(image, use_container_width=True)
+                            # Grid rendition is pre-sized at upload time and sent as stored
+                            if show_stored_photo(photo, VARIANT_SIZES['grid'][0], fill=True):
                                 st.markdown(f"""
                                 <div style="text-align: center; margin-top: 10px;">
                                     <p style="color: #d63384; font-weight: 600; margin: 5px 0;">{photo['date']}</p>
@@ -745,7 +944,7 @@ def display_photos():
                                 </div>
                                 """, unsafe_allow_html=True)
                             else:
-                                st.error("Could not decode image")
+                                st.error("Could not load image")
                         except Exception as e:
                             st.error(f"Error displaying photo: {str(e)}")
                     else:
@@ -765,25 +964,89 @@ def display_photos():
                         </div>
                         """, unsafe_allow_html=True)
                     st.markdown("---")
+    
+    if st.session_state.photo_gallery_mode == "Load more" and len(photos) < total_photos:
+        st.button(f"Load more photos ({total_photos - len(photos)} left) 💕",
+                  key="photo_load_more", on_click=load_more_photos)
 
+def play_video(video_id):
+    st.session_state.playing_video = video_id
+
+def set_video_page(page):
+    st.session_state.video_page = page
+
+def format_duration(seconds):
+    if not seconds:
+        return None
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    return f"{minutes}:{seconds:02d}"
+
+def storage_label(video):
+    """Display name of the media backend a video record was stored with"""
+    backend = media_store.BACKENDS.get(video.get('storage_type'), media_store.backend)
+    return backend.LABEL[:1].upper() + backend.LABEL[1:]
+
+def video_poster_html(video, link=False):
+    """Lazy-loaded poster frame with a duration badge (no player, no video bytes).
+
+    With link=True the poster opens the video itself in a new tab.
+    """
+    poster = poster_url(video)
+    duration = format_duration(video.get('duration'))
+    badge = (f'<span style="position: absolute; right: 8px; bottom: 8px; background: rgba(0,0,0,0.7); '
+             f'color: white; font-size: 0.8em; padding: 2px 6px; border-radius: 4px;">{duration}</span>'
+             if duration else "")
+    if poster:
+        frame = (f'<img src="{poster}" loading="lazy" alt="" '
+                 f'style="width: 100%; aspect-ratio: 16 / 9; object-fit: cover; border-radius: 10px; display: block;">')
+    else:
+        frame = ('<div style="background: #f0f0f0; aspect-ratio: 16 / 9; display: flex; align-items: center; '
+                 'justify-content: center; border-radius: 10px; font-size: 3em;">🎥</div>')
+    html = f'<div style="position: relative;">{frame}{badge}</div>'
+    if link and video.get('url'):
+        html = f'<a href="{video["url"]}" target="_blank" title="▶️ Play">{html}</a>'
+    return html
+
+def show_video_player():
+    """The one real player on the Videos tab, for the poster last clicked"""
+    video = fetch_memory(("video", st.session_state.get("playing_video")))
+    if video is None or 'url' not in video:
+        return
+    st.video(video['url'], autoplay=True)
+    col1, col2 = st.columns([4, 1])
+    with col1:
+        st.markdown(f"**{video['date']}** · {video['caption']}")
+    with col2:
+        st.button("✖ Close", key="close_video", on_click=play_video, args=(None,))
+    st.markdown("---")
+
+@timed("render:display_videos")
 def display_videos():
     st.markdown('<h2 class="section-title">Our Video Memories 🎥</h2>', unsafe_allow_html=True)
     
-    videos = load_json("videos.json")
-    videos.sort(key=lambda x: x['date'], reverse=True)
+    total_videos = count_collection("videos.json")
     
-    if not videos:
-        st.markdown("""
+    if not total_videos:
+        st.markdown(f"""
         <div class="memory-card">
             <h3 style="text-align: center; color: #666;">No videos yet! 🎥</h3>
             <p style="text-align: center; color: #888;">Your beautiful video memories will appear here soon...</p>
-            <p style="text-align: center; color: #d63384; font-size: 0.9em;">✨ Videos are stored on Cloudinary! ✨</p>
+            <p style="text-align: center; color: #d63384; font-size: 0.9em;">✨ Videos are stored on {media_store.backend.LABEL}! ✨</p>
         </div>
         """, unsafe_allow_html=True)
         return
     
     # Display stats
-    st.info(f"📊 **{len(videos)} beautiful video memories** stored on Cloudinary! 💕")
+    st.info(f"📊 **{total_videos} beautiful video memories** stored on {media_store.backend.LABEL}! 💕")
+    
+    show_video_player()
+    
+    # The grid is poster images only (lazy-loaded, one page at a time); a
+    # player is created just for the video being watched
+    page_count = (total_videos + VIDEO_PAGE_SIZE - 1) // VIDEO_PAGE_SIZE
+    page = min(st.session_state.get("video_page", 0), page_count - 1)
+    videos = query_collection("videos.json", order_by="date", descending=True,
+                              limit=VIDEO_PAGE_SIZE, offset=page * VIDEO_PAGE_SIZE)
     
     # Display videos in organized grid - 2 columns (videos are wider)
     cols_per_row = 2
@@ -793,24 +1056,36 @@ def display_videos():
             if i + j < len(videos):
                 video = videos[i + j]
                 with cols[j]:
-                    try:
-                        st.video(video['url'])
-                        st.markdown(f"""
-                        <div style="text-align: center; margin-top: 10px;">
-                            <p style="color: #d63384; font-weight: 600; margin: 5px 0;">{video['date']}</p>
-                            <p style="color: #333; font-size: 0.9em; margin: 0;">{video['caption']}</p>
-                            <p style="color: #4CAF50; font-size: 0.8em; margin: 5px 0;">☁️ Cloudinary Storage</p>
-                        </div>
-                        """, unsafe_allow_html=True)
-                    except Exception as e:
-                        st.error(f"Error displaying video: {str(e)}")
+                    st.markdown(f"""
+                    {video_poster_html(video)}
+                    <div style="text-align: center; margin-top: 10px;">
+                        <p style="color: #d63384; font-weight: 600; margin: 5px 0;">{video['date']}</p>
+                        <p style="color: #333; font-size: 0.9em; margin: 0;">{video['caption']}</p>
+                        <p style="color: #4CAF50; font-size: 0.8em; margin: 5px 0;">☁️ {storage_label(video)} Storage</p>
+                    </div>
+                    """, unsafe_allow_html=True)
+                    if 'url' in video:
+                        st.button("▶️ Play", key=f"play_video_{video.get('id')}", on_click=play_video,
+                                  args=(video.get('id'),), use_container_width=True)
                     st.markdown("---")
+    
+    if page_count > 1:
+        col1, col2, col3 = st.columns([1, 2, 1])
+        with col1:
+            st.button("⬅️ Newer", key="video_prev", disabled=page == 0,
+                      on_click=set_video_page, args=(page - 1,))
+        with col2:
+            st.markdown(f"<p style='text-align: center;'>Page {page + 1} of {page_count}</p>",
+                        unsafe_allow_html=True)
+        with col3:
+            st.button("Older ➡️", key="video_next", disabled=page >= page_count - 1,
+                      on_click=set_video_page, args=(page + 1,))
 
+@timed("render:display_letters")
 def display_letters():
     st.markdown('<h2 class="section-title">Love Letters 💌</h2>', unsafe_allow_html=True)
     
-    letters = load_json("letters.json")
-    letters.sort(key=lambda x: x['date'], reverse=True)
+    letters = query_collection("letters.json", order_by="date", descending=True)
     
     if not letters:
         st.markdown("""
@@ -844,58 +1119,51 @@ def surprise_section():
     col1, col2, col3 = st.columns([1, 1, 1])
     
     with col2:
+        st.toggle("No repeats until we've seen them all", key="surprise_no_repeat")
         if st.button("🎲 Surprise Me!", key="surprise_btn"):
             show_random_memory()
 
-def show_random_memory():
-    photos = load_json("photos.json")
-    videos = load_json("videos.json")
-    letters = load_json("letters.json")
-    
-    all_memories = []
+def next_surprise():
+    """Pick a (type, id) entry from the memory index.
     
-    # Add photos to memories pool (only base64 ones that will display)
-    for photo in photos:
-        if 'base64_data' in photo and photo['base64_data']:
-            all_memories.append({
-                'type': 'photo',
-                'content': photo
-            })
-    
-    # Add videos to memories pool
-    for video in videos:
-        if 'url' in video:
-            all_memories.append({
-                'type': 'video',
-                'content': video
-            })
-    
-    # Add letters to memories pool  
-    for letter in letters:
-        all_memories.append({
-            'type': 'letter',
-            'content': letter
-        })
+    In no-repeat mode each session deals from its own shuffled deck, and only
+    reshuffles once every memory has been shown.
+    """
+    if not st.session_state.get('surprise_no_repeat'):
+        return random_entry()
+    deck = st.session_state.get('surprise_deck', [])
+    while deck:
+        entry = deck.pop()
+        if index_contains(entry):  # skip memories deleted since the shuffle
+            return entry
+    deck = all_entries()
+    random.shuffle(deck)
+    st.session_state.surprise_deck = deck
+    return deck.pop() if deck else None
+
+@timed("render:show_random_memory")
+@memprof.profiled("render:show_random_memory")
+def show_random_memory():
+    # Pick random memory from the index and load only that record
+    entry = next_surprise()
+    record = fetch_memory(entry) if entry else None
     
-    if not all_memories:
+    if record is None:
         st.warning("No memories to surprise you with yet! Add some photos, videos, or letters first. 💕")
         return
     
-    # Pick random memory
-    random_memory = random.choice(all_memories)
+    random_memory = {'type': entry[0], 'content': record}
     
     if random_memory['type'] == 'photo':
         photo = random_memory['content']
         
         st.markdown("### 📷 Random Photo Memory!")
         
-        if 'base64_data' in photo and photo['base64_data']:
+        if has_stored_image(photo):
             try:
-                image = decode_base64_to_image(photo['base64_data'])
-                if image:
-                    st.image(image, caption=f"{photo['caption']} ({photo['date']})")
-                else:
-                    st.error("Could not decode random photo")
+                if not show_stored_photo(photo, VARIANT_SIZES['preview'][0],
+                                         caption=f"{photo['caption']} ({photo['date']})"):
+                    st.error("Could not load random photo")
             except Exception as e:
                 st.error(f"Error displaying random photo: {str(e)}")
         else:
@@ -940,20 +1208,24 @@ def show_random_memory():
 
 # Main app function
 def main():
-    # Initialize everything
-    init_directories()
-    init_session_state()
-    create_sample_data()
-    load_css()
-    add_floating_hearts()
-    
-    # Route based on login state
-    if not st.session_state.logged_in:
-        login_page()
-    elif st.session_state.user_type == "admin":
-        admin_mode()
-    elif st.session_state.user_type == "viewer":
-        viewer_mode()
+    with span("rerun"):
+        # Initialize everything
+        for phase in (init_directories, migrate_legacy_photos, migrate_record_ids, configure_media, init_session_state,
+                      create_sample_data, load_css, add_floating_hearts):
+            with span(f"phase:{phase.__name__}"):
+                phase()
+        
+        # Route based on login state
+        if not st.session_state.logged_in:
+            mode = login_page
+        elif st.session_state.user_type == "admin":
+            mode = admin_mode
+        elif st.session_state.user_type == "viewer":
+            mode = viewer_mode
+        else:
+            return
+        with span(f"phase:{mode.__name__}"):
+            mode()
 
 if __name__ == "__main__":
     main()
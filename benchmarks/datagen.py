@@ -0,0 +1,115 @@
+"""Generate a synthetic memory locker for benchmarks and load tests.
+
+Usage:
+    python benchmarks/datagen.py OUT_DIR --items 1000 [--legacy-base64]
+
+Creates OUT_DIR/data/{photos,videos,letters}.json with `--items` records in
+each collection. Photos get real grid/preview/full JPEG renditions in the
+blob store, made from noise so they compress like phone photos (~100KB for
+the full 800px variant). With --legacy-base64 the photos are written the
+pre-blob-store way, with the full JPEG inline as base64_data.
+"""
+import argparse
+import base64
+import os
+import random
+import sys
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image  # noqa: E402
+
+WORDS = ("love sunshine beach dinner laugh dance forever sweet memory trip sunset "
+         "coffee rain walk home dream smile hug adventure together").split()
+DISTINCT_IMAGES = 20  # reused across records; enough variety for realistic I/O
+
+
+def _noise_image(rng, size=(800, 600)):
+    """Blurry noise compresses about as well as a real photo"""
+    small = Image.frombytes("RGB", (size[0] // 8, size[1] // 8),
+                            bytes(rng.getrandbits(8) for _ in range(size[0] // 8 * size[1] // 8 * 3)))
+    return small.resize(size, Image.Resampling.BICUBIC)
+
+
+def _sentence(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize()
+
+
+def _day(rng):
+    return (date(2020, 1, 1) + timedelta(days=rng.randrange(6 * 365))).strftime("%Y-%m-%d")
+
+
+def generate(out_dir, items, legacy_base64=False, seed=1):
+    """Write a synthetic locker under out_dir/data; returns out_dir"""
+    from image_pipeline import build_variants, encode_jpeg, store_variants
+    import repository
+
+    rng = random.Random(seed)
+    cwd = os.getcwd()
+    os.makedirs(os.path.join(out_dir, "data"), exist_ok=True)
+    os.chdir(out_dir)
+    try:
+        images = []
+        for _ in range(DISTINCT_IMAGES):
+            image = _noise_image(rng, rng.choice([(800, 600), (600, 800), (800, 450)]))
+            if legacy_base64:
+                images.append((base64.b64encode(encode_jpeg(image)).decode('utf-8'), image.size))
+            else:
+                images.append((store_variants(build_variants(image)), image.size))
+
+        photos = []
+        for i in range(items):
+            payload, size = images[i % len(images)]
+            photo = {
+                "id": i + 1,
+                "original_name": f"IMG_{i:05d}.jpg",
+                "date": _day(rng),
+                "caption": _sentence(rng, 8),
+                "upload_date": "2024-01-01 12:00:00",
+                "file_size": 3_000_000,
+                "processed_size": list(size),
+            }
+            if legacy_base64:
+                photo.update(base64_data=payload, storage_type="base64")
+            else:
+                photo.update(blob=payload['full']['blob'], blob_size=payload['full']['bytes'],
+                             variants=payload, storage_type="blob")
+            photos.append(photo)
+
+        videos = [{
+            "id": i + 1,
+            "original_name": f"VID_{i:05d}.mp4",
+            "date": _day(rng),
+            "caption": _sentence(rng, 8),
+            "upload_date": "2024-01-01 12:00:00",
+            "file_size": 50_000_000,
+            "url": f"https://res.cloudinary.com/demo/video/upload/memory_locker_videos/v{i}.mp4",
+            "storage_type": "cloudinary",
+        } for i in range(items)]
+
+        letters = [{
+            "id": i + 1,
+            "date": _day(rng),
+            "title": _sentence(rng, 4),
+            "content": " ".join(_sentence(rng, 12) + "." for _ in range(6)),
+            "created_date": "2024-01-01 12:00:00",
+        } for i in range(items)]
+
+        repository.save_collection("photos.json", photos)
+        repository.save_collection("videos.json", videos)
+        repository.save_collection("letters.json", letters)
+    finally:
+        os.chdir(cwd)
+    return out_dir
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("out_dir")
+    parser.add_argument("--items", type=int, default=1000)
+    parser.add_argument("--legacy-base64", action="store_true")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    generate(args.out_dir, args.items, args.legacy_base64, args.seed)
+    print(f"Generated {args.items} photos, videos and letters in {args.out_dir}/data")
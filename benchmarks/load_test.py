@@ -0,0 +1,442 @@
+"""Load-test the memory locker with concurrent viewer and admin sessions.
+
+Usage:
+    python benchmarks/load_test.py [--viewers 10] [--admins 1] [--duration 60]
+        [--items 1000] [--think 0.5] [--no-media] [--output load.json]
+    python benchmarks/load_test.py --url http://host:8501 [--server-pid PID] ...
+
+Without --url this generates a synthetic locker (see datagen.py) in a
+temporary directory and starts `streamlit run app.py` on it. Each simulated
+session talks to the server over Streamlit's websocket protocol like a
+browser does: it loads the page, logs in through the login page, then
+repeats actions with `--think` seconds between them.
+
+    viewer: click "Surprise Me!", page through the gallery, plain rerun
+    admin:  upload a photo and save it, plain rerun
+
+Tabs are switched client-side without a rerun, and every rerun renders all
+tabs, so a rerun is the unit measured. Unless --no-media is given, the
+images a rerun references are then downloaded, as a browser would.
+
+Reports p50/p95/p99 rerun latency per action, reruns/s throughput, and the
+server's CPU and RSS (itself plus child processes such as the upload
+pool, read from /proc, so Linux only). Requires the `websockets` package.
+"""
+import argparse
+import asyncio
+import io
+import json
+import math
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+import uuid
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import datagen  # noqa: E402
+
+try:
+    import websockets
+except ImportError:
+    websockets = None
+
+from streamlit.proto.BackMsg_pb2 import BackMsg  # noqa: E402
+from streamlit.proto.ClientState_pb2 import ClientState  # noqa: E402
+from streamlit.proto.Common_pb2 import (  # noqa: E402
+    FileURLsRequest, FileUploaderState, UploadedFileInfo,
+)
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg  # noqa: E402
+from streamlit.proto.Selectbox_pb2 import Selectbox  # noqa: E402
+from streamlit.proto.WidgetStates_pb2 import WidgetState, WidgetStates  # noqa: E402
+
+VIEWER_LOGIN = ("Viewer Mode (View Memories)", "love123")
+ADMIN_LOGIN = ("Admin Mode (Add Memories)", "admin123")
+RERUN_TIMEOUT = 120
+WIDGET_TYPES = ("button", "selectbox", "text_input", "text_area", "file_uploader", "radio")
+# Newer Streamlit keeps selectbox values as the option text, older as the index
+SELECTBOX_BY_TEXT = "raw_value" in Selectbox.DESCRIPTOR.fields_by_name
+
+
+class Session:
+    """One simulated browser tab"""
+
+    def __init__(self, base_url, role, fetch_media):
+        self.base_url = base_url.rstrip("/")
+        self.role = role
+        self.fetch_media = fetch_media
+        self.socket = None
+        self.session_id = None
+        self.widgets = {}     # widget id -> element proto of the last rerun
+        self.states = {}      # widget id -> WidgetState sent on every rerun
+        self.media = []       # media URLs of the last rerun
+        self.exceptions = 0
+
+    async def connect(self):
+        ws_url = "ws" + self.base_url[len("http"):] + "/_stcore/stream"
+        self.socket = await websockets.connect(ws_url, subprotocols=["streamlit"], max_size=None)
+
+    async def close(self):
+        if self.socket is not None:
+            await self.socket.close()
+
+    def find(self, key=None, label=None):
+        """Widget id by user key (id suffix) or by label"""
+        for widget_id, element in self.widgets.items():
+            if key is not None and widget_id.endswith("-" + key):
+                return widget_id
+            if label is not None and getattr(element, "label", None) == label:
+                return widget_id
+        return None
+
+    async def _receive(self):
+        message = ForwardMsg()
+        message.ParseFromString(await self.socket.recv())
+        return message
+
+    async def rerun(self, triggers=(), extra_states=()):
+        """Send one rerun and wait for the script to finish; returns seconds"""
+        states = dict(self.states)
+        for widget_id in triggers:
+            states[widget_id] = WidgetState(id=widget_id, trigger_value=True)
+        for state in extra_states:
+            states[state.id] = state
+        back = BackMsg(rerun_script=ClientState(widget_states=WidgetStates(widgets=list(states.values()))))
+        start = time.perf_counter()
+        await self.socket.send(back.SerializeToString())
+        self.widgets, self.media = {}, []
+        while True:
+            message = await asyncio.wait_for(self._receive(), RERUN_TIMEOUT)
+            kind = message.WhichOneof("type")
+            if kind == "new_session":
+                self.session_id = message.new_session.initialize.session_id
+            elif kind == "delta" and message.delta.WhichOneof("type") == "new_element":
+                self._collect(message.delta.new_element)
+            elif kind == "script_finished":
+                if message.script_finished == ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                    self.widgets, self.media = {}, []   # st.rerun(): a second run follows
+                    continue
+                return time.perf_counter() - start
+
+    def _collect(self, element):
+        kind = element.WhichOneof("type")
+        if kind == "exception":
+            self.exceptions += 1
+        elif kind == "imgs":
+            self.media.extend(img.url for img in element.imgs.imgs if img.url.startswith("/"))
+        elif kind in WIDGET_TYPES:
+            widget = getattr(element, kind)
+            self.widgets[widget.id] = widget
+
+    async def download_media(self):
+        """Fetch this rerun's images in parallel; returns seconds"""
+        if not self.fetch_media or not self.media:
+            return None
+        start = time.perf_counter()
+        await asyncio.gather(*(asyncio.to_thread(_http_get, self.base_url + url) for url in self.media))
+        return time.perf_counter() - start
+
+    async def login(self, mode, password):
+        await self.rerun()
+        mode_id = self.find(key="login_mode")
+        if SELECTBOX_BY_TEXT:
+            mode_state = WidgetState(id=mode_id, string_value=mode)
+        else:
+            mode_state = WidgetState(id=mode_id, int_value=list(self.widgets[mode_id].options).index(mode))
+        self.states[mode_id] = mode_state
+        await self.rerun()
+        password_id = self.find(key="password_input")
+        elapsed = await self.rerun(
+            triggers=[self.find(key="login_btn")],
+            extra_states=[WidgetState(id=password_id, string_value=password)],
+        )
+        self.states = {}   # login widgets are gone once logged in
+        if self.find(key="viewer_logout") is None and self.find(key="admin_logout") is None:
+            raise RuntimeError(f"{self.role} login failed")
+        return elapsed
+
+    async def upload(self, label, name, data, mime="image/jpeg"):
+        """Upload a file the way the browser does; returns the widget state"""
+        request_id = uuid.uuid4().hex
+        await self.socket.send(BackMsg(file_urls_request=FileURLsRequest(
+            request_id=request_id, file_names=[name], session_id=self.session_id,
+        )).SerializeToString())
+        while True:
+            message = await asyncio.wait_for(self._receive(), RERUN_TIMEOUT)
+            if message.WhichOneof("type") == "file_urls_response" \
+                    and message.file_urls_response.response_id == request_id:
+                break
+        urls = message.file_urls_response.file_urls[0]
+        await asyncio.to_thread(_http_put_file, self.base_url + urls.upload_url, name, data, mime)
+        widget_id = self.find(label=label)
+        return WidgetState(id=widget_id, file_uploader_state_value=FileUploaderState(
+            uploaded_file_info=[UploadedFileInfo(file_id=urls.file_id, name=name, size=len(data), file_urls=urls)],
+        ))
+
+
+def _http_get(url):
+    with urllib.request.urlopen(url, timeout=RERUN_TIMEOUT) as response:
+        return response.read()
+
+
+def _http_put_file(url, name, data, mime):
+    boundary = uuid.uuid4().hex
+    body = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"{name}\"\r\n"
+            f"Content-Type: {mime}\r\n\r\n").encode() + data + f"\r\n--{boundary}--\r\n".encode()
+    request = urllib.request.Request(url, data=body, method="PUT", headers={
+        "Content-Type": f"multipart/form-data; boundary={boundary}",
+    })
+    with urllib.request.urlopen(request, timeout=RERUN_TIMEOUT) as response:
+        return response.read()
+
+
+def _test_photo(rng):
+    image = datagen._noise_image(rng, (2016, 1512))
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+async def viewer_actions(session, rng):
+    action = rng.choice(["surprise", "page", "rerun"])
+    if action == "surprise":
+        return action, await session.rerun(triggers=[session.find(key="surprise_btn")])
+    if action == "page":
+        next_id = session.find(key="photo_next")
+        if next_id is None or session.widgets[next_id].disabled:
+            next_id = session.find(key="photo_prev")
+        if next_id is not None and not session.widgets[next_id].disabled:
+            return action, await session.rerun(triggers=[next_id])
+    return "rerun", await session.rerun()
+
+
+async def admin_actions(session, rng):
+    if rng.random() < 0.5:
+        name = f"load-{uuid.uuid4().hex[:8]}.jpg"
+        photo = await session.upload("Choose photos", name, _test_photo(rng))
+        caption_id = session.find(label="Caption for these photos")
+        return "upload", await session.rerun(
+            triggers=[session.find(key="save_photo")],
+            extra_states=[photo, WidgetState(id=caption_id, string_value="Load test")],
+        )
+    return "rerun", await session.rerun()
+
+
+async def run_session(base_url, role, deadline, think, fetch_media, seed, samples, errors):
+    rng = random.Random(seed)
+    session = Session(base_url, role, fetch_media)
+    act = viewer_actions if role == "viewer" else admin_actions
+    try:
+        await session.connect()
+        samples.append((f"{role}:login", await session.login(*(VIEWER_LOGIN if role == "viewer" else ADMIN_LOGIN))))
+        while time.monotonic() < deadline:
+            await asyncio.sleep(rng.expovariate(1 / think) if think else 0)
+            action, elapsed = await act(session, rng)
+            samples.append((f"{role}:{action}", elapsed))
+            media = await session.download_media()
+            if media is not None:
+                samples.append((f"{role}:media", media))
+    except Exception as e:
+        errors.append(f"{role}: {type(e).__name__}: {e}")
+    finally:
+        if session.exceptions:
+            errors.append(f"{role}: {session.exceptions} exception element(s) rendered")
+        await session.close()
+
+
+def _process_tree(pid):
+    """pid plus all of its descendants, from /proc"""
+    children = {}
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            children.setdefault(ppid, []).append(int(entry))
+    tree, pending = [], [pid]
+    while pending:
+        current = pending.pop()
+        tree.append(current)
+        pending.extend(children.get(current, []))
+    return tree
+
+
+def _cpu_and_rss(pid):
+    """(CPU seconds, RSS bytes) summed over the process tree"""
+    cpu = rss = 0
+    ticks, page = os.sysconf("SC_CLK_TCK"), os.sysconf("SC_PAGE_SIZE")
+    for member in _process_tree(pid):
+        try:
+            with open(f"/proc/{member}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            with open(f"/proc/{member}/statm") as f:
+                rss += int(f.read().split()[1]) * page
+        except (OSError, IndexError, ValueError):
+            continue
+        cpu += (int(fields[11]) + int(fields[12])) / ticks   # utime + stime
+    return cpu, rss
+
+
+async def sample_server(pid, stop, usage):
+    """Append (cpu %, rss bytes) once a second until stop is set"""
+    last_cpu, last_time = _cpu_and_rss(pid)[0], time.monotonic()
+    while not stop.is_set():
+        try:
+            await asyncio.wait_for(stop.wait(), 1.0)
+        except asyncio.TimeoutError:
+            pass
+        cpu, rss = _cpu_and_rss(pid)
+        now = time.monotonic()
+        usage.append((100 * (cpu - last_cpu) / (now - last_time), rss))
+        last_cpu, last_time = cpu, now
+
+
+def _percentile(ordered, fraction):
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def summarize(samples, usage, duration):
+    by_name = {}
+    for name, seconds in samples:
+        by_name.setdefault(name, []).append(seconds)
+    actions = {}
+    for name, values in sorted(by_name.items()):
+        ordered = sorted(values)
+        actions[name] = {
+            "count": len(ordered),
+            "p50_ms": round(_percentile(ordered, 0.50) * 1000, 1),
+            "p95_ms": round(_percentile(ordered, 0.95) * 1000, 1),
+            "p99_ms": round(_percentile(ordered, 0.99) * 1000, 1),
+            "max_ms": round(ordered[-1] * 1000, 1),
+        }
+    reruns = sorted(seconds for name, seconds in samples if not name.endswith(":media"))
+    summary = {
+        "reruns": len(reruns),
+        "reruns_per_s": round(len(reruns) / duration, 2),
+        "actions": actions,
+    }
+    if reruns:
+        summary.update({f"rerun_{label}_ms": round(_percentile(reruns, fraction) * 1000, 1)
+                        for label, fraction in (("p50", 0.50), ("p95", 0.95), ("p99", 0.99))})
+    if usage:
+        summary["server_cpu_mean_pct"] = round(sum(cpu for cpu, _ in usage) / len(usage), 1)
+        summary["server_cpu_max_pct"] = round(max(cpu for cpu, _ in usage), 1)
+        summary["server_rss_max_mb"] = round(max(rss for _, rss in usage) / (1024 * 1024), 1)
+    return summary
+
+
+async def load(base_url, server_pid, args):
+    samples, errors, usage = [], [], []
+    stop = asyncio.Event()
+    sampler = None
+    if server_pid and os.path.isdir("/proc"):
+        sampler = asyncio.create_task(sample_server(server_pid, stop, usage))
+    start = time.monotonic()
+    deadline = start + args.duration
+    roles = ["viewer"] * args.viewers + ["admin"] * args.admins
+    await asyncio.gather(*(
+        run_session(base_url, role, deadline, args.think, not args.no_media, seed, samples, errors)
+        for seed, role in enumerate(roles)
+    ))
+    elapsed = time.monotonic() - start
+    stop.set()
+    if sampler:
+        await sampler
+    return summarize(samples, usage, elapsed), errors
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(work_dir, port):
+    os.makedirs(os.path.join(work_dir, ".streamlit"), exist_ok=True)
+    with open(os.path.join(work_dir, ".streamlit", "secrets.toml"), "w", encoding="utf-8") as f:
+        for key in ("CLOUDINARY_CLOUD_NAME", "CLOUDINARY_API_KEY", "CLOUDINARY_API_SECRET"):
+            f.write(f'{key} = "load-test"\n')
+    # Log to a file: an unread pipe fills up and stalls the server
+    log = open(os.path.join(work_dir, "server.log"), "wb")
+    server = subprocess.Popen([
+        sys.executable, "-m", "streamlit", "run", os.path.join(PACKAGE_DIR, "app.py"),
+        "--server.headless", "true", "--server.port", str(port),
+        "--server.enableXsrfProtection", "false",   # the uploader client sends no XSRF cookie
+        "--server.enableStaticServing", "true",     # as .streamlit/config.toml does
+        "--browser.gatherUsageStats", "false",
+    ], cwd=work_dir, stdout=log, stderr=subprocess.STDOUT)
+    log.close()
+    health = f"http://127.0.0.1:{port}/_stcore/health"
+    for _ in range(300):
+        if server.poll() is not None:
+            with open(os.path.join(work_dir, "server.log"), encoding="utf-8", errors="replace") as f:
+                raise RuntimeError("streamlit exited: " + f.read())
+        try:
+            _http_get(health)
+            return server
+        except OSError:
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError("streamlit did not become healthy")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--viewers", type=int, default=10)
+    parser.add_argument("--admins", type=int, default=1)
+    parser.add_argument("--duration", type=float, default=60, help="seconds of load after login")
+    parser.add_argument("--think", type=float, default=0.5, help="mean seconds between actions")
+    parser.add_argument("--items", type=int, default=1000, help="records per collection to generate")
+    parser.add_argument("--no-media", action="store_true", help="skip downloading rendered images")
+    parser.add_argument("--url", help="load an already running server instead of starting one")
+    parser.add_argument("--server-pid", type=int, help="with --url: sample this process's CPU/RSS")
+    parser.add_argument("--output", help="also write the summary as JSON")
+    args = parser.parse_args()
+    if websockets is None:
+        parser.error("the load test needs the websockets package (pip install websockets)")
+
+    work_dir = server = None
+    try:
+        if args.url:
+            base_url, server_pid = args.url, args.server_pid
+        else:
+            work_dir = tempfile.mkdtemp(prefix="locker-load-")
+            datagen.generate(work_dir, args.items)
+            port = _free_port()
+            server = start_server(work_dir, port)
+            base_url, server_pid = f"http://127.0.0.1:{port}", server.pid
+        summary, errors = asyncio.run(load(base_url, server_pid, args))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+        if work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    summary.update(viewers=args.viewers, admins=args.admins, duration=args.duration, think=args.think)
+    print(f"{summary['reruns']} reruns, {summary['reruns_per_s']} reruns/s")
+    for name, row in summary["actions"].items():
+        print(f"{name:22s} n={row['count']:<6d} p50 {row['p50_ms']:8.1f} ms  p95 {row['p95_ms']:8.1f} ms  "
+              f"p99 {row['p99_ms']:8.1f} ms  max {row['max_ms']:8.1f} ms")
+    if "server_cpu_mean_pct" in summary:
+        print(f"server CPU mean {summary['server_cpu_mean_pct']}% max {summary['server_cpu_max_pct']}%, "
+              f"RSS max {summary['server_rss_max_mb']} MB")
+    for error in errors:
+        print("ERROR", error)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(dict(summary, errors=errors), f, indent=2, sort_keys=True)
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
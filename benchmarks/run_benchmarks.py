@@ -0,0 +1,198 @@
+"""Benchmark the memory locker against synthetic datasets.
+
+Usage:
+    python benchmarks/run_benchmarks.py [--sizes 100,1000,10000] [--repeat 5]
+        [--output benchmarks/results.json] [--baseline benchmarks/baseline.json]
+        [--threshold 0.25] [--save-baseline]
+
+For each dataset size this times the storage layer (cold and cached loads,
+full saves, single-record adds), the image pipeline (upload encoding and
+stored-variant reads), and full Streamlit reruns of display_photos,
+display_letters and show_random_memory driven through AppTest.
+
+Results are written as JSON ({"metrics": {name: median seconds}, ...}). When
+a baseline file exists, any metric slower than baseline * (1 + threshold)
+is reported and the script exits with status 1.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PACKAGE_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import datagen  # noqa: E402
+
+# Script run by AppTest for each rerun benchmark; {call} renders one view.
+APP_SCRIPT = """
+import sys
+sys.path.insert(0, {package_dir!r})
+import app
+app.init_session_state()
+{call}
+"""
+RERUN_VIEWS = {
+    "display_photos": "app.display_photos()",
+    "display_letters": "app.display_letters()",
+    "show_random_memory": "app.show_random_memory()",
+}
+
+
+def timed(fn, repeat, setup=None):
+    """Median wall time of fn() over `repeat` runs"""
+    samples = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def bench_storage(results, size, repeat):
+    import repository
+
+    def cold():
+        repository.invalidate()
+
+    for filename in ("photos.json", "letters.json"):
+        name = filename.split(".")[0]
+        results[f"{size}/load_{name}_cold"] = timed(lambda: repository.load_collection(filename), repeat, cold)
+        results[f"{size}/load_{name}_cached"] = timed(lambda: repository.load_collection(filename), repeat)
+        records = repository.load_collection(filename)
+        results[f"{size}/save_{name}"] = timed(lambda: repository.save_collection(filename, records), repeat)
+
+    letter = {"date": "2024-02-14", "title": "Bench", "content": "x" * 500,
+              "created_date": "2024-02-14 00:00:00"}
+
+    def add_and_delete():
+        stored = repository.add_record("letters.json", letter)
+        repository.delete_record("letters.json", stored["id"])
+
+    results[f"{size}/add_delete_letter"] = timed(add_and_delete, repeat)
+
+
+def bench_images(results, size, repeat):
+    from PIL import Image
+    from blob_store import get_blob
+    from image_pipeline import VARIANT_SIZES, available_formats, pick_variant, process_upload
+    import repository
+
+    image = Image.effect_noise((4032, 3024), 40).convert("RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=90)
+    upload = buffer.getvalue()
+    results[f"{size}/encode_upload_12mp"] = timed(lambda: process_upload("bench.jpg", upload), repeat)
+    for output_format in available_formats():
+        results[f"{size}/encode_upload_12mp_{output_format}"] = timed(
+            lambda: process_upload("bench.jpg", upload, output_format), repeat)
+
+    photos = repository.query_collection("photos.json", limit=12)
+
+    def read_grid_page():
+        for photo in photos:
+            get_blob(pick_variant(photo, VARIANT_SIZES['grid'][0])['blob'])
+
+    results[f"{size}/read_grid_page"] = timed(read_grid_page, repeat)
+
+
+def bench_reruns(results, size, repeat):
+    from streamlit.testing.v1 import AppTest
+
+    for view, call in RERUN_VIEWS.items():
+        script = APP_SCRIPT.format(package_dir=PACKAGE_DIR, call=call)
+        at = AppTest.from_string(script, default_timeout=300)
+        for key in ("CLOUDINARY_CLOUD_NAME", "CLOUDINARY_API_KEY", "CLOUDINARY_API_SECRET"):
+            at.secrets[key] = "bench"
+        at.run()  # warm-up: imports app and fills the caches
+        if at.exception:
+            raise RuntimeError(f"{view} raised: {at.exception[0].message}")
+        results[f"{size}/rerun_{view}"] = timed(at.run, repeat)
+
+
+def run(sizes, repeat):
+    metrics = {}
+    cwd = os.getcwd()
+    for size in sizes:
+        work_dir = tempfile.mkdtemp(prefix=f"locker-bench-{size}-")
+        try:
+            datagen.generate(work_dir, size)
+            os.chdir(work_dir)
+            import memory_index
+            import repository
+            repository.invalidate()
+            memory_index.reset()
+            bench_storage(metrics, size, repeat)
+            bench_images(metrics, size, repeat)
+            bench_reruns(metrics, size, repeat)
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(work_dir, ignore_errors=True)
+        print(f"size {size}: done")
+    return metrics
+
+
+def compare(metrics, baseline, threshold):
+    """Return [(name, baseline, current)] for metrics that regressed"""
+    regressions = []
+    for name, value in metrics.items():
+        previous = baseline.get(name)
+        if previous and value > previous * (1 + threshold):
+            regressions.append((name, previous, value))
+    return regressions
+
+
+def main():
+    bench_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="100,1000,10000")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", default=os.path.join(bench_dir, "results.json"))
+    parser.add_argument("--baseline", default=os.path.join(bench_dir, "baseline.json"))
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="allowed slowdown before a metric counts as a regression")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="also write these results as the new baseline")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    metrics = run(sizes, args.repeat)
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": args.repeat,
+        "metrics": metrics,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    for name in sorted(metrics):
+        print(f"{name:45s} {metrics[name] * 1000:10.2f} ms")
+    print(f"Results written to {args.output}")
+
+    if args.save_baseline:
+        shutil.copyfile(args.output, args.baseline)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["metrics"]
+        regressions = compare(metrics, baseline, args.threshold)
+        for name, previous, value in regressions:
+            print(f"REGRESSION {name}: {previous * 1000:.2f} ms -> {value * 1000:.2f} ms")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+import base64
+import hashlib
+import os
+import threading
+import time
+
+# Content-addressed storage for photo bytes.
+# Each blob lives at data/blobs/<first two hex chars>/<sha256>.<ext>, so the
+# JSON index only carries a short reference instead of the image itself.
+BLOB_DIR = os.path.join("data", "blobs")
+# Unused blobs younger than this are left alone by remove_unused_blobs: an
+# upload stores its renditions before it adds the photo record
+GC_MIN_AGE = 60 * 60
+
+
+def blob_path(ref):
+    """Return the file path for a blob reference ("<sha256>.<ext>")"""
+    return os.path.join(BLOB_DIR, ref[:2], ref)
+
+
+def put_blob(data, ext="jpg"):
+    """Store raw bytes and return their reference (idempotent)"""
+    digest = hashlib.sha256(data).hexdigest()
+    ref = f"{digest}.{ext}"
+    path = blob_path(ref)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Per thread: sessions storing the same photo at once share the path
+        tmp_path = f"{path}.tmp{os.getpid()}.{threading.get_ident()}"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    return ref
+
+
+def get_blob(ref):
+    """Read the bytes for a blob reference, or None if it is missing"""
+    try:
+        with open(blob_path(ref), 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def blob_exists(ref):
+    return os.path.exists(blob_path(ref))
+
+
+def delete_blob(ref):
+    """Remove a blob file; missing blobs are ignored"""
+    try:
+        os.remove(blob_path(ref))
+    except FileNotFoundError:
+        pass
+
+
+def remove_unused_blobs(used_refs, min_age=GC_MIN_AGE):
+    """Delete blobs (and stale temp files) not in used_refs and older than
+    min_age seconds. Returns (files removed, bytes freed)."""
+    removed = freed = 0
+    cutoff = time.time() - min_age
+    if not os.path.isdir(BLOB_DIR):
+        return removed, freed
+    for shard in os.listdir(BLOB_DIR):
+        shard_dir = os.path.join(BLOB_DIR, shard)
+        if not os.path.isdir(shard_dir):
+            continue
+        for name in os.listdir(shard_dir):
+            path = os.path.join(shard_dir, name)
+            if name in used_refs:
+                continue
+            try:
+                stat = os.stat(path)
+                if stat.st_mtime >= cutoff:
+                    continue
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            removed += 1
+            freed += stat.st_size
+    return removed, freed
+
+
+def migrate_base64_photos(photos):
+    """Move inline base64_data payloads into the blob store.
+
+    Mutates the photo records in place and returns how many were migrated.
+    """
+    migrated = 0
+    for photo in photos:
+        base64_data = photo.get('base64_data')
+        if not base64_data:
+            continue
+        img_bytes = base64.b64decode(base64_data)
+        photo['blob'] = put_blob(img_bytes)
+        photo['blob_size'] = len(img_bytes)
+        photo['storage_type'] = 'blob'
+        del photo['base64_data']
+        migrated += 1
+    return migrated
+
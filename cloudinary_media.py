@@ -0,0 +1,75 @@
+import cloudinary
+import cloudinary.uploader
+import cloudinary.utils
+
+# Cloudinary media backend (see media_store.py for the backend-neutral API).
+# Videos are sent with Cloudinary's chunked upload protocol (Content-Range +
+# X-Unique-Upload-Id) and streamed back from its CDN. Point
+# CLOUDINARY_UPLOAD_PREFIX at tools/fake_cloudinary.py to test locally.
+NAME = "cloudinary"
+LABEL = "Cloudinary"
+FOLDER = "memory_locker_videos"
+POSTER_WIDTH = 480
+
+
+def configure(settings):
+    """Set credentials from the app's secrets (CLOUDINARY_* keys)"""
+    cloudinary.config(
+        cloud_name=settings.get("CLOUDINARY_CLOUD_NAME"),
+        api_key=settings.get("CLOUDINARY_API_KEY"),
+        api_secret=settings.get("CLOUDINARY_API_SECRET"),
+        upload_prefix=settings.get("CLOUDINARY_UPLOAD_PREFIX"),  # e.g. tools/fake_cloudinary.py
+        secure=True,
+    )
+
+
+def new_upload_id():
+    return cloudinary.utils.random_public_id()
+
+
+def upload_chunk(job, chunk, start):
+    """Send one chunk; Cloudinary assembles them by upload id"""
+    end = start + len(chunk) - 1
+    options = {
+        "resource_type": "video",
+        "folder": FOLDER,
+        "http_headers": {
+            "Content-Range": f"bytes {start}-{end}/{job['total']}",
+            "X-Unique-Upload-Id": job["upload_id"],
+        },
+    }
+    if job["public_id"]:
+        options["public_id"] = job["public_id"]
+    return cloudinary.uploader.upload_large_part((job["name"], chunk), **options)
+
+
+def finish(job, response):
+    """Record fields for a completed upload, from the last chunk's response"""
+    video = {
+        "url": response["secure_url"],
+        "public_id": response.get("public_id"),
+        "duration": response.get("duration"),
+    }
+    if response.get("width") and response.get("height"):
+        video["size"] = [response["width"], response["height"]]
+    video["poster_url"] = poster_url(video)
+    return video
+
+
+def poster_url(video):
+    """A still frame for the video, or None if its URL isn't a Cloudinary one.
+
+    Cloudinary derives one from any delivery URL by adding a transformation
+    and swapping the extension, so records without a stored poster work too.
+    """
+    url = video.get('url') or ""
+    if "/video/upload/" not in url:
+        return None
+    base, path = url.split("/video/upload/", 1)
+    return f"{base}/video/upload/so_auto,w_{POSTER_WIDTH},c_limit/{path.rsplit('.', 1)[0]}.jpg"
+
+
+def delete(video):
+    """Remove the asset from Cloudinary (records without a public_id are left alone)"""
+    if video.get('public_id'):
+        cloudinary.uploader.destroy(video['public_id'], resource_type="video", invalidate=True)
@@ -0,0 +1,183 @@
+import os
+from bisect import bisect_left, bisect_right, insort
+
+from derived_index import DerivedIndex
+
+# Process-wide timeline of every memory as (date, type, id) tuples kept in
+# sorted order, so range, month and "on this day" lookups are bisects instead
+# of scanning and sorting the collections. Month buckets keep running counts.
+# Like the search index it is loaded, saved to INDEX_PATH and kept current by
+# derived_index.DerivedIndex.
+INDEX_PATH = os.path.join("data", "date_index.json")
+INDEX_VERSION = 2
+COLLECTIONS = {
+    "photo": "photos.json",
+    "video": "videos.json",
+    "letter": "letters.json",
+}
+END = "\uffff"   # sorts after any date suffix, for inclusive upper bounds
+
+_entries = []    # sorted [(date, type, id), ...]; undated or id-less records are skipped
+_months = {}     # "YYYY-MM" -> {type: count}
+
+
+def _date_of(record):
+    """The record's YYYY-MM-DD date, or None if it can't be placed on the timeline"""
+    if record.get('id') is None:
+        return None
+    value = record.get('date')
+    if isinstance(value, str) and len(value) >= 10 and value[:4].isdigit() and value[4] == "-" and value[7] == "-":
+        return value[:10]
+    return None
+
+
+def _add_record(memory_type, record):
+    day = _date_of(record)
+    if day is None:
+        return
+    insort(_entries, (day, memory_type, record.get('id')))
+    bucket = _months.setdefault(day[:7], {})
+    bucket[memory_type] = bucket.get(memory_type, 0) + 1
+
+
+def _remove_record(memory_type, record):
+    day = _date_of(record)
+    if day is None:
+        return
+    entry = (day, memory_type, record.get('id'))
+    position = bisect_left(_entries, entry)
+    if position == len(_entries) or _entries[position] != entry:
+        return
+    del _entries[position]
+    bucket = _months[day[:7]]
+    bucket[memory_type] -= 1
+    if not bucket[memory_type]:
+        del bucket[memory_type]
+    if not bucket:
+        del _months[day[:7]]
+
+
+def _drop_type(memory_type):
+    _entries[:] = [entry for entry in _entries if entry[1] != memory_type]
+    for month in list(_months):
+        _months[month].pop(memory_type, None)
+        if not _months[month]:
+            del _months[month]
+
+
+def _type_for(filename):
+    for memory_type, name in COLLECTIONS.items():
+        if name == filename:
+            return memory_type
+    return None
+
+
+# Callbacks for DerivedIndex
+def _clear(filename):
+    if filename is None:
+        _entries.clear()
+        _months.clear()
+    else:
+        _drop_type(_type_for(filename))
+
+
+def _add(filename, records):
+    memory_type = _type_for(filename)
+    records = list(records)
+    if len(records) == 1:
+        _add_record(memory_type, records[0])
+        return
+    # Bulk loads: one sort instead of an insort per record
+    for record in records:
+        day = _date_of(record)
+        if day is not None:
+            _entries.append((day, memory_type, record.get('id')))
+            bucket = _months.setdefault(day[:7], {})
+            bucket[memory_type] = bucket.get(memory_type, 0) + 1
+    _entries.sort()
+
+
+def _remove(filename, records):
+    memory_type = _type_for(filename)
+    for record in records:
+        _remove_record(memory_type, record)
+
+
+def _dump():
+    return {"months": _months, "entries": _entries}
+
+
+def _load(state):
+    _entries.extend(tuple(entry) for entry in state["entries"])
+    _months.update(state["months"])
+
+
+_index = DerivedIndex(COLLECTIONS.values(), _clear, _add, _remove,
+                      path=INDEX_PATH, version=INDEX_VERSION, dump=_dump, load=_load)
+
+
+def rebuild():
+    """Re-index every collection from scratch and save the index"""
+    _index.rebuild()
+    return len(_entries)
+
+
+def in_range(start=None, end=None, types=None, descending=True, limit=None, offset=0):
+    """Entries dated start..end inclusive (either may be None, or a prefix
+    such as "2024" or "2024-02"), newest first unless descending=False."""
+    _index.ensure_current()
+    with _index.lock:
+        low = 0 if start is None else bisect_left(_entries, (start,))
+        high = len(_entries) if end is None else bisect_right(_entries, (end + END,))
+        matches = _entries[low:high]
+    if types is not None:
+        matches = [entry for entry in matches if entry[1] in types]
+    if descending:
+        matches.reverse()
+    stop = None if limit is None else offset + limit
+    return matches[offset:stop]
+
+
+def month_buckets():
+    """[(YYYY-MM, {type: count}), ...] newest month first"""
+    _index.ensure_current()
+    with _index.lock:
+        return [(month, dict(_months[month])) for month in sorted(_months, reverse=True)]
+
+
+def year_buckets():
+    """[(YYYY, {type: count}), ...] newest year first"""
+    years = {}
+    for month, counts in month_buckets():
+        totals = years.setdefault(month[:4], {})
+        for memory_type, count in counts.items():
+            totals[memory_type] = totals.get(memory_type, 0) + count
+    return list(years.items())
+
+
+def on_this_day(day, types=None):
+    """Entries from earlier years on day's month and day, most recent first.
+
+    One bisect per year that has memories, so the cost follows the number of
+    years and matches rather than the size of the locker.
+    """
+    _index.ensure_current()
+    month_day = day.strftime("%m-%d")
+    matches = []
+    with _index.lock:
+        if not _entries:
+            return []
+        first_year, last_year = int(_entries[0][0][:4]), min(int(_entries[-1][0][:4]), day.year - 1)
+        for year in range(last_year, first_year - 1, -1):
+            prefix = f"{year:04d}-{month_day}"
+            low = bisect_left(_entries, (prefix,))
+            high = bisect_right(_entries, (prefix + END,))
+            matches.extend(reversed(_entries[low:high]))
+    if types is not None:
+        matches = [entry for entry in matches if entry[1] in types]
+    return matches
+
+
+def reset():
+    """Forget the in-memory index; it is reloaded on next use"""
+    _index.reset()
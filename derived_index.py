@@ -0,0 +1,174 @@
+import atexit
+import json
+import os
+import threading
+import time
+
+from repository import BACKEND_NAME, load_collection, collection_signature, on_write
+
+# Shared plumbing for process-wide indexes derived from the collections
+# (search_index.py is an example). An index module supplies callbacks over
+# its own in-memory state:
+#   clear(filename)          drop one collection's part (None: everything)
+#   add(filename, records)   index records
+#   remove(filename, records)  un-index records
+#   dump() / load(state)     JSON-able copy of the state, and adopting one
+# and this keeps it current:
+#   * On first use the state is loaded from `path` (if the index is
+#     persisted); collections whose signature (repository.collection_signature)
+#     differs from the saved one are re-indexed from scratch.
+#   * Writes made through this process's repository are applied
+#     incrementally by a write callback.
+#   * Writes made by other processes (manage.py, a second server) are
+#     caught by re-checking the signatures, at most every CHECK_INTERVAL
+#     seconds, when the index is queried; changed collections are re-indexed.
+#   * Saving is debounced: a write marks the index dirty and a background
+#     timer saves it FLUSH_DELAY seconds later, so a burst of writes costs
+#     one save and none happens inside the request. Dirty indexes are also
+#     saved at exit. A save missed by a crash only costs a re-index of the
+#     affected collections on the next start.
+# (A write by another process that lands between one of ours and the
+# signature read after it goes unnoticed until the next write or rebuild.)
+FLUSH_DELAY = float(os.environ.get("MEMORY_LOCKER_INDEX_FLUSH_SECONDS", 5))
+CHECK_INTERVAL = 1.0
+
+_indexes = []
+
+
+def _normalized(signature):
+    # Signatures are compared with saved (JSON round-tripped) copies
+    return json.loads(json.dumps(signature))
+
+
+class DerivedIndex:
+    def __init__(self, filenames, clear, add, remove, path=None, version=1, dump=None, load=None):
+        self.filenames = list(filenames)
+        self.path = path
+        self.version = version
+        self._clear, self._add, self._remove = clear, add, remove
+        self._dump, self._load = dump, load
+        self.lock = threading.RLock()
+        self._save_lock = threading.Lock()   # keeps saves in order
+        self.built = False
+        self._signatures = {}
+        self._checked = 0.0
+        self._dirty = False
+        self._timer = None
+        on_write(self._on_write)
+        _indexes.append(self)
+
+    def _load_persisted(self):
+        """Adopt the saved state; returns the saved signatures ({} if unusable)"""
+        if not self.path:
+            return {}
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if saved.get("version") != self.version or saved.get("backend") != BACKEND_NAME:
+            return {}
+        try:
+            self._load(saved["state"])
+            return dict(saved["signatures"])
+        except (KeyError, TypeError, ValueError):
+            self._clear(None)
+            return {}
+
+    def _reindex(self, filename):
+        self._clear(filename)
+        self._add(filename, load_collection(filename))
+
+    def _refresh(self, saved_signatures):
+        """Re-index collections whose signature moved; returns how many did"""
+        stale = 0
+        for filename in self.filenames:
+            signature = _normalized(collection_signature(filename))
+            if saved_signatures.get(filename) != signature:
+                self._reindex(filename)
+                stale += 1
+            self._signatures[filename] = signature
+        self._checked = time.monotonic()
+        return stale
+
+    def ensure_current(self):
+        """Build or load the index on first use, then pick up outside writes"""
+        if self.built and time.monotonic() - self._checked < CHECK_INTERVAL:
+            return
+        with self.lock:
+            if not self.built:
+                self._clear(None)
+                if self._refresh(self._load_persisted()):
+                    self._mark_dirty()
+                self.built = True
+            elif time.monotonic() - self._checked >= CHECK_INTERVAL:
+                if self._refresh(dict(self._signatures)):
+                    self._mark_dirty()
+
+    def rebuild(self):
+        """Re-index every collection from scratch and save now"""
+        with self.lock:
+            self._clear(None)
+            self._refresh({})
+            self.built = True
+            self._dirty = True
+        self.flush()
+
+    def reset(self):
+        """Forget the in-memory state; it is reloaded on next use"""
+        with self.lock:
+            self._clear(None)
+            self._signatures.clear()
+            self.built = False
+            self._dirty = False
+
+    def _on_write(self, filename, op, records):
+        if filename not in self.filenames or not self.built:
+            return
+        with self.lock:
+            if op == "add":
+                self._add(filename, records)
+            elif op == "delete":
+                self._remove(filename, records)
+            else:  # replace
+                self._clear(filename)
+                self._add(filename, records)
+            self._signatures[filename] = _normalized(collection_signature(filename))
+            self._mark_dirty()
+
+    def _mark_dirty(self):
+        if not self.path:
+            return
+        self._dirty = True
+        if self._timer is None:
+            self._timer = threading.Timer(FLUSH_DELAY, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self):
+        """Save the index now if it has unsaved changes"""
+        with self._save_lock:
+            # Only serialising holds up queries; the file is written after
+            with self.lock:
+                self._timer = None
+                if not self._dirty or not self.path:
+                    return
+                payload = json.dumps({
+                    "version": self.version,
+                    "backend": BACKEND_NAME,
+                    "signatures": self._signatures,
+                    "state": self._dump(),
+                }, ensure_ascii=False, separators=(",", ":"))
+                self._dirty = False
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            temp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                f.write(payload)
+            os.replace(temp_path, self.path)
+
+
+@atexit.register
+def flush_all():
+    """Save every index with unsaved changes"""
+    for index in _indexes:
+        index.flush()
@@ -0,0 +1,275 @@
+import base64
+import io
+import os
+
+from derived_index import DerivedIndex
+from repository import load_collection, update_records
+
+# Process-wide index of photo content hashes, used to catch re-uploads:
+#   source_sha256  SHA-256 of the uploaded file, so byte-identical re-uploads
+#                  are caught before they are even decoded
+#   sha256         SHA-256 of the stored full rendition (exact duplicates)
+#   phash          64-bit difference hash (near duplicates: the same picture
+#                  re-exported with other EXIF, quality or size)
+# Near-duplicate lookups split each phash into BANDS 8-bit bands. Two hashes
+# within NEAR_DISTANCE bits differ in at most NEAR_DISTANCE bands, so they
+# share at least one, and only photos sharing a band are compared.
+# Like the date index it is loaded, saved to INDEX_PATH and kept current by
+# derived_index.DerivedIndex.
+INDEX_PATH = os.path.join("data", "photo_hashes.json")
+INDEX_VERSION = 2
+FILENAME = "photos.json"
+HASH_FIELDS = ("sha256", "source_sha256", "phash")
+BANDS = 8
+NEAR_DISTANCE = 6
+
+_hashes = {}     # photo id -> [sha256, source_sha256, phash]
+_exact = {}      # sha256 or source_sha256 -> [photo ids]
+_bands = [{} for _ in range(BANDS)]   # band value -> [photo ids], per band
+
+
+def distance(phash_a, phash_b):
+    """Number of differing bits between two hex perceptual hashes"""
+    return bin(int(phash_a, 16) ^ int(phash_b, 16)).count("1")
+
+
+def _band_values(phash):
+    value = int(phash, 16)
+    return [(value >> (8 * band)) & 0xFF for band in range(BANDS)]
+
+
+def compare(a, b):
+    """("exact", 0), ("near", bits) or None for two {field: hash} dicts"""
+    for field in ("sha256", "source_sha256"):
+        if a.get(field) and a.get(field) == b.get(field):
+            return "exact", 0
+    if a.get("phash") and b.get("phash"):
+        bits = distance(a["phash"], b["phash"])
+        if bits <= NEAR_DISTANCE:
+            return "near", bits
+    return None
+
+
+def _add_record(record):
+    record_id = record.get('id')
+    values = [record.get(field) for field in HASH_FIELDS]
+    if record_id is None or not any(values):
+        return
+    _hashes[record_id] = values
+    for digest in values[:2]:
+        if digest:
+            _exact.setdefault(digest, []).append(record_id)
+    if values[2]:
+        for band, value in zip(_bands, _band_values(values[2])):
+            band.setdefault(value, []).append(record_id)
+
+
+def _discard(table, key, record_id):
+    ids = table.get(key)
+    if ids and record_id in ids:
+        ids.remove(record_id)
+        if not ids:
+            del table[key]
+
+
+def _remove_record(record):
+    values = _hashes.pop(record.get('id'), None)
+    if values is None:
+        return
+    for digest in values[:2]:
+        if digest:
+            _discard(_exact, digest, record['id'])
+    if values[2]:
+        for band, value in zip(_bands, _band_values(values[2])):
+            _discard(band, value, record['id'])
+
+
+# Callbacks for DerivedIndex (there is only the one collection)
+def _clear(filename):
+    _hashes.clear()
+    _exact.clear()
+    for band in _bands:
+        band.clear()
+
+
+def _add(filename, records):
+    for record in records:
+        _add_record(record)
+
+
+def _remove(filename, records):
+    for record in records:
+        _remove_record(record)
+
+
+def _dump():
+    return {"hashes": [[record_id] + values for record_id, values in _hashes.items()]}
+
+
+def _load(state):
+    for record_id, *values in state["hashes"]:
+        _add_record(dict(zip(HASH_FIELDS, values), id=record_id))
+
+
+_index = DerivedIndex([FILENAME], _clear, _add, _remove,
+                      path=INDEX_PATH, version=INDEX_VERSION, dump=_dump, load=_load)
+
+
+def rebuild():
+    """Re-index the photos from scratch and save the index"""
+    _index.rebuild()
+    return len(_hashes)
+
+
+def match(hashes):
+    """Closest stored photo for {field: hash}: (kind, photo id, bits) or None.
+
+    kind is "exact" for identical file or rendition bytes, else "near" for a
+    perceptual hash within NEAR_DISTANCE bits.
+    """
+    _index.ensure_current()
+    with _index.lock:
+        for field in ("sha256", "source_sha256"):
+            ids = _exact.get(hashes.get(field)) if hashes.get(field) else None
+            if ids:
+                return "exact", ids[0], 0
+        if not hashes.get("phash"):
+            return None
+        best = None
+        candidates = set()
+        for band, value in zip(_bands, _band_values(hashes["phash"])):
+            candidates.update(band.get(value, ()))
+        for record_id in candidates:
+            bits = distance(hashes["phash"], _hashes[record_id][2])
+            if bits <= NEAR_DISTANCE and (best is None or bits < best[2]):
+                best = ("near", record_id, bits)
+        return best
+
+
+def _blob_sizes(photo):
+    """{blob ref: bytes} for every rendition a photo stores"""
+    sizes = {variant['blob']: variant.get('bytes', 0) for variant in photo.get('variants', {}).values()}
+    if photo.get('blob'):
+        sizes.setdefault(photo['blob'], photo.get('blob_size', 0))
+    if photo.get('base64_data'):
+        sizes[("inline", photo.get('id'))] = len(photo['base64_data']) * 3 // 4
+    return sizes
+
+
+def _image_hashes(photo):
+    """Compute the hash fields a photo is missing, from its stored image"""
+    from blob_store import get_blob
+    from image_pipeline import perceptual_hash
+    from PIL import Image
+
+    hashes = {}
+    if photo.get('blob') and not photo.get('sha256'):
+        # Blob references are "<sha256 of the full rendition>.<ext>"
+        hashes['sha256'] = photo['blob'].split(".")[0]
+    if not photo.get('phash'):
+        variants = photo.get('variants') or {}
+        smallest = min(variants.values(), key=lambda v: v['size'][0] * v['size'][1], default=None)
+        if smallest is not None:
+            data = get_blob(smallest['blob'])
+        elif photo.get('blob'):
+            data = get_blob(photo['blob'])
+        elif photo.get('base64_data'):
+            data = base64.b64decode(photo['base64_data'])
+        else:
+            data = None
+        if data is not None:
+            try:
+                hashes['phash'] = perceptual_hash(Image.open(io.BytesIO(data)))
+            except Exception:
+                pass  # unreadable image: leave it unhashed
+    return hashes
+
+
+def scan(backfill=True):
+    """Find duplicate groups among the stored photos.
+
+    Photos saved before hashing existed get their hashes computed from the
+    stored renditions (and saved, unless backfill=False). Each group keeps
+    its oldest photo; the rest are reported with the bytes deleting them
+    would free, counting only blobs no kept photo shares. Returns
+    {"groups": [{"keep": id, "duplicates": [(id, kind, bits)]}],
+     "reclaimable_bytes": n, "hashed": photos newly hashed}.
+    """
+    photos = load_collection(FILENAME)
+    updated = []
+    for i, photo in enumerate(photos):
+        missing = _image_hashes(photo)
+        if missing:
+            photos[i] = dict(photo, **missing)
+            updated.append(photos[i])
+    if updated and backfill:
+        update_records(FILENAME, [photo for photo in updated if photo.get('id') is not None])
+
+    # Union photos that match exactly or within NEAR_DISTANCE bits
+    parent = list(range(len(photos)))
+
+    def root(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    exact = {}
+    bands = [{} for _ in range(BANDS)]
+    links = {}
+    for i, photo in enumerate(photos):
+        for field in ("sha256", "source_sha256"):
+            if photo.get(field):
+                exact.setdefault(photo[field], []).append(i)
+        if photo.get('phash'):
+            for band, value in zip(bands, _band_values(photo['phash'])):
+                band.setdefault(value, []).append(i)
+    for members in exact.values():
+        for i in members[1:]:
+            links[(members[0], i)] = ("exact", 0)
+    for band in bands:
+        for members in band.values():
+            for position, i in enumerate(members):
+                for j in members[:position]:
+                    if (j, i) not in links:
+                        found = compare(photos[j], photos[i])
+                        if found:
+                            links[(j, i)] = found
+    for (i, j) in links:
+        parent[root(j)] = root(i)
+
+    grouped = {}
+    for i in range(len(photos)):
+        grouped.setdefault(root(i), []).append(i)
+    groups = []
+    duplicate_positions = set()
+    for members in grouped.values():
+        if len(members) < 2:
+            continue
+        keep = members[0]   # collections keep insertion order: oldest first
+        duplicates = []
+        for i in members[1:]:
+            kind, bits = links.get((keep, i)) or compare(photos[keep], photos[i]) or ("near", None)
+            duplicates.append((photos[i].get('id'), kind, bits))
+            duplicate_positions.add(i)
+        groups.append({"keep": photos[keep].get('id'), "duplicates": duplicates})
+
+    kept_refs = set()
+    for i, photo in enumerate(photos):
+        if i not in duplicate_positions:
+            kept_refs.update(_blob_sizes(photo))
+    reclaimable = {}
+    for i in duplicate_positions:
+        for ref, size in _blob_sizes(photos[i]).items():
+            if ref not in kept_refs:
+                reclaimable[ref] = size
+    return {
+        "groups": groups,
+        "reclaimable_bytes": sum(reclaimable.values()),
+        "hashed": len(updated),
+    }
+
+
+def reset():
+    """Forget the in-memory index; it is reloaded on next use"""
+    _index.reset()
@@ -0,0 +1,432 @@
+import hashlib
+import io
+import multiprocessing
+import os
+import sys
+import threading
+import time
+import types
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+
+from PIL import Image, ExifTags, features
+
+import memprof
+from blob_store import put_blob, get_blob
+
+# Rendition sizes produced once at upload time (bounding boxes, aspect kept).
+# "grid" matches the viewer's photo grid, "preview" the upload/surprise views
+# and "full" is the stored master (max 800px on the longest side).
+VARIANT_SIZES = {
+    "grid": (300, 200),
+    "preview": (600, 600),
+    "full": (800, 800),
+}
+JPEG_QUALITY = 85
+PHASH_SIZE = 8   # difference hash of a 9x8 thumbnail -> 64 bits
+
+# Output codecs: name -> (Pillow format, MIME type, blob extension, save options)
+OUTPUT_FORMATS = {
+    "jpeg": ("JPEG", "image/jpeg", "jpg", {"optimize": True}),
+    "progressive-jpeg": ("JPEG", "image/jpeg", "jpg", {"optimize": True, "progressive": True}),
+    "webp": ("WEBP", "image/webp", "webp", {"method": 4}),
+    "avif": ("AVIF", "image/avif", "avif", {"speed": 6}),
+}
+# Default codec and byte budget for the full rendition (0 = fixed quality).
+# With a budget each rendition is encoded at the highest quality between
+# MIN_QUALITY and its format's usual quality that fits; smaller renditions get
+# the budget scaled by their share of the full rendition's pixels.
+OUTPUT_FORMAT = os.environ.get("MEMORY_LOCKER_IMAGE_FORMAT", "jpeg")
+BYTE_BUDGET = int(float(os.environ.get("MEMORY_LOCKER_IMAGE_BUDGET_KB", 0)) * 1024)
+FORMAT_QUALITY = {"jpeg": JPEG_QUALITY, "progressive-jpeg": JPEG_QUALITY, "webp": 80, "avif": 60}
+MIN_QUALITY = 30
+
+# Decoding limits. Uploads over MAX_PIXELS are rejected before any pixel is
+# decoded (Pillow's own decompression-bomb check uses the same limit). JPEGs
+# are decoded by libjpeg at 1/2, 1/4 or 1/8 scale when that still covers the
+# largest rendition, so a 50 MP photo never exists at full size in memory.
+# Decodes in this process and the upload workers share DECODE_BUDGET bytes
+# of estimated working memory (DECODE_COPIES buffers of the decoded size); a
+# decode waits until its share is free, and one larger than the whole budget
+# runs on its own.
+MAX_PIXELS = int(float(os.environ.get("MEMORY_LOCKER_MAX_MEGAPIXELS", 100)) * 1_000_000)
+DECODE_BUDGET = int(float(os.environ.get("MEMORY_LOCKER_DECODE_BUDGET_MB", 512)) * 1024 * 1024)
+DECODE_COPIES = 3
+Image.MAX_IMAGE_PIXELS = MAX_PIXELS
+
+
+def available_formats():
+    """Output formats this Pillow build can write (AVIF needs libavif)"""
+    return [name for name, (pil_format, *_) in OUTPUT_FORMATS.items()
+            if pil_format == "JPEG" or features.check(pil_format.lower())]
+
+
+def _encode(image, output_format, quality):
+    pil_format, _, _, options = OUTPUT_FORMATS[output_format]
+    img_buffer = io.BytesIO()
+    image.save(img_buffer, format=pil_format, quality=quality, **options)
+    return img_buffer.getvalue()
+
+
+def encode_image(image, output_format=None, budget=0):
+    """Encode in `output_format`; returns (bytes, {"mime", "format", "quality"}).
+
+    With a byte budget, binary-search for the highest quality that fits it
+    (falling back to MIN_QUALITY if nothing does).
+    """
+    output_format = output_format or OUTPUT_FORMAT
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown image format {output_format!r}; choose from {sorted(OUTPUT_FORMATS)}")
+    quality = FORMAT_QUALITY[output_format]
+    data = _encode(image, output_format, quality)
+    if budget and len(data) > budget:
+        low, high, best = MIN_QUALITY, quality - 1, None
+        while low <= high:
+            middle = (low + high) // 2
+            attempt = _encode(image, output_format, middle)
+            if len(attempt) <= budget:
+                best, low = (attempt, middle), middle + 1
+            else:
+                high = middle - 1
+        data, quality = best or (_encode(image, output_format, MIN_QUALITY), MIN_QUALITY)
+    return data, {"mime": OUTPUT_FORMATS[output_format][1], "format": output_format, "quality": quality}
+
+
+def open_bounded(image_file):
+    """Open an image lazily: check its pixel count and request a reduced JPEG
+    decode. Nothing is decoded until the pixels are first used."""
+    image = Image.open(image_file)
+    width, height = image.size
+    if width * height > MAX_PIXELS:
+        raise ValueError(f"Image is {width}x{height} ({width * height / 1e6:.0f} MP); "
+                         f"the limit is {MAX_PIXELS / 1e6:.0f} MP")
+    if image.format == "JPEG":
+        image.draft("RGB", max(VARIANT_SIZES.values()))
+    return image
+
+
+def decode_cost(image):
+    """Estimated peak working memory, in bytes, of decoding and resizing `image`"""
+    return image.size[0] * image.size[1] * len(image.getbands()) * DECODE_COPIES
+
+
+def open_upload(image_file):
+    """Open an uploaded image, apply EXIF rotation and convert to RGB"""
+    return orient(open_bounded(image_file))
+
+
+def orient(image):
+    """Apply EXIF rotation and convert to RGB"""
+
+    # Handle EXIF orientation
+    try:
+        exif = image._getexif()
+        if exif is not None:
+            orientation = exif.get(ExifTags.TAGS.get('Orientation', None))
+            if orientation == 3:
+                image = image.rotate(180, expand=True)
+            elif orientation == 6:
+                image = image.rotate(270, expand=True)
+            elif orientation == 8:
+                image = image.rotate(90, expand=True)
+    except Exception:
+        pass
+
+    # Convert to RGB if necessary
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGB')
+    return image
+
+
+def encode_jpeg(image):
+    return _encode(image, "jpeg", JPEG_QUALITY)
+
+
+def perceptual_hash(image):
+    """64-bit difference hash as 16 hex digits.
+
+    Each bit says whether a pixel of a small grayscale thumbnail is brighter
+    than its right-hand neighbour, so re-encodes, resizes and EXIF-only edits
+    of a picture land within a few bits of each other.
+    """
+    small = image.convert("L").resize((PHASH_SIZE + 1, PHASH_SIZE), Image.Resampling.LANCZOS)
+    pixels = list(small.getdata())
+    bits = 0
+    for row in range(PHASH_SIZE):
+        for col in range(PHASH_SIZE):
+            position = row * (PHASH_SIZE + 1) + col
+            bits = (bits << 1) | (pixels[position] > pixels[position + 1])
+    return f"{bits:0{PHASH_SIZE * PHASH_SIZE // 4}x}"
+
+
+def content_hashes(variants):
+    """Hashes used for duplicate detection, from encoded variants.
+
+    sha256 covers the full rendition's bytes; the perceptual hash is taken
+    from the smallest rendition, which is cheap to decode.
+    """
+    smallest = min(variants.values(), key=lambda variant: variant[1][0] * variant[1][1])
+    return {
+        "sha256": hashlib.sha256(variants['full'][0]).hexdigest(),
+        "phash": perceptual_hash(Image.open(io.BytesIO(smallest[0]))),
+    }
+
+
+def build_variants(image, output_format=None, budget=None):
+    """Resize an image into every rendition; returns {name: (bytes, size, encoding)}"""
+    budget = BYTE_BUDGET if budget is None else budget
+    variants = {}
+    # Work from largest to smallest so each step resamples fewer pixels
+    source = image
+    full_pixels = None
+    for name, box in sorted(VARIANT_SIZES.items(), key=lambda item: -item[1][0] * item[1][1]):
+        variant = source.copy()
+        variant.thumbnail(box, Image.Resampling.LANCZOS)
+        pixels = variant.size[0] * variant.size[1]
+        full_pixels = full_pixels or pixels
+        img_bytes, encoding = encode_image(variant, output_format, budget * pixels // full_pixels)
+        variants[name] = (img_bytes, variant.size, encoding)
+        source = variant
+    return variants
+
+
+def store_variants(variants):
+    """Write encoded variants to the blob store; returns photo metadata"""
+    stored = {}
+    for name, (img_bytes, size, encoding) in variants.items():
+        ext = OUTPUT_FORMATS.get(encoding.get("format"), OUTPUT_FORMATS["jpeg"])[2]
+        stored[name] = {"blob": put_blob(img_bytes, ext), "size": list(size), "bytes": len(img_bytes), **encoding}
+    return stored
+
+
+def verify_image(payload):
+    """Fully decode image bytes (within the decode budget) to check they are
+    a readable image; returns their sha256 hex digest"""
+    image = open_bounded(io.BytesIO(payload))
+    with reserve_decode_memory(decode_cost(image)):
+        image.load()
+    return hashlib.sha256(payload).hexdigest()
+
+
+def pick_variant(photo, width):
+    """Return the smallest stored variant rendered for at least `width` pixels.
+
+    Variants are compared by their bounding box, so a portrait "grid" image
+    still satisfies a 300px request. Falls back to the largest variant, and
+    to the master blob for photos that have not been backfilled yet.
+    """
+    variants = photo.get('variants')
+    if not variants:
+        if photo.get('blob'):
+            return {"blob": photo['blob'], "size": photo.get('processed_size')}
+        return None
+    names = sorted(variants, key=lambda name: VARIANT_SIZES.get(name, (0, 0))[0])
+    for name in names:
+        if VARIANT_SIZES.get(name, (0, 0))[0] >= width:
+            return variants[name]
+    return variants[names[-1]]
+
+
+def backfill_variants(photos):
+    """Generate missing variants for blob-stored photos; returns the count"""
+    filled = 0
+    for photo in photos:
+        if photo.get('variants') or not photo.get('blob'):
+            continue
+        img_bytes = get_blob(photo['blob'])
+        if img_bytes is None:
+            continue
+        image = open_upload(io.BytesIO(img_bytes))
+        variants = build_variants(image)
+        # The master blob already is the full rendition; don't re-encode it
+        variants['full'] = (img_bytes, image.size, {"mime": "image/jpeg", "format": "jpeg"})
+        photo['variants'] = store_variants(variants)
+        filled += 1
+    return filled
+
+
+def process_upload(name, payload, output_format=None, budget=None):
+    """Encode one uploaded file into stored renditions (runs in a worker process).
+
+    Returns a dict with the file name and either its "variants" metadata,
+    processed "size", duplicate-detection "hashes" and decode "memory"
+    report, or an "error" message. The memory report's peak_bytes is how far
+    this process's peak RSS rose above its starting RSS while encoding.
+    """
+    try:
+        image = open_bounded(io.BytesIO(payload))
+        cost = decode_cost(image)
+        with reserve_decode_memory(cost) as waited:
+            memprof.reset_peak_rss()
+            start_rss = memprof.current_rss()
+            decoded_size = image.size
+            variants = build_variants(orient(image), output_format, budget)
+            peak_rss = memprof.peak_rss()
+        return {
+            "name": name,
+            "size": list(variants['full'][1]),
+            "variants": store_variants(variants),
+            "hashes": content_hashes(variants),
+            "memory": {
+                "decoded_size": list(decoded_size),
+                "reserved_bytes": cost,
+                "waited_seconds": round(waited, 3),
+                "peak_bytes": None if peak_rss is None or start_rss is None else max(0, peak_rss - start_rss),
+            },
+        }
+    except Exception as e:
+        return {"name": name, "error": str(e)}
+
+
+# One worker pool per server process, shared by every admin session. "spawn"
+# keeps workers from inheriting Streamlit's threads. spawn would also re-run
+# the parent's __main__ in each worker, which under `streamlit run` is app.py
+# (rendering the page and running its startup phases), so workers are
+# launched with a bare stand-in __main__ and only import this module. If a
+# worker dies (e.g. OOM-killed) the pool is broken for good; it is then
+# shut down and replaced on the next submit.
+POOL_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+_pool = None
+_pool_lock = threading.Lock()
+_launch_lock = threading.Lock()
+_WORKER_MAIN = types.ModuleType("__main__", "Stand-in __main__ for image pool workers")
+# (condition, shared bytes-in-use counter) for DECODE_BUDGET; created by the
+# server process and handed to each worker when it starts
+_decode_budget = None
+_reserved_here = 0   # this process's share of the counter
+
+
+def _shared_decode_budget():
+    global _decode_budget
+    with _pool_lock:
+        if _decode_budget is None:
+            context = multiprocessing.get_context("spawn")
+            _decode_budget = (context.Condition(), context.Value("q", 0, lock=False))
+        return _decode_budget
+
+
+class _WorkerProcess(multiprocessing.context.SpawnProcess):
+    @staticmethod
+    def _Popen(process_obj):
+        # The child's preparation data is taken from sys.modules["__main__"]
+        # while it launches. Streamlit sets that on each rerun, so only put
+        # the original back if nothing replaced the stand-in meanwhile.
+        with _launch_lock:
+            main = sys.modules.get("__main__")
+            sys.modules["__main__"] = _WORKER_MAIN
+            try:
+                return multiprocessing.context.SpawnProcess._Popen(process_obj)
+            finally:
+                if sys.modules.get("__main__") is _WORKER_MAIN:
+                    sys.modules["__main__"] = main
+
+
+class _WorkerContext(multiprocessing.context.SpawnContext):
+    Process = _WorkerProcess
+
+
+def _init_worker(decode_budget):
+    global _decode_budget
+    _decode_budget = decode_budget
+
+
+@contextmanager
+def reserve_decode_memory(cost):
+    """Block until `cost` bytes fit in DECODE_BUDGET, across all processes.
+
+    Yields the seconds spent waiting.
+    """
+    global _reserved_here
+    condition, in_use = _shared_decode_budget()
+    cost = min(cost, DECODE_BUDGET)
+    start = time.perf_counter()
+    with condition:
+        while in_use.value and in_use.value + cost > DECODE_BUDGET:
+            condition.wait()
+        in_use.value += cost
+        _reserved_here += cost
+    try:
+        yield time.perf_counter() - start
+    finally:
+        with condition:
+            in_use.value -= cost
+            _reserved_here -= cost
+            condition.notify_all()
+
+
+def get_process_pool():
+    global _pool
+    decode_budget = _shared_decode_budget()
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=POOL_WORKERS,
+                mp_context=_WorkerContext(),
+                initializer=_init_worker,
+                initargs=(decode_budget,),
+            )
+        return _pool
+
+
+def _discard_pool(pool):
+    """Shut down a broken pool so the next get_process_pool() starts afresh"""
+    global _pool
+    with _pool_lock:
+        if _pool is not pool:
+            return   # another thread already replaced it
+        _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+    # Its workers are gone, along with any decode memory they had reserved
+    condition, in_use = _shared_decode_budget()
+    with condition:
+        in_use.value = _reserved_here
+        condition.notify_all()
+
+
+def submit_to_pool(fn, *args):
+    """Run fn(*args) on the worker pool; returns a future.
+
+    A pool broken by a dead worker is replaced first, so one crash doesn't
+    fail every later batch. Futures already submitted to it fail with
+    BrokenProcessPool.
+    """
+    pool = get_process_pool()
+    try:
+        return pool.submit(fn, *args)
+    except BrokenProcessPool:
+        _discard_pool(pool)
+        return get_process_pool().submit(fn, *args)
+
+
+def _upload_result(future, name):
+    try:
+        return future.result()
+    except BrokenProcessPool:
+        return {"name": name, "error": "The worker encoding this photo stopped unexpectedly "
+                                       "(it may have run out of memory)"}
+
+
+def process_uploads(items, output_format=None, budget=None):
+    """Encode (name, file) pairs in parallel, optionally overriding the output
+    format and full-rendition byte budget.
+
+    Yields (position in items, result) as each file finishes. Only a few
+    files per worker are in flight at once, so a large batch isn't copied
+    to the workers all at the same time. A single file is encoded inline
+    to skip the worker round trip.
+    """
+    if len(items) == 1:
+        name, image_file = items[0]
+        yield 0, process_upload(name, image_file.getvalue(), output_format, budget)
+        return
+    pending = {}
+    for position, (name, image_file) in enumerate(items):
+        future = submit_to_pool(process_upload, name, image_file.getvalue(), output_format, budget)
+        pending[future] = position
+        if len(pending) >= POOL_WORKERS * 2:
+            done = next(as_completed(pending))
+            position = pending.pop(done)
+            yield position, _upload_result(done, items[position][0])
+    for future in as_completed(list(pending)):
+        yield pending[future], _upload_result(future, items[pending[future]][0])
@@ -0,0 +1,442 @@
+import hashlib
+import itertools
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: no inter-process locking, only between threads
+    fcntl = None
+
+# JSON storage backend: a process-wide cache of the parsed data/*.json
+# collections (see repository.py for the backend-neutral API).
+# Streamlit re-executes app.py on every rerun but imports this module once per
+# server process, so every session shares the same parsed lists. An entry is
+# reused while the (mtime, size) signature of the snapshot and its journal is
+# unchanged; writes made through this module update it directly.
+#
+# Storage layout per collection:
+#   data/<name>          snapshot, a JSON array (always replaced atomically)
+#   data/<name>.journal  append-only JSON lines of add/delete/update operations
+#   data/<name>.lock     inter-process lock file
+# The journal's first line records the SHA-256 of the snapshot it applies to,
+# so a crash between writing a compacted snapshot and resetting the journal
+# can't replay operations twice, and the highest id ever allocated, so ids
+# stay unique even after the newest records are deleted.
+#
+# In memory a collection is an insertion-ordered {id: record} dict, giving
+# O(1) get, update and delete by id. Records without a usable id, or whose id
+# is already taken, are kept under a private slot key until
+# repository.assign_missing_ids() gives them one.
+DATA_DIR = "data"
+COMPACT_EVERY = 100  # journal operations before folding them into the snapshot
+
+_cache = {}
+_lock = threading.Lock()
+_writer_locks = {}   # filename -> lock serialising this process's writers
+_slots = itertools.count()
+_stats = {"hits": 0, "misses": 0, "writes": 0, "compactions": 0}
+_corrupt = set()   # collections whose snapshot could not be parsed on last load
+log = logging.getLogger(__name__)
+
+
+def _filepath(filename):
+    return os.path.join(DATA_DIR, filename)
+
+
+def _journal_path(filename):
+    return _filepath(filename) + ".journal"
+
+
+def _file_signature(filepath):
+    try:
+        st = os.stat(filepath)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _signature(filename):
+    return (_file_signature(_filepath(filename)), _file_signature(_journal_path(filename)))
+
+
+def collection_signature(filename):
+    """Changes whenever the snapshot or journal is written, by any process"""
+    return _signature(filename)
+
+
+@contextmanager
+def _write_lock(filename):
+    """Serialise writers to one collection across threads and processes"""
+    with _lock:
+        writer_lock = _writer_locks.setdefault(filename, threading.Lock())
+    os.makedirs(DATA_DIR, exist_ok=True)
+    # flock is per open file, so threads need their own lock (and on
+    # Windows it is the only one)
+    with writer_lock, open(_filepath(filename) + ".lock", 'a') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _write_atomic(filepath, payload):
+    """Write bytes to a temp file, fsync it and rename it over filepath"""
+    tmp_path = f"{filepath}.tmp{os.getpid()}.{threading.get_ident()}"
+    with open(tmp_path, 'wb') as f:
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, filepath)
+
+
+def _read_snapshot(filename):
+    """Return (records, sha256 of the file, ok); ok is False if unparseable"""
+    try:
+        with open(_filepath(filename), 'rb') as f:
+            payload = f.read()
+    except FileNotFoundError:
+        _corrupt.discard(filename)
+        return [], None, True
+    digest = hashlib.sha256(payload).hexdigest()
+    try:
+        records = json.loads(payload.decode('utf-8'))
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        log.warning("%s is not valid JSON; treating it as empty", _filepath(filename))
+        _corrupt.add(filename)
+        return [], digest, False
+    _corrupt.discard(filename)
+    return records, digest, True
+
+
+def _read_journal(filename):
+    """Return (header, operations) from the journal file"""
+    try:
+        with open(_journal_path(filename), 'r', encoding='utf-8') as f:
+            lines = f.readlines()
+    except FileNotFoundError:
+        return {}, []
+    header = {}
+    ops = []
+    for line in lines:
+        try:
+            entry = json.loads(line)
+        except json.JSONDecodeError:
+            continue  # torn write from a crash mid-append
+        if "base" in entry:
+            header = entry
+        else:
+            ops.append(entry)
+    return header, ops
+
+
+def _is_id(value):
+    return isinstance(value, (int, str)) and not isinstance(value, bool)
+
+
+def _max_id(records):
+    return max((r.get("id") for r in records if isinstance(r.get("id"), int)
+                and not isinstance(r.get("id"), bool)), default=0)
+
+
+def _slot_key(records, record):
+    """A record's key: its id, or a private slot if that is unusable or taken"""
+    record_id = record.get("id")
+    if _is_id(record_id) and record_id not in records:
+        return record_id
+    return ("slot", next(_slots))
+
+
+def _keyed(records):
+    keyed = {}
+    for record in records:
+        keyed[_slot_key(keyed, record)] = record
+    return keyed
+
+
+def _key_of(records, op):
+    """Key targeted by a delete/update op: by id, or by value for journals
+    written before ids were unique"""
+    if "id" in op:
+        return op["id"] if _is_id(op["id"]) else None
+    for key, record in records.items():
+        if record == op["record"]:
+            return key
+    return None
+
+
+def _apply(entry, op):
+    records = entry["records"]
+    if op["op"] == "add":
+        record = op["record"]
+        records[_slot_key(records, record)] = record
+        if isinstance(record.get("id"), int):
+            entry["last_id"] = max(entry["last_id"], record["id"])
+    elif op["op"] == "delete":
+        records.pop(_key_of(records, op), None)  # may already be deleted by another session
+    elif op["op"] == "update":
+        key = _key_of(records, op)
+        if key in records:
+            records[key] = op["new"]
+
+
+def _load_state(filename):
+    """Read snapshot + journal from disk; returns a cache entry dict"""
+    signature = _signature(filename)
+    records, digest, ok = _read_snapshot(filename)
+    header, ops = _read_journal(filename)
+    base = header.get("base")
+    if base != digest:
+        # Journal belongs to an older snapshot that already includes its ops
+        ops = []
+    entry = {
+        "signature": signature,
+        "records": _keyed(records),
+        # An older journal's high-water mark is still a valid lower bound
+        "last_id": max(header.get("last_id", 0), _max_id(records)),
+        "digest": digest,
+        "journal_base": base,
+        "journal_ops": len(ops),
+        "snapshot_ok": ok,
+    }
+    for op in ops:
+        _apply(entry, op)
+    return entry
+
+
+def _current_state(filename):
+    """Cached state if still valid, else reload it from disk"""
+    signature = _signature(filename)
+    with _lock:
+        entry = _cache.get(filename)
+        if entry is not None and entry["signature"] == signature:
+            _stats["hits"] += 1
+            return entry
+        _stats["misses"] += 1
+    entry = _load_state(filename)
+    with _lock:
+        _cache[filename] = entry
+    return entry
+
+
+def load_collection(filename):
+    """Return the records in data/<filename>.
+
+    The list is a fresh copy that callers may append to, pop from or sort;
+    the record dicts themselves are shared and must be treated as read-only.
+    """
+    return list(_current_state(filename)["records"].values())
+
+
+def query_collection(filename, order_by="date", descending=True, limit=None, offset=0):
+    """Return records sorted by `order_by`, sliced to [offset, offset + limit).
+
+    Each sort order is computed once per cached state and reused until the
+    next write, so paging through a collection doesn't re-sort it.
+    """
+    entry = _current_state(filename)
+    ordered = entry.get("ordered")
+    if ordered is None:
+        ordered = entry["ordered"] = {}
+    records = ordered.get((order_by, descending))
+    if records is None:
+        records = ordered[(order_by, descending)] = sorted(
+            entry["records"].values(),
+            # Records missing the field sort lowest, like NULLs in the SQLite backend
+            key=lambda record: (record.get(order_by) is not None, record.get(order_by)),
+            reverse=descending,
+        )
+    end = None if limit is None else offset + limit
+    return records[offset:end]
+
+
+def count_collection(filename):
+    return len(_current_state(filename)["records"])
+
+
+def get_record(filename, record_id):
+    """Return the record with this id, or None"""
+    if not _is_id(record_id):
+        return None
+    return _current_state(filename)["records"].get(record_id)
+
+
+def last_id(filename):
+    """Highest id ever allocated in the collection"""
+    return _current_state(filename)["last_id"]
+
+
+def collection_exists(filename):
+    return _signature(filename) != (None, None)
+
+
+def _encode_line(entry):
+    return (json.dumps(entry, ensure_ascii=False, default=str) + "\n").encode('utf-8')
+
+
+def _write_snapshot(filename, records, last_id):
+    """Atomically replace the snapshot and start a fresh journal for it.
+
+    Returns the records as they round-trip through JSON, plus the digest.
+    """
+    payload = json.dumps(records, indent=2, ensure_ascii=False, default=str).encode('utf-8')
+    _write_atomic(_filepath(filename), payload)
+    digest = hashlib.sha256(payload).hexdigest()
+    _write_atomic(_journal_path(filename), _encode_line({"base": digest, "last_id": last_id}))
+    return json.loads(payload.decode('utf-8')), digest
+
+
+def _commit(filename, ops):
+    """Append operations to the journal; must hold the write lock.
+
+    Costs O(records written), not O(collection); the snapshot is only
+    rewritten once COMPACT_EVERY operations have accumulated.
+    """
+    entry = _current_state(filename)
+    if entry["journal_base"] != entry["digest"]:
+        # No journal for the current snapshot yet: start one
+        header = {"base": entry["digest"], "last_id": entry["last_id"]}
+        _write_atomic(_journal_path(filename), _encode_line(header))
+        entry["journal_base"] = entry["digest"]
+        entry["journal_ops"] = 0
+
+    payload = b"".join(_encode_line(op) for op in ops)
+    flags = os.O_RDWR | os.O_APPEND | os.O_CREAT | getattr(os, "O_BINARY", 0)
+    fd = os.open(_journal_path(filename), flags, 0o644)
+    try:
+        # Terminate a torn line left by a crash so it doesn't swallow this one
+        # (seek + read rather than os.pread, which Windows lacks)
+        size = os.fstat(fd).st_size
+        if size:
+            os.lseek(fd, size - 1, os.SEEK_SET)
+            if os.read(fd, 1) != b"\n":
+                os.write(fd, b"\n")
+        os.write(fd, payload)
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+    # Apply the JSON round-tripped ops so the cache matches what a reload sees
+    for line in payload.decode('utf-8').splitlines():
+        _apply(entry, json.loads(line))
+    entry["ordered"] = None
+    entry["journal_ops"] += len(ops)
+    entry["signature"] = _signature(filename)
+
+    if entry["journal_ops"] >= COMPACT_EVERY and entry["snapshot_ok"]:
+        _compact_entry(filename, entry)
+
+    with _lock:
+        _cache[filename] = entry
+        _stats["writes"] += 1
+
+
+def _compact_entry(filename, entry):
+    records, digest = _write_snapshot(filename, list(entry["records"].values()), entry["last_id"])
+    entry.update(
+        ordered=None,
+        records=_keyed(records),
+        digest=digest,
+        journal_base=digest,
+        journal_ops=0,
+        signature=_signature(filename),
+    )
+    with _lock:
+        _stats["compactions"] += 1
+
+
+def add_records(filename, records):
+    """Append several records in a single journal write.
+
+    Each gets the next id after the highest ever allocated (ids are never
+    reused, even after deletes); returns the records as stored.
+    """
+    with _write_lock(filename):
+        next_id = _current_state(filename)["last_id"] + 1
+        stored = [dict(record, id=next_id + i) for i, record in enumerate(records)]
+        _commit(filename, [{"op": "add", "record": record} for record in stored])
+    return stored
+
+
+def delete_records(filename, record_ids):
+    """Remove records by id in a single journal write; returns those removed"""
+    with _write_lock(filename):
+        current = _current_state(filename)["records"]
+        removed = [current[record_id] for record_id in dict.fromkeys(record_ids)
+                   if _is_id(record_id) and record_id in current]
+        if removed:
+            _commit(filename, [{"op": "delete", "id": record["id"]} for record in removed])
+    return removed
+
+
+def update_records(filename, records):
+    """Replace records with the same ids in one journal write.
+
+    Returns [(old record, new record)] for the ones that still existed.
+    """
+    with _write_lock(filename):
+        current = _current_state(filename)["records"]
+        changes = [(current[record["id"]], record) for record in records
+                   if _is_id(record.get("id")) and record["id"] in current]
+        if changes:
+            _commit(filename, [{"op": "update", "id": new["id"], "new": new} for _, new in changes])
+    return changes
+
+
+def save_collection(filename, data):
+    """Replace a whole collection (snapshot rewrite) and refresh the cache"""
+    with _write_lock(filename):
+        data = list(data)
+        previous = _current_state(filename)["last_id"] if collection_exists(filename) else 0
+        last = max(previous, _max_id(data))
+        records, digest = _write_snapshot(filename, data, last)
+        entry = {
+            "signature": _signature(filename),
+            "records": _keyed(records),
+            "last_id": last,
+            "digest": digest,
+            "journal_base": digest,
+            "journal_ops": 0,
+            "snapshot_ok": True,
+        }
+        with _lock:
+            _cache[filename] = entry
+            _stats["writes"] += 1
+
+
+def compact(filename):
+    """Fold the journal into the snapshot now; False if the snapshot is unreadable"""
+    if _signature(filename) == (None, None):
+        return True  # nothing stored yet
+    with _write_lock(filename):
+        entry = _current_state(filename)
+        if not entry["snapshot_ok"]:
+            return False
+        _compact_entry(filename, entry)
+        with _lock:
+            _cache[filename] = entry
+    return True
+
+
+def invalidate(filename=None):
+    """Drop one cached collection, or all of them"""
+    with _lock:
+        if filename is None:
+            _cache.clear()
+        else:
+            _cache.pop(filename, None)
+
+
+def cache_stats():
+    """Return hit/miss/write counters and the cached collection names"""
+    with _lock:
+        stats = dict(_stats)
+        stats["cached"] = sorted(_cache)
+        stats["corrupt_snapshots"] = sorted(_corrupt)
+    return stats
@@ -0,0 +1,242 @@
+import logging
+import mimetypes
+import os
+import re
+import struct
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local-disk media backend (see media_store.py for the backend-neutral API).
+# Uploads are written chunk by chunk to data/media/<id>.<ext>.part at their
+# byte offsets (so a resumed upload just continues) and renamed when
+# complete. Files are served by a small HTTP server started with the app:
+#   GET/HEAD /media/<id>.<ext>
+# with ETag / If-None-Match revalidation and single-range Range requests
+# (206), so a <video> element can seek without re-downloading. Media ids are
+# never reused, so responses are cacheable indefinitely.
+#
+# MEMORY_LOCKER_MEDIA_PORT   port to listen on (default 8502)
+# MEMORY_LOCKER_MEDIA_HOST   interface to bind (default 127.0.0.1; the server
+#                            has no authentication, so only widen it behind
+#                            a proxy that does)
+# MEMORY_LOCKER_MEDIA_URL    URL browsers reach it at (default
+#                            http://localhost:<port>/media); set it when the
+#                            app is behind a proxy or on another host
+NAME = "local"
+LABEL = "local disk"
+MEDIA_DIR = os.path.join("data", "media")
+MEDIA_PORT = int(os.environ.get("MEMORY_LOCKER_MEDIA_PORT", 8502))
+MEDIA_HOST = os.environ.get("MEMORY_LOCKER_MEDIA_HOST", "127.0.0.1")
+MEDIA_URL = os.environ.get("MEMORY_LOCKER_MEDIA_URL", f"http://localhost:{MEDIA_PORT}/media").rstrip("/")
+COPY_CHUNK = 256 * 1024
+MEDIA_NAME = re.compile(r"^[0-9a-f]{32}\.[a-z0-9]{1,5}$")
+
+_server = None
+_started = False
+_server_lock = threading.Lock()
+log = logging.getLogger(__name__)
+
+
+def configure(settings):
+    """Start the media server (once per process).
+
+    If the port is already taken (typically by the media server of another
+    app process sharing this data directory) that server is used as is.
+    """
+    global _server, _started
+    with _server_lock:
+        if not _started:
+            _started = True
+            try:
+                _server = ThreadingHTTPServer((MEDIA_HOST, MEDIA_PORT), MediaHandler)
+            except OSError as e:
+                log.warning("Media server not started on %s:%s (%s); using the one already there",
+                            MEDIA_HOST, MEDIA_PORT, e)
+                return None
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, name="media-server", daemon=True).start()
+    return _server
+
+
+def has_media():
+    """True if any video has been stored on local disk"""
+    return os.path.isdir(MEDIA_DIR) and any(MEDIA_NAME.match(name) for name in os.listdir(MEDIA_DIR))
+
+
+def new_upload_id():
+    return uuid.uuid4().hex
+
+
+def _media_id(job):
+    ext = os.path.splitext(job["name"])[1].lower().lstrip(".")
+    return f"{job['upload_id']}.{ext if re.fullmatch(r'[a-z0-9]{1,5}', ext) else 'bin'}"
+
+
+def media_path(media_id):
+    return os.path.join(MEDIA_DIR, media_id)
+
+
+def upload_chunk(job, chunk, start):
+    """Write one chunk at its offset into the partial file"""
+    media_id = _media_id(job)
+    os.makedirs(MEDIA_DIR, exist_ok=True)
+    fd = os.open(media_path(media_id) + ".part", os.O_WRONLY | os.O_CREAT, 0o644)
+    try:
+        os.pwrite(fd, chunk, start)
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    return {"public_id": media_id}
+
+
+def finish(job, response):
+    """Move the completed file into place; returns the record fields"""
+    media_id = response["public_id"]
+    path = media_path(media_id)
+    os.replace(path + ".part", path)
+    return {
+        "url": f"{MEDIA_URL}/{media_id}",
+        "public_id": media_id,
+        "duration": mp4_duration(path),
+        "poster_url": None,
+    }
+
+
+def poster_url(video):
+    return None  # no frame extraction without a video decoder
+
+
+def delete(video):
+    media_id = video.get('public_id')
+    if media_id and MEDIA_NAME.match(media_id):
+        try:
+            os.remove(media_path(media_id))
+        except FileNotFoundError:
+            pass
+
+
+def mp4_duration(path):
+    """Duration in seconds from an MP4/MOV file's movie header, or None"""
+    try:
+        with open(path, "rb") as f:
+            end = os.fstat(f.fileno()).st_size
+            container_end = end
+            while f.tell() + 8 <= container_end:
+                start = f.tell()
+                size, kind = struct.unpack(">I4s", f.read(8))
+                if size == 1:
+                    size = struct.unpack(">Q", f.read(8))[0]
+                elif size == 0:
+                    size = container_end - start
+                if kind == b"moov":
+                    container_end = start + size   # descend into the movie box
+                    continue
+                if kind == b"mvhd":
+                    version = f.read(4)[0]
+                    if version == 1:
+                        f.seek(16, os.SEEK_CUR)
+                        timescale, duration = struct.unpack(">IQ", f.read(12))
+                    else:
+                        f.seek(8, os.SEEK_CUR)
+                        timescale, duration = struct.unpack(">II", f.read(8))
+                    return round(duration / timescale, 2) if timescale else None
+                if size < 8:
+                    return None
+                f.seek(start + size)
+    except (OSError, struct.error, IndexError):
+        pass
+    return None
+
+
+def _byte_range(header, size):
+    """(start, end) inclusive for a single "bytes=" range; None if absent,
+    malformed or multi-range (served whole), "invalid" if unsatisfiable"""
+    match = re.fullmatch(r"bytes=(\d*)-(\d*)", (header or "").strip())
+    if not match or not any(match.groups()):
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        if last and int(last) < start:
+            return None   # invalid range-spec: ignored (RFC 7233 section 2.1)
+        end = min(int(last), size - 1) if last else size - 1
+    else:
+        start, end = max(0, size - int(last)), size - 1
+    if start >= size or start > end:
+        return "invalid"   # e.g. starts past the end, or "bytes=-0"
+    return start, end
+
+
+class MediaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_HEAD(self):
+        self._serve(send_body=False)
+
+    def do_GET(self):
+        self._serve(send_body=True)
+
+    def _send_empty(self, status, headers=()):
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def _serve(self, send_body):
+        media_id = self.path.split("?", 1)[0].rsplit("/", 1)[-1]
+        if not self.path.startswith("/media/") or not MEDIA_NAME.match(media_id):
+            self._send_empty(404)
+            return
+        try:
+            f = open(media_path(media_id), "rb")
+        except FileNotFoundError:
+            self._send_empty(404)
+            return
+        with f:
+            stat = os.fstat(f.fileno())
+            size = stat.st_size
+            etag = f'"{stat.st_mtime_ns:x}-{size:x}"'
+            common = [
+                ("ETag", etag),
+                ("Accept-Ranges", "bytes"),
+                ("Cache-Control", "public, max-age=31536000, immutable"),
+            ]
+            if etag in [tag.strip() for tag in self.headers.get("If-None-Match", "").split(",")]:
+                self._send_empty(304, common)
+                return
+            byte_range = _byte_range(self.headers.get("Range"), size)
+            if_range = self.headers.get("If-Range")
+            if if_range and if_range.strip() != etag:
+                byte_range = None   # file changed since the client's partial copy
+            if byte_range == "invalid":
+                self._send_empty(416, common + [("Content-Range", f"bytes */{size}")])
+                return
+            start, end = byte_range or (0, size - 1)
+            length = max(0, end - start + 1)
+            self.send_response(206 if byte_range else 200)
+            for name, value in common:
+                self.send_header(name, value)
+            self.send_header("Content-Type", mimetypes.guess_type(media_id)[0] or "application/octet-stream")
+            self.send_header("Content-Length", str(length))
+            if byte_range:
+                self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+            self.end_headers()
+            if not send_body:
+                return
+            f.seek(start)
+            remaining = length
+            try:
+                while remaining:
+                    data = f.read(min(COPY_CHUNK, remaining))
+                    if not data:
+                        break
+                    self.wfile.write(data)
+                    remaining -= len(data)
+            except (BrokenPipeError, ConnectionResetError):
+                pass   # players routinely abort a request when they seek
+
+    def log_message(self, format, *args):
+        if os.environ.get("MEMORY_LOCKER_MEDIA_VERBOSE"):
+            super().log_message(format, *args)
@@ -0,0 +1,300 @@
+import base64
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import tarfile
+import zipfile
+from collections import deque
+from datetime import datetime
+
+from blob_store import blob_path, blob_exists, put_blob
+from repository import BACKEND_NAME, query_collection, count_collection, add_records
+
+# Streaming backup of the whole locker to a .zip, .tar or .tar.gz archive:
+#   manifest.json              format, version and per-collection counts
+#   blobs/<sha256>.<ext>       one file per photo rendition (content-addressed)
+#   media/<id>.<ext>           videos kept by the local media backend
+#   records/<collection>/<id>.json
+#                              one file per record, written after its files
+# Export pages through each collection and copies blobs straight from disk,
+# so memory stays flat however big the locker is; legacy inline base64
+# photos are written out as blobs. Import reads the archive in one pass,
+# fully decodes each image on the image worker pool (within the shared
+# decode budget) and checks it against its sha256 name, then appends the
+# records in batches of BATCH_SIZE under fresh ids. Only a few images are
+# in flight at once. Records whose files are missing or invalid are skipped
+# and reported. (With the json backend the collections themselves are held
+# in memory; use the sqlite backend for lockers larger than RAM.)
+ARCHIVE_FORMAT = "memory-locker-export"
+ARCHIVE_VERSION = 1
+MANIFEST = "manifest.json"
+COLLECTIONS = ["photos.json", "videos.json", "letters.json"]
+REQUIRED_FIELDS = {
+    "photos.json": ("date",),
+    "videos.json": ("date", "url"),
+    "letters.json": ("date", "title", "content"),
+}
+PAGE_SIZE = 500
+BATCH_SIZE = 500
+MAX_BLOB_BYTES = 64 * 1024 * 1024
+MAX_RECORD_BYTES = 16 * 1024 * 1024
+BLOB_NAME = re.compile(r"^[0-9a-f]{64}\.[a-z0-9]{1,5}$")
+
+
+def archive_kind(path):
+    """"zip", "tar" or "tar.gz", from the file name"""
+    name = path.lower()
+    if name.endswith(".zip"):
+        return "zip"
+    if name.endswith((".tar.gz", ".tgz")):
+        return "tar.gz"
+    if name.endswith(".tar"):
+        return "tar"
+    raise ValueError(f"Unsupported archive {path!r}; use .zip, .tar or .tar.gz")
+
+
+def _photo_blobs(photo):
+    refs = [variant['blob'] for variant in (photo.get('variants') or {}).values() if variant.get('blob')]
+    if photo.get('blob'):
+        refs.append(photo['blob'])
+    return list(dict.fromkeys(refs))
+
+
+def _open_writer(path, kind):
+    if kind == "zip":
+        return zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED, allowZip64=True)
+    return tarfile.open(path, "w|gz" if kind == "tar.gz" else "w|")
+
+
+def _write_bytes(archive, name, data, compress=True):
+    if isinstance(archive, zipfile.ZipFile):
+        archive.writestr(name, data, zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED)
+    else:
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = int(datetime.now().timestamp())
+        archive.addfile(info, io.BytesIO(data))
+
+
+def _write_file(archive, name, path):
+    # Images and videos are already compressed: store them as they are
+    if isinstance(archive, zipfile.ZipFile):
+        archive.write(path, name, zipfile.ZIP_STORED)
+    else:
+        archive.add(path, name, recursive=False)
+
+
+def export_locker(path, page_size=PAGE_SIZE):
+    """Write every collection and its files to an archive at `path`.
+
+    Returns {"records": {collection: n}, "blobs": n, "media": n, "missing": [refs]}.
+    """
+    kind = archive_kind(path)
+    stats = {"records": {}, "blobs": 0, "media": 0, "missing": []}
+    written = set()   # blob refs already in the archive (photos may share them)
+    temp_path = f"{path}.tmp"
+    with _open_writer(temp_path, kind) as archive:
+        _write_bytes(archive, MANIFEST, json.dumps({
+            "format": ARCHIVE_FORMAT,
+            "version": ARCHIVE_VERSION,
+            "created": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "backend": BACKEND_NAME,
+            "collections": {filename: count_collection(filename) for filename in COLLECTIONS},
+        }, indent=2).encode("utf-8"))
+        for filename in COLLECTIONS:
+            stem = filename.rsplit(".", 1)[0]
+            count = 0
+            offset = 0
+            while True:
+                page = query_collection(filename, order_by="id", descending=False, limit=page_size, offset=offset)
+                if not page:
+                    break
+                offset += len(page)
+                for record in page:
+                    record = dict(record)
+                    if record.get('base64_data'):
+                        # Legacy inline photo: store it like migrate_base64_photos would
+                        img_bytes = base64.b64decode(record.pop('base64_data'))
+                        ref = f"{hashlib.sha256(img_bytes).hexdigest()}.jpg"
+                        if ref not in written:
+                            _write_bytes(archive, f"blobs/{ref}", img_bytes, compress=False)
+                            written.add(ref)
+                            stats["blobs"] += 1
+                        record.update(blob=ref, blob_size=len(img_bytes), storage_type="blob")
+                    for ref in _photo_blobs(record):
+                        if ref in written:
+                            continue
+                        if not blob_exists(ref):
+                            stats["missing"].append(ref)
+                            continue
+                        _write_file(archive, f"blobs/{ref}", blob_path(ref))
+                        written.add(ref)
+                        stats["blobs"] += 1
+                    if record.get('storage_type') == "local":
+                        from local_media import MEDIA_NAME, media_path
+                        media_id = record.get('public_id') or ""
+                        if MEDIA_NAME.match(media_id) and os.path.exists(media_path(media_id)):
+                            _write_file(archive, f"media/{media_id}", media_path(media_id))
+                            stats["media"] += 1
+                        else:
+                            stats["missing"].append(media_id)
+                    _write_bytes(archive, f"records/{stem}/{record.get('id')}.json",
+                                 json.dumps(record, ensure_ascii=False).encode("utf-8"))
+                    count += 1
+            stats["records"][filename] = count
+    os.replace(temp_path, path)
+    return stats
+
+
+def _entries(path):
+    """Yield (name, size, file object) for each file in the archive, in order;
+    each file must be read before asking for the next"""
+    if archive_kind(path) == "zip":
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                if not info.is_dir():
+                    with archive.open(info) as f:
+                        yield info.filename, info.file_size, f
+    else:
+        with tarfile.open(path, "r|*") as archive:
+            for member in archive:
+                if member.isfile():
+                    yield member.name, member.size, archive.extractfile(member)
+
+
+def _check_record(filename, record):
+    """Reason the record can't be imported, or None"""
+    if not isinstance(record, dict):
+        return "not a JSON object"
+    for field in REQUIRED_FIELDS[filename]:
+        if record.get(field) is None:
+            return f"missing {field}"
+    if filename == "photos.json":
+        refs = _photo_blobs(record)
+        if not refs:
+            return "no image"
+        for ref in refs:
+            if not blob_exists(ref):
+                return f"image {ref} is missing or invalid"
+    if record.get('storage_type') == "local":
+        from local_media import MEDIA_NAME, media_path
+        if not MEDIA_NAME.match(record.get('public_id') or "") or not os.path.exists(media_path(record['public_id'])):
+            return "video file is missing"
+    return None
+
+
+def import_locker(path, batch_size=BATCH_SIZE):
+    """Add everything in an archive made by export_locker to this locker.
+
+    Records are appended under fresh ids (importing twice adds them twice).
+    Returns {"records": {collection: n}, "blobs": n, "media": n,
+    "skipped": [(archive entry, reason)]}.
+    """
+    from image_pipeline import POOL_WORKERS, submit_to_pool, verify_image
+
+    stats = {"records": {filename: 0 for filename in COLLECTIONS}, "blobs": 0, "media": 0, "skipped": []}
+    batches = {filename: [] for filename in COLLECTIONS}
+    pending = deque()   # archive order: [name, kind, payload, future]
+    in_flight = 0
+    window = POOL_WORKERS * 2
+
+    def flush(filename):
+        if batches[filename]:
+            stats["records"][filename] += len(add_records(filename, batches[filename]))
+            batches[filename] = []
+
+    def consume(name, kind, payload, future):
+        if kind == "blob":
+            ref, data = payload
+            if future is not None:
+                try:
+                    digest = future.result()
+                except Exception as e:
+                    stats["skipped"].append((name, f"unreadable image: {e}"))
+                    return
+                if digest != ref.split(".")[0]:
+                    stats["skipped"].append((name, "checksum mismatch"))
+                    return
+                put_blob(data, ref.split(".", 1)[1])
+            stats["blobs"] += 1
+            return
+        filename, record = payload
+        reason = _check_record(filename, record)
+        if reason:
+            stats["skipped"].append((name, reason))
+            return
+        record = {key: value for key, value in record.items() if key != "id"}
+        if record.get('storage_type') == "local":
+            from local_media import MEDIA_URL
+            record["url"] = f"{MEDIA_URL}/{record['public_id']}"
+        batches[filename].append(record)
+        if len(batches[filename]) >= batch_size:
+            flush(filename)
+
+    entries = _entries(path)
+    first = next(entries, None)
+    manifest = None
+    if first and first[0] == MANIFEST and first[1] <= MAX_RECORD_BYTES:
+        try:
+            manifest = json.loads(first[2].read())
+        except ValueError:
+            pass
+    if not isinstance(manifest, dict) or manifest.get("format") != ARCHIVE_FORMAT:
+        raise ValueError(f"{path} is not a memory locker export")
+    if manifest.get("version", 0) > ARCHIVE_VERSION:
+        raise ValueError(f"{path} was written by a newer version (format {manifest['version']})")
+
+    for name, size, f in entries:
+        top, _, rest = name.partition("/")
+        if top == "blobs":
+            if not BLOB_NAME.match(rest):
+                stats["skipped"].append((name, "unexpected file name"))
+            elif size > MAX_BLOB_BYTES:
+                stats["skipped"].append((name, "too large"))
+            elif blob_exists(rest):
+                pending.append([name, "blob", (rest, None), None])   # already stored here
+            else:
+                data = f.read()
+                pending.append([name, "blob", (rest, data), submit_to_pool(verify_image, data)])
+                in_flight += 1
+        elif top == "media":
+            from local_media import MEDIA_DIR, MEDIA_NAME, media_path
+            if not MEDIA_NAME.match(rest):
+                stats["skipped"].append((name, "unexpected file name"))
+            else:
+                if not os.path.exists(media_path(rest)):
+                    os.makedirs(MEDIA_DIR, exist_ok=True)
+                    with open(media_path(rest) + ".part", "wb") as out:
+                        shutil.copyfileobj(f, out, 1024 * 1024)
+                    os.replace(media_path(rest) + ".part", media_path(rest))
+                stats["media"] += 1
+        elif top == "records":
+            filename = rest.split("/", 1)[0] + ".json"
+            if filename not in batches:
+                stats["skipped"].append((name, "unknown collection"))
+            elif size > MAX_RECORD_BYTES:
+                stats["skipped"].append((name, "too large"))
+            else:
+                try:
+                    record = json.loads(f.read())
+                except ValueError as e:
+                    stats["skipped"].append((name, f"invalid JSON: {e}"))
+                else:
+                    pending.append([name, "record", (filename, record), None])
+        else:
+            stats["skipped"].append((name, "unexpected entry"))
+
+        # Settle entries in archive order, so a record is checked after its images
+        while pending and (pending[0][3] is None or pending[0][3].done() or in_flight > window):
+            entry = pending.popleft()
+            if entry[3] is not None:
+                in_flight -= 1
+            consume(*entry)
+    while pending:
+        consume(*pending.popleft())
+    for filename in COLLECTIONS:
+        flush(filename)
+    return stats
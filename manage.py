@@ -0,0 +1,144 @@
+"""Maintenance commands for the memory locker data directory.
+
+Usage:
+    python manage.py migrate-blobs       # move inline base64 photos into the blob store
+    python manage.py backfill-variants   # generate grid/preview/full renditions
+    python manage.py compact             # fold the write journals into the snapshots
+    python manage.py import-sqlite       # copy data/*.json into data/memories.db
+    python manage.py reindex             # rebuild the search, date and photo hash indexes
+    python manage.py assign-ids          # give id-less or duplicate-id records fresh ids
+    python manage.py scan-duplicates     # hash older photos and report duplicate groups
+    python manage.py gc-blobs            # delete stored images no photo uses any more
+    python manage.py export PATH         # back up everything to a .zip, .tar or .tar.gz
+    python manage.py import PATH         # add the contents of an export to this locker
+"""
+import sys
+
+from blob_store import BLOB_DIR, migrate_base64_photos
+from repository import load_collection, save_collection, assign_missing_ids, compact as compact_collection
+
+COLLECTIONS = ["photos.json", "videos.json", "letters.json"]
+
+
+def migrate_blobs():
+    photos = [dict(photo) for photo in load_collection("photos.json")]
+    count = migrate_base64_photos(photos)
+    if count:
+        save_collection("photos.json", photos)
+    print(f"Migrated {count} photo(s) into {BLOB_DIR}")
+
+
+def backfill_variants():
+    from image_pipeline import backfill_variants as backfill
+    photos = [dict(photo) for photo in load_collection("photos.json")]
+    count = backfill(photos)
+    if count:
+        save_collection("photos.json", photos)
+    print(f"Generated variants for {count} photo(s)")
+
+
+def compact():
+    for filename in COLLECTIONS:
+        if compact_collection(filename):
+            print(f"Compacted {filename}")
+        else:
+            print(f"Skipped {filename}: snapshot is not valid JSON")
+
+
+def import_sqlite():
+    from sqlite_store import DB_PATH, import_json_collections
+    for filename, count in import_json_collections(COLLECTIONS).items():
+        print(f"Imported {count} record(s) from {filename} into {DB_PATH}")
+    print("Set MEMORY_LOCKER_BACKEND=sqlite to use the database")
+
+
+def reindex():
+    import date_index
+    import duplicates
+    import search_index
+    print(f"Indexed {search_index.rebuild()} memories into {search_index.INDEX_PATH}")
+    print(f"Indexed {date_index.rebuild()} dated memories into {date_index.INDEX_PATH}")
+    print(f"Indexed {duplicates.rebuild()} hashed photos into {duplicates.INDEX_PATH}")
+
+
+def assign_ids():
+    for filename in COLLECTIONS:
+        print(f"Assigned fresh ids to {assign_missing_ids(filename)} record(s) in {filename}")
+
+
+def scan_duplicates():
+    from duplicates import scan
+    report = scan()
+    if report["hashed"]:
+        print(f"Hashed {report['hashed']} older photo(s)")
+    for group in report["groups"]:
+        found = ", ".join(f"#{photo_id} ({kind}" + (f", {bits} bits)" if kind == "near" and bits is not None else ")")
+                          for photo_id, kind, bits in group["duplicates"])
+        print(f"Photo #{group['keep']} is duplicated by {found}")
+    count = sum(len(group["duplicates"]) for group in report["groups"])
+    print(f"{count} duplicate photo(s) in {len(report['groups'])} group(s); "
+          f"deleting them would free {report['reclaimable_bytes'] / (1024 * 1024):.1f} MB")
+
+
+def gc_blobs():
+    from blob_store import GC_MIN_AGE, remove_unused_blobs
+    used = set()
+    for photo in load_collection("photos.json"):
+        used.update(variant['blob'] for variant in (photo.get('variants') or {}).values())
+        if photo.get('blob'):
+            used.add(photo['blob'])
+    removed, freed = remove_unused_blobs(used)
+    print(f"Removed {removed} unused image file(s) older than {GC_MIN_AGE // 60} minutes, "
+          f"freeing {freed / (1024 * 1024):.1f} MB")
+
+
+def export(path):
+    from locker_archive import export_locker
+    stats = export_locker(path)
+    for filename, count in stats["records"].items():
+        print(f"Exported {count} record(s) from {filename}")
+    print(f"Exported {stats['blobs']} image file(s) and {stats['media']} video file(s) to {path}")
+    for ref in stats["missing"]:
+        print(f"Missing file, not exported: {ref}")
+
+
+def import_archive(path):
+    from locker_archive import import_locker
+    stats = import_locker(path)
+    print(f"Imported {stats['blobs']} image file(s) and {stats['media']} video file(s)")
+    for filename, count in stats["records"].items():
+        print(f"Imported {count} record(s) into {filename}")
+    for name, reason in stats["skipped"]:
+        print(f"Skipped {name}: {reason}")
+
+
+COMMANDS = {
+    "migrate-blobs": migrate_blobs,
+    "backfill-variants": backfill_variants,
+    "compact": compact,
+    "import-sqlite": import_sqlite,
+    "reindex": reindex,
+    "assign-ids": assign_ids,
+    "scan-duplicates": scan_duplicates,
+    "gc-blobs": gc_blobs,
+    "export": export,
+    "import": import_archive,
+}
+# Commands that take a path argument
+PATH_COMMANDS = {"export", "import"}
+
+
+def main(argv):
+    if len(argv) < 2 or argv[1] not in COMMANDS or len(argv) != (3 if argv[1] in PATH_COMMANDS else 2):
+        print(__doc__)
+        return 1
+    try:
+        COMMANDS[argv[1]](*argv[2:])
+    except ValueError as e:
+        print(f"Error: {e}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,52 @@
+import os
+
+import cloudinary_media
+import local_media
+
+# Backend-neutral storage for video files. The backend is chosen once per
+# process with the MEMORY_LOCKER_MEDIA_BACKEND environment variable:
+#   cloudinary  Cloudinary chunked uploads + CDN delivery (default, see
+#               cloudinary_media.py; needs the CLOUDINARY_* secrets)
+#   local       data/media/ files served with Range/ETag support by a small
+#               HTTP server next to the app (see local_media.py)
+# A backend provides NAME, LABEL, configure(settings), new_upload_id(),
+# upload_chunk(job, chunk, start), finish(job, response), poster_url(video)
+# and delete(video). Video records keep the "storage_type" of the backend
+# that stored them; configure() also sets up the other backends while they
+# still hold videos (the local media server keeps serving data/media/, and
+# Cloudinary stays configured while its credentials are in the secrets), so
+# switching backends leaves older videos playable and deletable.
+BACKENDS = {
+    "cloudinary": cloudinary_media,
+    "local": local_media,
+}
+BACKEND_NAME = os.environ.get("MEMORY_LOCKER_MEDIA_BACKEND", "cloudinary").lower()
+if BACKEND_NAME not in BACKENDS:
+    raise ValueError(f"Unknown MEMORY_LOCKER_MEDIA_BACKEND {BACKEND_NAME!r}; choose from {sorted(BACKENDS)}")
+backend = BACKENDS[BACKEND_NAME]
+
+
+def configure(settings):
+    """Set up the active backend from the app's secrets (a dict), plus any
+    other backend that older videos still live on"""
+    if backend is not local_media and local_media.has_media():
+        local_media.configure(settings)
+    if backend is not cloudinary_media and settings.get("CLOUDINARY_CLOUD_NAME"):
+        cloudinary_media.configure(settings)
+    return backend.configure(settings)
+
+
+def _backend_for(video):
+    return BACKENDS.get(video.get('storage_type'), backend)
+
+
+def poster_url(video):
+    """URL of a still frame for a video record, or None if there isn't one"""
+    if video.get('poster_url'):
+        return video['poster_url']
+    return _backend_for(video).poster_url(video)
+
+
+def delete_media(video):
+    """Remove a video's stored file from the backend that holds it"""
+    _backend_for(video).delete(video)
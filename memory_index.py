@@ -0,0 +1,117 @@
+import random
+
+from derived_index import DerivedIndex
+from repository import get_record
+
+# Compact, process-wide index of every memory the "Surprise Me!" button can
+# show, as (type, id) tuples. It is built from the collections on first use
+# and kept current by derived_index.DerivedIndex (it is cheap to build, so it
+# isn't saved), so picking a surprise is an O(1) random choice followed by a
+# single get_record() lookup instead of loading all three collections.
+COLLECTIONS = {
+    "photo": "photos.json",
+    "video": "videos.json",
+    "letter": "letters.json",
+}
+
+_entries = []     # [(type, id), ...] in arbitrary order
+_positions = {}   # (type, id) -> [positions in _entries]
+
+
+def is_surprise_candidate(memory_type, record):
+    """Only memories that will actually display are eligible"""
+    if memory_type == "photo":
+        return bool(record.get('blob') or record.get('base64_data'))
+    if memory_type == "video":
+        return 'url' in record
+    return True
+
+
+def _add_entry(entry):
+    _positions.setdefault(entry, []).append(len(_entries))
+    _entries.append(entry)
+
+
+def _remove_entry(entry):
+    """Swap-remove one occurrence of entry in O(1)"""
+    positions = _positions.get(entry)
+    if not positions:
+        return
+    position = positions.pop()
+    if not positions:
+        del _positions[entry]
+    last = _entries.pop()
+    if position < len(_entries):
+        _entries[position] = last
+        last_positions = _positions[last]
+        last_positions[last_positions.index(len(_entries))] = position
+
+
+def _type_for(filename):
+    for memory_type, name in COLLECTIONS.items():
+        if name == filename:
+            return memory_type
+    return None
+
+
+# Callbacks for DerivedIndex
+def _clear(filename):
+    if filename is None:
+        _entries.clear()
+        _positions.clear()
+        return
+    memory_type = _type_for(filename)
+    for entry in [entry for entry in _entries if entry[0] == memory_type]:
+        _remove_entry(entry)
+
+
+def _add(filename, records):
+    memory_type = _type_for(filename)
+    for record in records:
+        if is_surprise_candidate(memory_type, record):
+            _add_entry((memory_type, record.get('id')))
+
+
+def _remove(filename, records):
+    memory_type = _type_for(filename)
+    for record in records:
+        if is_surprise_candidate(memory_type, record):
+            _remove_entry((memory_type, record.get('id')))
+
+
+_index = DerivedIndex(COLLECTIONS.values(), _clear, _add, _remove)
+
+
+def reset():
+    """Forget the index; it is rebuilt from the collections on next use"""
+    _index.reset()
+
+
+def memory_count():
+    _index.ensure_current()
+    return len(_entries)
+
+
+def all_entries():
+    """Copy of the (type, id) entries, e.g. to build a shuffled deck"""
+    _index.ensure_current()
+    with _index.lock:
+        return list(_entries)
+
+
+def contains(entry):
+    _index.ensure_current()
+    return entry in _positions
+
+
+def fetch(entry):
+    """Load just the record behind a (type, id) entry"""
+    memory_type, record_id = entry
+    return get_record(COLLECTIONS[memory_type], record_id)
+
+
+def random_entry():
+    """Uniformly sample one entry, or None when there are no memories"""
+    _index.ensure_current()
+    with _index.lock:
+        return random.choice(_entries) if _entries else None
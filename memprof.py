@@ -0,0 +1,192 @@
+import functools
+import os
+import threading
+import time
+import tracemalloc
+from collections import deque
+
+# Opt-in memory accounting for the heavy code paths (photo gallery, surprise
+# view, uploads). Enable with MEMORY_LOCKER_MEMPROFILE=1 or from the admin
+# Performance tab. While enabled:
+#   * each profiled call records its peak traced bytes, the bytes it left
+#     allocated and the top allocation sites (tracemalloc snapshot diff);
+#   * a sampler thread records process RSS every RSS_INTERVAL seconds.
+# tracemalloc is process-wide, so calls that overlap in other sessions count
+# towards each other's peaks; reports note how many calls were in flight.
+# Set MEMORY_LOCKER_MEM_BUDGET_MB to flag any profiled call whose peak
+# exceeds it.
+TOP_SITES = 8
+RSS_INTERVAL = 5.0
+FRAMES = 4
+BUDGET_BYTES = int(float(os.environ.get("MEMORY_LOCKER_MEM_BUDGET_MB", 0)) * 1024 * 1024)
+
+_reports = deque(maxlen=50)
+_rss = deque(maxlen=720)   # one hour at the default interval
+_lock = threading.Lock()
+_in_flight = 0
+_generation = 0   # bumped each time tracing starts, so calls can tell it restarted
+_sampler = None
+_sampler_stop = threading.Event()
+
+
+def current_rss():
+    """Resident set size of this process in bytes (None if unavailable)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        # ru_maxrss is the peak, in KB on Linux and bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if os.uname().sysname == "Darwin" else peak * 1024
+    except (ImportError, OSError):
+        return None
+
+
+def peak_rss():
+    """Peak resident set size since start or the last reset_peak_rss() (Linux only)"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def reset_peak_rss():
+    """Restart peak RSS tracking from the current RSS, where the kernel allows it"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def is_enabled():
+    return tracemalloc.is_tracing()
+
+
+def enable():
+    global _sampler, _generation
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(FRAMES)
+        _generation += 1
+    with _lock:
+        if _sampler is None or not _sampler.is_alive():
+            _sampler_stop.clear()
+            _sampler = threading.Thread(target=_sample_rss, name="rss-sampler", daemon=True)
+            _sampler.start()
+
+
+def disable():
+    _sampler_stop.set()
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def _sample_rss():
+    while not _sampler_stop.is_set():
+        rss = current_rss()
+        if rss is not None:
+            with _lock:
+                _rss.append((time.time(), rss))
+        _sampler_stop.wait(RSS_INTERVAL)
+
+
+def _top_sites(before, after):
+    filters = [
+        tracemalloc.Filter(False, __file__),
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),   # first-use imports
+    ]
+    diff = after.filter_traces(filters).compare_to(before.filter_traces(filters), "lineno")
+    sites = []
+    for stat in diff[:TOP_SITES]:
+        frame = stat.traceback[0]
+        sites.append({
+            "site": f"{os.path.basename(frame.filename)}:{frame.lineno}",
+            "size_diff": stat.size_diff,
+            "count_diff": stat.count_diff,
+        })
+    return sites
+
+
+def profiled(name):
+    """Decorator: record a memory report for each call while profiling is on"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            global _in_flight
+            if not tracemalloc.is_tracing():
+                return fn(*args, **kwargs)
+            with _lock:
+                _in_flight += 1
+                overlapping = _in_flight
+            generation = _generation
+            before = tracemalloc.take_snapshot()
+            start_current, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with _lock:
+                    _in_flight -= 1
+                # Skip the report if profiling was switched off (or restarted)
+                # during the call: the counters no longer cover the whole call
+                if tracemalloc.is_tracing() and _generation == generation:
+                    current, peak = tracemalloc.get_traced_memory()
+                    report = {
+                        "name": name,
+                        "ts": time.time(),
+                        "peak_bytes": peak - start_current,
+                        "retained_bytes": current - start_current,
+                        "rss_bytes": current_rss(),
+                        "overlapping_calls": overlapping,
+                    }
+                    report["over_budget"] = bool(BUDGET_BYTES) and report["peak_bytes"] > BUDGET_BYTES
+                    report["top_sites"] = _top_sites(before, tracemalloc.take_snapshot())
+                    with _lock:
+                        _reports.append(report)
+        return wrapper
+    return decorator
+
+
+def record(name, peak_bytes, rss_bytes=None, overlapping_calls=1):
+    """Add a report measured outside tracemalloc (e.g. in a worker process)"""
+    report = {
+        "name": name,
+        "ts": time.time(),
+        "peak_bytes": peak_bytes,
+        "retained_bytes": None,
+        "rss_bytes": rss_bytes,
+        "overlapping_calls": overlapping_calls,
+    }
+    report["over_budget"] = bool(BUDGET_BYTES) and (peak_bytes or 0) > BUDGET_BYTES
+    with _lock:
+        _reports.append(report)
+
+
+def reports():
+    """Most recent memory reports, newest first"""
+    with _lock:
+        return list(reversed(_reports))
+
+
+def reset():
+    with _lock:
+        _reports.clear()
+        _rss.clear()
+
+
+def rss_history():
+    """[(timestamp, rss bytes), ...] oldest first"""
+    with _lock:
+        return list(_rss)
+
+
+if os.environ.get("MEMORY_LOCKER_MEMPROFILE"):
+    enable()
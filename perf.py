@@ -0,0 +1,87 @@
+import functools
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Lightweight, process-wide timing spans for diagnosing slow reruns.
+# Each span name keeps a rolling window of its last WINDOW durations, from
+# which the admin Performance tab shows p50/p95. Set MEMORY_LOCKER_PERF_LOG
+# to a file path to also append every span as a JSON line.
+WINDOW = 500
+LOG_PATH = os.environ.get("MEMORY_LOCKER_PERF_LOG")
+
+_samples = {}    # name -> deque of seconds
+_counts = {}     # name -> total spans recorded since reset
+_lock = threading.Lock()
+_log_lock = threading.Lock()
+
+
+def record(name, seconds):
+    with _lock:
+        window = _samples.get(name)
+        if window is None:
+            window = _samples[name] = deque(maxlen=WINDOW)
+        window.append(seconds)
+        _counts[name] = _counts.get(name, 0) + 1
+    if LOG_PATH:
+        line = json.dumps({"ts": round(time.time(), 3), "span": name, "ms": round(seconds * 1000, 3)})
+        with _log_lock, open(LOG_PATH, 'a', encoding='utf-8') as f:
+            f.write(line + "\n")
+
+
+@contextmanager
+def span(name):
+    """Time the enclosed block under `name`"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+def timed(name=None):
+    """Decorator form of span(); defaults to the function's name"""
+    def decorator(fn):
+        span_name = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _percentile(ordered, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def stats():
+    """Return [{name, count, p50_ms, p95_ms, max_ms, last_ms}] sorted by p95"""
+    with _lock:
+        snapshot = {name: list(window) for name, window in _samples.items()}
+        counts = dict(_counts)
+    rows = []
+    for name, samples in snapshot.items():
+        ordered = sorted(samples)
+        rows.append({
+            "name": name,
+            "count": counts[name],
+            "p50_ms": round(_percentile(ordered, 0.50) * 1000, 2),
+            "p95_ms": round(_percentile(ordered, 0.95) * 1000, 2),
+            "max_ms": round(ordered[-1] * 1000, 2),
+            "last_ms": round(samples[-1] * 1000, 2),
+        })
+    rows.sort(key=lambda row: row["p95_ms"], reverse=True)
+    return rows
+
+
+def reset():
+    with _lock:
+        _samples.clear()
+        _counts.clear()
@@ -0,0 +1,162 @@
+import os
+
+import json_store
+import sqlite_store
+from perf import span
+
+# Backend-neutral access to the memory collections ("photos.json",
+# "videos.json", "letters.json"). The backend is chosen once per process with
+# the MEMORY_LOCKER_BACKEND environment variable:
+#   json    data/<name> snapshots + journals (default, see json_store.py)
+#   sqlite  data/memories.db with date/id indexes (see sqlite_store.py)
+# Import existing JSON data with `python manage.py import-sqlite`.
+#
+# Ids are allocated by the backend on add: each collection hands out the
+# next id after the highest it has ever allocated, so ids stay unique and
+# stable across deletes, and deletes/updates address records by id.
+BACKENDS = {
+    "json": json_store,
+    "sqlite": sqlite_store,
+}
+BACKEND_NAME = os.environ.get("MEMORY_LOCKER_BACKEND", "json").lower()
+if BACKEND_NAME not in BACKENDS:
+    raise ValueError(f"Unknown MEMORY_LOCKER_BACKEND {BACKEND_NAME!r}; choose from {sorted(BACKENDS)}")
+backend = BACKENDS[BACKEND_NAME]
+
+# Callbacks run after every write made through this module, as
+# callback(filename, op, records) with op "add", "delete" or "replace";
+# in-place updates are reported as a "delete" of the old records followed by
+# an "add" of the new ones. Derived in-memory indexes use them to stay
+# current without rescanning.
+_write_listeners = []
+
+
+def on_write(callback):
+    if callback not in _write_listeners:
+        _write_listeners.append(callback)
+    return callback
+
+
+def _notify(filename, op, records):
+    for callback in _write_listeners:
+        callback(filename, op, records)
+
+
+def load_collection(filename):
+    """Return all records; the list is the caller's, the record dicts are shared"""
+    with span(f"load:{filename}"):
+        return backend.load_collection(filename)
+
+
+def query_collection(filename, order_by="date", descending=True, limit=None, offset=0):
+    """Return records ordered by `order_by` ("date" or "id"), optionally paged"""
+    with span(f"query:{filename}"):
+        return backend.query_collection(filename, order_by, descending, limit, offset)
+
+
+def count_collection(filename):
+    return backend.count_collection(filename)
+
+
+def get_record(filename, record_id):
+    """Return the record with this id, or None"""
+    with span(f"get:{filename}"):
+        return backend.get_record(filename, record_id)
+
+
+def collection_signature(filename):
+    """Opaque value that changes whenever the collection is written, by this
+    or any other process (derived indexes compare it to spot outside writes)"""
+    return backend.collection_signature(filename)
+
+
+def collection_exists(filename):
+    """True once a collection has been created, even if it is now empty"""
+    return backend.collection_exists(filename)
+
+
+def save_collection(filename, data):
+    """Replace a whole collection"""
+    records = list(data)
+    with span(f"save:{filename}"):
+        backend.save_collection(filename, records)
+    _notify(filename, "replace", records)
+
+
+def add_record(filename, record):
+    """Append one record under a fresh id; returns it as stored"""
+    return add_records(filename, [record])[0]
+
+
+def add_records(filename, records):
+    """Append records under fresh ids in a single write; returns them as stored"""
+    with span(f"add:{filename}"):
+        stored = backend.add_records(filename, list(records))
+    _notify(filename, "add", stored)
+    return stored
+
+
+def delete_record(filename, record_id):
+    """Remove the record with this id; returns it, or None if it was gone"""
+    removed = delete_records(filename, [record_id])
+    return removed[0] if removed else None
+
+
+def delete_records(filename, record_ids):
+    """Remove records by id in a single write; returns those removed"""
+    with span(f"delete:{filename}"):
+        removed = backend.delete_records(filename, record_ids)
+    _notify(filename, "delete", removed)
+    return removed
+
+
+def update_records(filename, records):
+    """Replace the stored records that share these records' ids, in a single write.
+
+    Returns [(old record, new record)]; records whose id is gone are skipped.
+    """
+    with span(f"update:{filename}"):
+        changes = backend.update_records(filename, records)
+    _notify(filename, "delete", [old for old, new in changes])
+    _notify(filename, "add", [new for old, new in changes])
+    return changes
+
+
+def last_id(filename):
+    """Highest id the collection has ever allocated"""
+    return backend.last_id(filename)
+
+
+def assign_missing_ids(filename):
+    """Give fresh ids to records that have none or share one with an earlier
+    record (data written before ids were allocated). Returns how many changed.
+    """
+    records = load_collection(filename)
+    next_id = last_id(filename) + 1
+    seen = set()
+    changed = 0
+    for i, record in enumerate(records):
+        record_id = record.get("id")
+        if isinstance(record_id, int) and not isinstance(record_id, bool) and record_id not in seen:
+            seen.add(record_id)
+            continue
+        records[i] = dict(record, id=next_id)
+        next_id += 1
+        changed += 1
+    if changed:
+        save_collection(filename, records)
+    return changed
+
+
+def compact(filename):
+    return backend.compact(filename)
+
+
+def invalidate(filename=None):
+    backend.invalidate(filename)
+
+
+def cache_stats():
+    stats = backend.cache_stats()
+    stats["backend"] = BACKEND_NAME
+    return stats
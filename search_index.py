@@ -0,0 +1,229 @@
+import html
+import math
+import os
+import re
+import unicodedata
+from bisect import bisect_left
+
+from derived_index import DerivedIndex
+
+# Process-wide inverted index over letter titles/contents and photo/video
+# captions, ranked with BM25, so a search only touches the postings of the
+# query terms. Loading, saving to INDEX_PATH and keeping it current are
+# handled by derived_index.DerivedIndex; `python manage.py reindex` rebuilds
+# it from scratch.
+INDEX_PATH = os.path.join("data", "search_index.json")
+INDEX_VERSION = 2
+# type -> (collection, {field: weight})
+SOURCES = {
+    "photo": ("photos.json", {"caption": 1}),
+    "video": ("videos.json", {"caption": 1}),
+    "letter": ("letters.json", {"title": 2, "content": 1}),
+}
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_postings = {}   # term -> {doc key: weighted term frequency}
+_docs = {}       # doc key -> [type, id, length, record count]
+_derived = {}    # sorted vocabulary and average doc length, dropped on writes
+
+
+def tokenize(text):
+    """Lowercase words without accents; single characters are dropped"""
+    text = unicodedata.normalize("NFKD", str(text or "").casefold())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return [token for token in re.findall(r"\w+", text) if len(token) > 1]
+
+
+def _doc_key(memory_type, record_id):
+    return f"{memory_type}:{record_id}"
+
+
+def _term_frequencies(memory_type, record):
+    frequencies = {}
+    for field, weight in SOURCES[memory_type][1].items():
+        for token in tokenize(record.get(field)):
+            frequencies[token] = frequencies.get(token, 0) + weight
+    return frequencies
+
+
+def _add_record(memory_type, record):
+    key = _doc_key(memory_type, record.get('id'))
+    frequencies = _term_frequencies(memory_type, record)
+    doc = _docs.setdefault(key, [memory_type, record.get('id'), 0, 0])
+    doc[2] += sum(frequencies.values())
+    doc[3] += 1
+    for term, frequency in frequencies.items():
+        postings = _postings.setdefault(term, {})
+        postings[key] = postings.get(key, 0) + frequency
+
+
+def _remove_record(memory_type, record):
+    """Subtract one record's terms; records sharing an id keep theirs"""
+    key = _doc_key(memory_type, record.get('id'))
+    doc = _docs.get(key)
+    if doc is None:
+        return
+    frequencies = _term_frequencies(memory_type, record)
+    for term, frequency in frequencies.items():
+        postings = _postings.get(term)
+        if postings is None or key not in postings:
+            continue
+        postings[key] -= frequency
+        if postings[key] <= 0:
+            del postings[key]
+        if not postings:
+            del _postings[term]
+    doc[2] -= sum(frequencies.values())
+    doc[3] -= 1
+    if doc[3] <= 0:
+        del _docs[key]
+
+
+def _drop_type(memory_type):
+    for key in [key for key, doc in _docs.items() if doc[0] == memory_type]:
+        del _docs[key]
+    for term in list(_postings):
+        postings = _postings[term]
+        for key in [key for key in postings if key.startswith(memory_type + ":")]:
+            del postings[key]
+        if not postings:
+            del _postings[term]
+
+
+def _type_for(filename):
+    for memory_type, (name, _) in SOURCES.items():
+        if name == filename:
+            return memory_type
+    return None
+
+
+# Callbacks for DerivedIndex
+def _clear(filename):
+    if filename is None:
+        _postings.clear()
+        _docs.clear()
+    else:
+        _drop_type(_type_for(filename))
+    _derived.clear()
+
+
+def _add(filename, records):
+    memory_type = _type_for(filename)
+    for record in records:
+        _add_record(memory_type, record)
+    _derived.clear()
+
+
+def _remove(filename, records):
+    memory_type = _type_for(filename)
+    for record in records:
+        _remove_record(memory_type, record)
+    _derived.clear()
+
+
+def _dump():
+    return {"docs": _docs, "postings": _postings}
+
+
+def _load(state):
+    _postings.update(state["postings"])
+    _docs.update(state["docs"])
+    _derived.clear()
+
+
+_index = DerivedIndex([filename for filename, _ in SOURCES.values()], _clear, _add, _remove,
+                      path=INDEX_PATH, version=INDEX_VERSION, dump=_dump, load=_load)
+
+
+def rebuild():
+    """Re-index every collection from scratch and save the index"""
+    _index.rebuild()
+    return len(_docs)
+
+
+def _expand(token, is_prefix):
+    """Index terms matching a query token (prefix match for the last one)"""
+    if not is_prefix:
+        return [token] if token in _postings else []
+    if "vocab" not in _derived:
+        _derived["vocab"] = sorted(_postings)
+    vocab = _derived["vocab"]
+    terms = []
+    for position in range(bisect_left(vocab, token), len(vocab)):
+        if not vocab[position].startswith(token):
+            break
+        terms.append(vocab[position])
+    return terms
+
+
+def search(query, limit=20):
+    """Rank memories matching every word of `query`.
+
+    The last word also matches as a prefix, for search-as-you-type. Returns
+    [(score, type, id)] best first.
+    """
+    tokens = tokenize(query)
+    if not tokens:
+        return []
+    _index.ensure_current()
+    with _index.lock:
+        total_docs = len(_docs) or 1
+        if "average_length" not in _derived:
+            _derived["average_length"] = sum(doc[2] for doc in _docs.values()) / total_docs or 1
+        average_length = _derived["average_length"]
+        # per query word: {doc key: best BM25 contribution among its terms}
+        per_token = []
+        for token in dict.fromkeys(tokens):
+            contributions = {}
+            for term in _expand(token, token == tokens[-1]):
+                postings = _postings[term]
+                idf = math.log(1 + (total_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                for key, frequency in postings.items():
+                    length = _docs[key][2]
+                    score = idf * frequency * (BM25_K1 + 1) / (
+                        frequency + BM25_K1 * (1 - BM25_B + BM25_B * length / average_length))
+                    if score > contributions.get(key, 0):
+                        contributions[key] = score
+            if not contributions:
+                return []
+            per_token.append(contributions)
+        per_token.sort(key=len)
+        candidates = set(per_token[0])
+        for contributions in per_token[1:]:
+            candidates.intersection_update(contributions)
+        ranked = sorted(
+            ((sum(contributions[key] for contributions in per_token), key) for key in candidates),
+            reverse=True,
+        )[:limit]
+        return [(round(score, 3), _docs[key][0], _docs[key][1]) for score, key in ranked]
+
+
+def highlight(text, query, width=200):
+    """HTML-escaped excerpt of `text` around the first match, with <mark>s"""
+    text = str(text or "")
+    words = tokenize(query)
+    matches = []
+    for match in re.finditer(r"\w+", text):
+        tokens = tokenize(match.group())
+        if tokens and any(tokens[0].startswith(word) for word in words):
+            matches.append(match)
+    start = max(0, matches[0].start() - width // 3) if matches else 0
+    if start:
+        space = text.find(" ", start, matches[0].start())
+        start = space + 1 if space != -1 else start
+    end = min(len(text), start + width)
+    pieces, cursor = [], start
+    for match in matches:
+        if match.start() < start or match.end() > end:
+            continue
+        pieces.append(html.escape(text[cursor:match.start()]))
+        pieces.append(f"<mark>{html.escape(match.group())}</mark>")
+        cursor = match.end()
+    pieces.append(html.escape(text[cursor:end]))
+    return ("…" if start else "") + "".join(pieces) + ("…" if end < len(text) else "")
+
+
+def reset():
+    """Forget the in-memory index; it is reloaded on next use"""
+    _index.reset()
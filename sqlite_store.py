@@ -0,0 +1,279 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+
+import json_store
+
+# SQLite storage backend (see repository.py for the backend-neutral API).
+# Every collection ("photos.json", "videos.json", ...) is a table with the
+# full record as canonical JSON plus indexed `id` and `date` columns, so the
+# viewer tabs can run an ordered query with LIMIT instead of loading and
+# sorting the whole collection. Photo bytes stay in the blob store; records
+# only carry their blob references. The id_sequences table remembers the
+# highest id handed out per collection, so ids are never reused after deletes,
+# and a write counter per collection that derived indexes use to notice
+# writes made by other processes.
+DB_PATH = os.path.join("data", "memories.db")
+
+_local = threading.local()
+_known_tables = set()
+_lock = threading.Lock()
+_stats = {"queries": 0, "writes": 0}
+
+
+def _connection():
+    """One connection per thread; WAL lets readers run alongside a writer"""
+    conn = getattr(_local, "conn", None)
+    if conn is None or getattr(_local, "path", None) != DB_PATH:
+        os.makedirs(os.path.dirname(DB_PATH) or ".", exist_ok=True)
+        conn = sqlite3.connect(DB_PATH, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        _local.conn = conn
+        _local.path = DB_PATH
+    return conn
+
+
+def _table_name(filename):
+    return re.sub(r'\W', '_', filename.rsplit('.', 1)[0])
+
+
+def _table(filename):
+    """Map "photos.json" to a safe table name and make sure it exists"""
+    name = _table_name(filename)
+    key = (DB_PATH, name)
+    if key not in _known_tables:
+        conn = _connection()
+        with conn:
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {name} ("
+                "rowid INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "id INTEGER, date TEXT, record TEXT NOT NULL)"
+            )
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {name}_date ON {name} (date)")
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {name}_id ON {name} (id)")
+        with _lock:
+            _known_tables.add(key)
+    return name
+
+
+def _encode(record):
+    # sort_keys makes the JSON canonical so equal records encode identically
+    return json.dumps(record, sort_keys=True, ensure_ascii=False, default=str)
+
+
+def _row(record):
+    return (record.get("id"), record.get("date"), _encode(record))
+
+
+def _count(key):
+    with _lock:
+        _stats[key] += 1
+
+
+def load_collection(filename):
+    """Return every record in insertion order"""
+    table = _table(filename)
+    _count("queries")
+    rows = _connection().execute(f"SELECT record FROM {table} ORDER BY rowid").fetchall()
+    return [json.loads(row[0]) for row in rows]
+
+
+def query_collection(filename, order_by="date", descending=True, limit=None, offset=0):
+    """Indexed ordered query; only `id` and `date` can be ordered on"""
+    if order_by not in ("id", "date"):
+        raise ValueError(f"Cannot order {filename} by {order_by!r}")
+    table = _table(filename)
+    direction = "DESC" if descending else "ASC"
+    sql = f"SELECT record FROM {table} ORDER BY {order_by} {direction}, rowid {direction}"
+    params = ()
+    if limit is not None or offset:
+        sql += " LIMIT ? OFFSET ?"
+        params = (-1 if limit is None else limit, offset)
+    _count("queries")
+    rows = _connection().execute(sql, params).fetchall()
+    return [json.loads(row[0]) for row in rows]
+
+
+def count_collection(filename):
+    table = _table(filename)
+    _count("queries")
+    return _connection().execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+
+def _last_id(conn, table):
+    """Highest id allocated in `table`; call inside a transaction"""
+    conn.execute("CREATE TABLE IF NOT EXISTS id_sequences (name TEXT PRIMARY KEY, last_id INTEGER NOT NULL)")
+    row = conn.execute("SELECT last_id FROM id_sequences WHERE name = ?", (table,)).fetchone()
+    highest = conn.execute(f"SELECT MAX(id) FROM {table} WHERE typeof(id) = 'integer'").fetchone()[0]
+    return max(row[0] if row else 0, highest or 0)
+
+
+def _set_last_id(conn, table, value):
+    conn.execute("INSERT INTO id_sequences (name, last_id) VALUES (?, ?) "
+                 "ON CONFLICT(name) DO UPDATE SET last_id = excluded.last_id", (table, value))
+
+
+def _ensure_versions(conn):
+    conn.execute("CREATE TABLE IF NOT EXISTS collection_versions (name TEXT PRIMARY KEY, version INTEGER NOT NULL)")
+
+
+def _bump_version(conn, table):
+    """Count a write to `table`; call inside its transaction"""
+    _ensure_versions(conn)
+    conn.execute("INSERT INTO collection_versions (name, version) VALUES (?, 1) "
+                 "ON CONFLICT(name) DO UPDATE SET version = version + 1", (table,))
+
+
+def collection_signature(filename):
+    """Number of writes made to the collection, by any process"""
+    table = _table(filename)
+    conn = _connection()
+    with conn:
+        _ensure_versions(conn)
+        row = conn.execute("SELECT version FROM collection_versions WHERE name = ?", (table,)).fetchone()
+    return row[0] if row else 0
+
+
+def last_id(filename):
+    """Highest id ever allocated in the collection"""
+    table = _table(filename)
+    conn = _connection()
+    with conn:
+        return _last_id(conn, table)
+
+
+def get_record(filename, record_id):
+    """Indexed lookup of one record by id (or None)"""
+    if record_id is None:
+        return None
+    table = _table(filename)
+    _count("queries")
+    row = _connection().execute(
+        f"SELECT record FROM {table} WHERE id = ? ORDER BY rowid LIMIT 1", (record_id,)
+    ).fetchone()
+    return json.loads(row[0]) if row else None
+
+
+def collection_exists(filename):
+    # Reading a collection creates its table, so the table alone doesn't
+    # count: a written collection has an id_sequences row (every save leaves
+    # one), and databases from before id_sequences have rows in the table
+    name = _table_name(filename)
+    conn = _connection()
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    if name not in tables:
+        return False
+    if "id_sequences" in tables and conn.execute(
+            "SELECT 1 FROM id_sequences WHERE name = ?", (name,)).fetchone():
+        return True
+    return conn.execute(f"SELECT 1 FROM {name} LIMIT 1").fetchone() is not None
+
+
+def _rows_by_id(conn, table, record_ids):
+    """{id: (rowid, record)} for the first row holding each id"""
+    found = {}
+    for record_id in dict.fromkeys(record_ids):
+        row = conn.execute(
+            f"SELECT rowid, record FROM {table} WHERE id = ? ORDER BY rowid LIMIT 1", (record_id,)
+        ).fetchone()
+        if row:
+            found[record_id] = (row[0], json.loads(row[1]))
+    return found
+
+
+def add_records(filename, records):
+    """Insert records under fresh ids in one transaction; returns them as stored"""
+    table = _table(filename)
+    conn = _connection()
+    with conn:
+        # IMMEDIATE takes the write lock up front so two processes can't
+        # read the same sequence value
+        conn.execute("BEGIN IMMEDIATE")
+        next_id = _last_id(conn, table) + 1
+        stored = [dict(record, id=next_id + i) for i, record in enumerate(records)]
+        conn.executemany(f"INSERT INTO {table} (id, date, record) VALUES (?, ?, ?)",
+                         [_row(record) for record in stored])
+        if stored:
+            _set_last_id(conn, table, stored[-1]["id"])
+            _bump_version(conn, table)
+    _count("writes")
+    return stored
+
+
+def delete_records(filename, record_ids):
+    """Remove records by id in one transaction; returns those removed"""
+    table = _table(filename)
+    conn = _connection()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        found = _rows_by_id(conn, table, record_ids)
+        conn.executemany(f"DELETE FROM {table} WHERE rowid = ?",
+                         [(rowid,) for rowid, _ in found.values()])
+        if found:
+            _bump_version(conn, table)
+    _count("writes")
+    return [record for _, record in found.values()]
+
+
+def update_records(filename, records):
+    """Replace records with the same ids in one transaction.
+
+    Returns [(old record, new record)] for the ones that still existed.
+    """
+    table = _table(filename)
+    conn = _connection()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        found = _rows_by_id(conn, table, [record.get("id") for record in records])
+        changes = [(found[record["id"]], record) for record in records if record.get("id") in found]
+        conn.executemany(f"UPDATE {table} SET id = ?, date = ?, record = ? WHERE rowid = ?",
+                         [_row(new) + (rowid,) for (rowid, _), new in changes])
+        if changes:
+            _bump_version(conn, table)
+    _count("writes")
+    return [(old, new) for (_, old), new in changes]
+
+
+def save_collection(filename, data):
+    """Replace a whole collection in one transaction"""
+    table = _table(filename)
+    conn = _connection()
+    data = list(data)
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        previous = _last_id(conn, table)
+        conn.execute(f"DELETE FROM {table}")
+        conn.executemany(f"INSERT INTO {table} (id, date, record) VALUES (?, ?, ?)",
+                         [_row(record) for record in data])
+        _set_last_id(conn, table, max(previous, _last_id(conn, table)))
+        _bump_version(conn, table)
+    _count("writes")
+
+
+def compact(filename):
+    """SQLite maintains its own storage; checkpoint the WAL"""
+    _table(filename)
+    _connection().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    return True
+
+
+def invalidate(filename=None):
+    pass  # nothing cached outside SQLite's own page cache
+
+
+def cache_stats():
+    with _lock:
+        return dict(_stats)
+
+
+def import_json_collections(filenames):
+    """Copy data/*.json collections (snapshot + journal) into the database"""
+    imported = {}
+    for filename in filenames:
+        records = json_store.load_collection(filename)
+        save_collection(filename, records)
+        imported[filename] = len(records)
+    return imported
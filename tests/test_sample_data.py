@@ -0,0 +1,30 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs the startup phases in their real order (migrations first) on a fresh
+# locker, in a subprocess because the storage backend is picked at import
+STARTUP = """
+import app
+from repository import load_collection
+app.init_directories()
+app.migrate_legacy_photos()
+app.migrate_record_ids()
+app.create_sample_data()
+app.create_sample_data()
+print(len(load_collection("letters.json")), len(load_collection("photos.json")))
+"""
+
+
+@pytest.mark.parametrize("backend", ["json", "sqlite"])
+def test_fresh_locker_gets_sample_letters(tmp_path, backend):
+    env = dict(os.environ, MEMORY_LOCKER_BACKEND=backend, MEMORY_LOCKER_MEDIA_BACKEND="local",
+               PYTHONPATH=REPO)
+    result = subprocess.run([sys.executable, "-c", STARTUP], cwd=tmp_path, env=env,
+                            capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.split()[-2:] == ["2", "0"]
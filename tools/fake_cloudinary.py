@@ -0,0 +1,147 @@
+"""Local stand-in for Cloudinary's upload endpoint, for offline testing.
+
+Accepts single and chunked (Content-Range + X-Unique-Upload-Id) uploads at
+/v1_1/<cloud>/<resource_type>/upload and serves the assembled files back.
+
+Usage:
+    python tools/fake_cloudinary.py --port 8765 [--fail-every 3] [--delay 0.2]
+
+then add CLOUDINARY_UPLOAD_PREFIX = "http://127.0.0.1:8765" to
+.streamlit/secrets.toml.
+"""
+import argparse
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_uploads = {}   # upload id -> {"public_id", "chunks": {start: bytes}}
+_files = {}     # public id -> bytes
+_lock = threading.Lock()
+_requests = 0
+
+
+def _parse_multipart(content_type, body):
+    """Return {field name: bytes} from a multipart/form-data body"""
+    message = BytesParser(policy=HTTP).parsebytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode() + body
+    )
+    fields = {}
+    for part in message.iter_parts():
+        name = part.get_param("name", header="content-disposition")
+        fields[name] = part.get_payload(decode=True) or b""
+    return fields
+
+
+class Handler(BaseHTTPRequestHandler):
+    fail_every = 0
+    delay = 0.0
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        global _requests
+        match = re.match(r"^/v1_1/([^/]+)/([^/]+)/upload$", self.path)
+        if not match:
+            self._send_json(404, {"error": {"message": "Not found"}})
+            return
+        resource_type = match.group(2)
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with _lock:
+            _requests += 1
+            should_fail = self.fail_every and _requests % self.fail_every == 0
+        if self.delay:
+            time.sleep(self.delay)
+        if should_fail:
+            self._send_json(500, {"error": {"message": "Injected failure"}})
+            return
+
+        fields = _parse_multipart(self.headers["Content-Type"], body)
+        data = fields.get("file", b"")
+        folder = fields.get("folder", b"").decode()
+        content_range = self.headers.get("Content-Range")
+        upload_id = self.headers.get("X-Unique-Upload-Id")
+
+        if content_range and upload_id:
+            start, end, total = map(int, re.match(r"bytes (\d+)-(\d+)/(\d+)", content_range).groups())
+            with _lock:
+                upload = _uploads.setdefault(upload_id, {
+                    "public_id": fields.get("public_id", b"").decode()
+                    or "/".join(filter(None, [folder, uuid.uuid4().hex[:20]])),
+                    "chunks": {},
+                })
+                upload["chunks"][start] = data
+                received = sum(len(chunk) for chunk in upload["chunks"].values())
+            if received < total:
+                self._send_json(200, {"public_id": upload["public_id"], "done": False})
+                return
+            with _lock:
+                data = b"".join(upload["chunks"][key] for key in sorted(upload["chunks"]))
+                del _uploads[upload_id]
+            public_id = upload["public_id"]
+        else:
+            public_id = "/".join(filter(None, [folder, uuid.uuid4().hex[:20]]))
+
+        with _lock:
+            _files[public_id] = data
+        host = f"http://{self.headers.get('Host', 'localhost')}"
+        self._send_json(200, {
+            "public_id": public_id,
+            "resource_type": resource_type,
+            "bytes": len(data),
+            "format": "mp4",
+            "duration": 0.0,
+            "secure_url": f"{host}/files/{public_id}.mp4",
+            "url": f"{host}/files/{public_id}.mp4",
+        })
+
+    def do_GET(self):
+        public_id = self.path[len("/files/"):].rsplit(".", 1)[0] if self.path.startswith("/files/") else None
+        with _lock:
+            data = _files.get(public_id)
+        if data is None:
+            self._send_json(404, {"error": {"message": "Not found"}})
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "video/mp4")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if os.environ.get("FAKE_CLOUDINARY_VERBOSE"):
+            super().log_message(format, *args)
+
+
+def serve(port=8765, fail_every=0, delay=0.0):
+    """Start the server in a daemon thread; returns the server object"""
+    Handler.fail_every = fail_every
+    Handler.delay = delay
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--fail-every", type=int, default=0, help="fail every Nth request")
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds to wait per request")
+    args = parser.parse_args()
+    server = serve(args.port, args.fail_every, args.delay)
+    print(f"Fake Cloudinary listening on http://127.0.0.1:{args.port}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
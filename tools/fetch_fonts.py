@@ -0,0 +1,67 @@
+"""Download the theme's web fonts into static/fonts/ for self-hosting.
+
+Usage:
+    python tools/fetch_fonts.py [--force]
+
+Fetches the latin subset of Dancing Script (variable, 400-700) and Poppins
+300/400/600 as woff2 from Google Fonts, under the file names that
+static/theme.css expects. Both families are licensed under the SIL Open
+Font License 1.1 (see the OFL-*.txt files next to them). The fonts are
+committed, so this is only needed to refresh them (use --force).
+"""
+import argparse
+import os
+import re
+import sys
+import urllib.request
+
+FONTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "static", "fonts")
+CSS_API = "https://fonts.googleapis.com/css2?family={family}:wght@{weight}&display=swap"
+# Google Fonts only serves woff2 to browsers it recognises
+USER_AGENT = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+              "(KHTML, like Gecko) Chrome/120.0 Safari/537.36")
+FONTS = {
+    "dancing-script-latin.woff2": ("Dancing+Script", "400"),
+    "poppins-300-latin.woff2": ("Poppins", "300"),
+    "poppins-400-latin.woff2": ("Poppins", "400"),
+    "poppins-600-latin.woff2": ("Poppins", "600"),
+}
+
+
+def _get(url):
+    request = urllib.request.Request(url, headers={"User-Agent": USER_AGENT})
+    with urllib.request.urlopen(request, timeout=30) as response:
+        return response.read()
+
+
+def latin_url(css):
+    """URL of the `/* latin */` subset in a css2 API response"""
+    match = re.search(r"/\* latin \*/\s*@font-face\s*{[^}]*?url\((?P<url>[^)]+)\)", css)
+    if not match:
+        raise ValueError("no latin subset in the font CSS")
+    return match.group("url").strip("'\"")
+
+
+def fetch(force=False):
+    os.makedirs(FONTS_DIR, exist_ok=True)
+    for filename, (family, weight) in FONTS.items():
+        path = os.path.join(FONTS_DIR, filename)
+        if os.path.exists(path) and not force:
+            print(f"{filename}: already present")
+            continue
+        css = _get(CSS_API.format(family=family, weight=weight)).decode()
+        data = _get(latin_url(css))
+        with open(path + ".tmp", "wb") as f:
+            f.write(data)
+        os.replace(path + ".tmp", path)
+        print(f"{filename}: {len(data) // 1024} KB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--force", action="store_true", help="download again even if present")
+    args = parser.parse_args()
+    try:
+        fetch(args.force)
+    except (OSError, ValueError) as e:
+        sys.exit(f"Could not fetch fonts: {e}")
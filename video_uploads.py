@@ -0,0 +1,130 @@
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from media_store import backend as media
+from repository import add_record
+
+# Background, chunked (resumable) video uploads to the media backend (see
+# media_store.py). The admin session spools the upload to disk and returns
+# immediately; a worker thread sends it in CHUNK_SIZE parts, retrying failed
+# chunks. A failed job keeps its upload id and byte offset, so
+# resume_upload() carries on where it stopped instead of starting from zero.
+# Job state lives in this module, so any rerun (or session) can poll it for
+# progress.
+#
+# Finished uploads also record the backend's media id, duration, frame size
+# and a poster-frame URL where the backend has one, so the viewer's grid can
+# show a small image per video and only create a player for the one being
+# watched.
+SPOOL_DIR = os.path.join("data", "uploads")
+CHUNK_SIZE = 6 * 1024 * 1024  # Cloudinary requires chunks of at least 5MB
+CHUNK_RETRIES = 3
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="video-upload")
+_jobs = {}
+_lock = threading.Lock()
+
+
+def start_upload(video_file, record):
+    """Spool an uploaded file and queue it; returns the job id.
+
+    `record` is the videos.json entry to write once the upload finishes;
+    its "url" is filled in by the media backend.
+    """
+    os.makedirs(SPOOL_DIR, exist_ok=True)
+    job_id = uuid.uuid4().hex
+    spool_path = os.path.join(SPOOL_DIR, job_id)
+    with open(spool_path, 'wb') as f:
+        f.write(video_file.getbuffer())
+    job = {
+        "id": job_id,
+        "name": video_file.name,
+        "path": spool_path,
+        "total": os.path.getsize(spool_path),
+        "sent": 0,
+        "upload_id": media.new_upload_id(),
+        "public_id": None,
+        "status": "queued",
+        "error": None,
+        "record": dict(record),
+        "started": time.time(),
+    }
+    with _lock:
+        _jobs[job_id] = job
+    _executor.submit(_run, job_id)
+    return job_id
+
+
+def resume_upload(job_id):
+    """Re-queue a failed job from its last acknowledged chunk"""
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is None or job["status"] != "failed":
+            return False
+        job["status"] = "queued"
+        job["error"] = None
+    _executor.submit(_run, job_id)
+    return True
+
+
+def get_job(job_id):
+    """Return a snapshot of a job's state (or None)"""
+    with _lock:
+        job = _jobs.get(job_id)
+        return dict(job) if job else None
+
+
+def forget_job(job_id):
+    with _lock:
+        job = _jobs.pop(job_id, None)
+    if job and job["status"] != "done":
+        _remove_spool(job)
+
+
+def _update(job_id, **changes):
+    with _lock:
+        _jobs[job_id].update(changes)
+
+
+def _remove_spool(job):
+    try:
+        os.remove(job["path"])
+    except FileNotFoundError:
+        pass
+
+
+def _run(job_id):
+    job = get_job(job_id)
+    _update(job_id, status="uploading")
+    try:
+        if not job["total"]:
+            raise ValueError("The video file is empty")
+        response = None
+        with open(job["path"], 'rb') as f:
+            f.seek(job["sent"])
+            offset = job["sent"]
+            while offset < job["total"]:
+                chunk = f.read(CHUNK_SIZE)
+                for attempt in range(CHUNK_RETRIES):
+                    try:
+                        response = media.upload_chunk(job, chunk, offset)
+                        break
+                    except Exception:
+                        if attempt == CHUNK_RETRIES - 1:
+                            raise
+                        time.sleep(2 ** attempt)
+                offset += len(chunk)
+                job["public_id"] = response.get("public_id")
+                _update(job_id, sent=offset, public_id=job["public_id"])
+
+        record = dict(job["record"])
+        record.update(media.finish(job, response))
+        record["storage_type"] = media.NAME
+        record = add_record("videos.json", record)
+        _update(job_id, status="done", record=record)
+        _remove_spool(job)
+    except Exception as e:
+        _update(job_id, status="failed", error=str(e))